@@ -0,0 +1,314 @@
+"""Precomputed "greener alternative" recommendations.
+
+For every product, the index holds the K nearest products in the same
+category that are greener: a higher sustainabilityScore and no higher a
+carbonFootprint. Nearness is Euclidean distance over carbonFootprint,
+recyclable (as 0 or 100), ethicalScore and sustainabilityScore, so the
+suggestions are products like the one scanned, only better.
+
+Each category is a NumPy feature matrix, bucketed into a coarse grid.
+Neighbours are found for the rows of one cell at a time against windows of
+candidates from the greener cells, nearest cells first: one distance matrix
+per window, masked to greener candidates and cut down to K with
+argpartition. The search stops once every row's K-th neighbour is closer
+than the nearest cell left, so a row only ever looks at products near it.
+Lookups are a dict hit on a precomputed tuple of barcodes.
+
+Updates are incremental. When some products change, only the rows that
+pointed at one of them, and the changed rows themselves, are recomputed over
+the whole category. Every other row just merges the changed products into its
+current top K, which costs one small distance matrix against the changes.
+"""
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+CARBON, RECYCLABLE, ETHICAL, SUSTAINABILITY = range(4)
+# Distance blocks hold about BLOCK_ELEMENTS distances: QUERY_BLOCK rows by
+# CANDIDATE_BLOCK candidates to start with, more rows when there are few
+# candidates and more candidates when few rows are still looking
+QUERY_BLOCK = 256
+CANDIDATE_BLOCK = 512
+BLOCK_ELEMENTS = QUERY_BLOCK * CANDIDATE_BLOCK
+# Scores and footprints are on a 0-100 scale
+SCORE_MAX = 100
+# Grid resolution: about CELL_SIZE products per cell, at most MAX_BINS cells
+# along each score axis
+CELL_SIZE = 128
+MAX_BINS = 16
+
+
+def features(product: dict) -> Tuple[float, float, float, float]:
+    return (
+        float(product.get("carbonFootprint", 0)),
+        float(SCORE_MAX) if product.get("recyclable") else 0.0,
+        float(product.get("ethicalScore", 0)),
+        float(product.get("sustainabilityScore", 0)),
+    )
+
+
+class CategoryAlternatives:
+    """Feature rows and top-K neighbours for the products of one category.
+
+    Rows are never reused: a removed product's row stays as a dead entry
+    until the index is rebuilt.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.barcodes: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.features = np.empty((0, 4), dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+        self.top = np.empty((0, k), dtype=np.int64)  # -1 pads short lists
+        self.distance = np.empty((0, k), dtype=np.float32)
+
+    def upsert(self, products: List[dict]) -> List[int]:
+        """Store new feature rows; returns the rows that actually changed."""
+        changed = []
+        appended = []
+        for product in products:
+            values = features(product)
+            row = self.rows.get(product["barcode"])
+            if row is None:
+                self.rows[product["barcode"]] = len(self.barcodes) + len(appended)
+                appended.append(values)
+            elif tuple(self.features[row]) != values:
+                self.features[row] = values
+                changed.append(row)
+        if appended:
+            start = len(self.barcodes)
+            self.barcodes.extend(product["barcode"] for product in products if self.rows[product["barcode"]] >= start)
+            count = len(appended)
+            self.features = np.concatenate([self.features, np.asarray(appended, dtype=np.float32)])
+            self.alive = np.concatenate([self.alive, np.ones(count, dtype=bool)])
+            self.top = np.concatenate([self.top, np.full((count, self.k), -1, dtype=np.int64)])
+            self.distance = np.concatenate([self.distance, np.full((count, self.k), np.inf, dtype=np.float32)])
+            changed.extend(range(start, start + count))
+        return changed
+
+    def remove(self, barcodes: Iterable[str]) -> List[int]:
+        removed = []
+        for barcode in barcodes:
+            row = self.rows.pop(barcode, None)
+            if row is not None:
+                self.alive[row] = False
+                self.top[row] = -1
+                self.distance[row] = np.inf
+                removed.append(row)
+        return removed
+
+    def refresh(self, changed: List[int]) -> np.ndarray:
+        """Bring the neighbour lists up to date after `changed` rows moved;
+        returns the rows whose list may be different."""
+        if not changed:
+            return np.empty(0, dtype=np.int64)
+        changed = np.unique(np.asarray(changed, dtype=np.int64))
+        # Rows that listed a changed product may have lost it, so they (and
+        # the changed rows) are recomputed against the whole category
+        stale = np.isin(self.top, changed).any(axis=1)
+        stale[changed] = True
+        stale &= self.alive
+        rows = np.flatnonzero(stale)
+        self.top[rows], self.distance[rows] = self.nearest(rows, np.flatnonzero(self.alive))
+        # Everyone else can only gain changed products: rows that one of them
+        # is greener than, where it beats their current K-th neighbour
+        live = changed[self.alive[changed]]
+        if len(live):
+            scores, carbon = self.features[:, SUSTAINABILITY], self.features[:, CARBON]
+            others = np.flatnonzero(self.alive & ~stale
+                                    & (scores < scores[live].max()) & (carbon >= carbon[live].min()))
+            ids, distance = self.nearest(others, live)
+            closer = distance[:, 0] < self.distance[others].max(axis=1)
+            others, ids, distance = others[closer], ids[closer], distance[closer]
+            ids = np.concatenate([self.top[others], ids], axis=1)
+            distance = np.concatenate([self.distance[others], distance], axis=1)
+            order = np.argsort(distance, axis=1, kind="stable")[:, :self.k]
+            self.top[others] = np.take_along_axis(ids, order, axis=1)
+            self.distance[others] = np.take_along_axis(distance, order, axis=1)
+            rows = np.concatenate([rows, others])
+        return np.union1d(rows, changed)
+
+    def nearest(self, rows: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The K nearest greener candidates of each row, nearest first."""
+        ids = np.full((len(rows), self.k), -1, dtype=np.int64)
+        distance = np.full((len(rows), self.k), np.inf, dtype=np.float32)
+        if not len(rows) or not len(candidates):
+            return ids, distance
+        grid = Grid(self.features, min(len(rows), len(candidates)))
+        order, pool_starts, pool_sizes = grid.bucket(candidates)
+        pool = candidates[order]
+        order, row_starts, row_sizes = grid.bucket(rows)
+        step = max(QUERY_BLOCK, BLOCK_ELEMENTS // min(len(candidates), CANDIDATE_BLOCK))
+        for cell in np.flatnonzero(row_sizes).tolist():
+            cells, bounds = grid.neighbours(cell, pool_sizes)
+            members = order[row_starts[cell]:row_starts[cell] + row_sizes[cell]]
+            for start in range(0, len(members), step):
+                block = members[start:start + step]
+                ids[block], distance[block] = self._search(
+                    self.features[rows[block]], pool, pool_starts, pool_sizes, cells, bounds)
+        return ids, distance
+
+    def _search(self, query, pool, starts, sizes, cells, bounds) -> Tuple[np.ndarray, np.ndarray]:
+        query_norms = (query ** 2).sum(axis=1)
+        best_ids = np.full((len(query), self.k), -1, dtype=np.int64)
+        best = np.full((len(query), self.k), np.inf, dtype=np.float32)
+        cumulative = np.cumsum(sizes[cells])
+        position = 0
+        while position < len(cells):
+            # Rows whose K-th neighbour is closer than any remaining cell are done
+            active = np.flatnonzero(best.max(axis=1) > bounds[position])
+            if not len(active):
+                break
+            # Windows widen as rows drop out, so the few rows with almost no
+            # greener candidates don't walk the grid in small steps
+            width = max(CANDIDATE_BLOCK, BLOCK_ELEMENTS // len(active))
+            done = cumulative[position - 1] if position else 0
+            end = max(position + 1, int(np.searchsorted(cumulative, done + width)))
+            window = np.concatenate([pool[starts[cell]:starts[cell] + sizes[cell]]
+                                     for cell in cells[position:end].tolist()])
+            position = end
+            found = self.features[window]
+            rows_query = query[active]
+            # |q - c|^2 expanded, so the block is one matrix product
+            block = query_norms[active, None] + (found ** 2).sum(axis=1)[None, :] - 2 * (rows_query @ found.T)
+            greener = ((found[None, :, SUSTAINABILITY] > rows_query[:, SUSTAINABILITY, None])
+                       & (found[None, :, CARBON] <= rows_query[:, CARBON, None]))
+            block = np.where(greener, np.maximum(block, 0), np.float32(np.inf))
+            merged = np.concatenate([best[active], block], axis=1)
+            merged_ids = np.concatenate([best_ids[active], np.broadcast_to(window, block.shape)], axis=1)
+            keep = np.argpartition(merged, self.k - 1, axis=1)[:, :self.k]
+            best[active] = np.take_along_axis(merged, keep, axis=1)
+            best_ids[active] = np.take_along_axis(merged_ids, keep, axis=1)
+        order = np.argsort(best, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        best_ids[np.isinf(best)] = -1
+        return best_ids, best
+
+
+class Grid:
+    """Cells over the feature space, so a search can visit candidate cells in
+    order of their distance from a row's cell and stop early.
+
+    Cells are boxes of `width` along carbon, ethical and sustainability, and
+    recyclable splits them in two; the grid is sized so a cell holds about
+    CELL_SIZE products.
+    """
+
+    def __init__(self, features: np.ndarray, population: int):
+        bins = int(np.clip(round((population / CELL_SIZE / 2) ** (1 / 3)), 1, MAX_BINS))
+        self.features = features
+        self.width = -(-(SCORE_MAX + 1) // bins)
+        self.shape = (bins, 2, bins, bins)
+        # Greener cells: no higher carbon, same or higher sustainability
+        offsets = np.stack(np.meshgrid(
+            np.arange(1 - bins, 1), np.arange(-1, 2), np.arange(1 - bins, bins), np.arange(bins), indexing="ij"
+        ), axis=-1).reshape(-1, 4)
+        # Squared lower bound on the distance between points of two cells
+        gaps = np.maximum(np.abs(offsets) - 1, 0) * self.width
+        gaps[:, RECYCLABLE] = np.abs(offsets[:, RECYCLABLE]) * SCORE_MAX
+        bounds = (gaps.astype(np.float32) ** 2).sum(axis=1)
+        order = np.argsort(bounds, kind="stable")
+        self.offsets = offsets[order]
+        self.bounds = bounds[order]
+        self.size = int(np.prod(self.shape))
+
+    def cells(self, ids: np.ndarray) -> np.ndarray:
+        values = self.features[ids]
+        coordinates = np.clip(values // self.width, 0, self.shape[0] - 1).astype(np.int64)
+        coordinates[:, RECYCLABLE] = values[:, RECYCLABLE] > 0
+        return np.ravel_multi_index(coordinates.T, self.shape)
+
+    def bucket(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Positions in `ids` grouped by cell, with each cell's start and size."""
+        cells = self.cells(ids)
+        sizes = np.bincount(cells, minlength=self.size)
+        return np.argsort(cells, kind="stable"), np.cumsum(sizes) - sizes, sizes
+
+    def neighbours(self, cell: int, sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Occupied cells that may hold products greener than those in `cell`,
+        with their distance bounds, nearest first."""
+        targets = np.array(np.unravel_index(cell, self.shape)) + self.offsets
+        valid = ((targets >= 0) & (targets < self.shape)).all(axis=1)
+        cells = np.ravel_multi_index(targets[valid].T, self.shape)
+        occupied = sizes[cells] > 0
+        return cells[occupied], self.bounds[valid][occupied]
+
+
+class AlternativesIndex:
+    def __init__(self, k: int = 5):
+        self.k = k
+        self._categories: Dict[str, CategoryAlternatives] = {}
+        self._category_of: Dict[str, str] = {}
+        self._alternatives: Dict[str, Tuple[str, ...]] = {}
+
+    def __len__(self):
+        return len(self._category_of)
+
+    def __contains__(self, barcode: str):
+        return barcode in self._category_of
+
+    def get(self, barcode: str) -> Tuple[str, ...]:
+        """Barcodes of the greener alternatives to `barcode`, best first."""
+        return self._alternatives.get(barcode, ())
+
+    def update(self, products: Iterable[dict]):
+        """Add or replace products and refresh only what they affect."""
+        changed: Dict[str, List[int]] = {}
+        by_category: Dict[str, List[dict]] = {}
+        # The last version of a barcode wins
+        for product in {product["barcode"]: product for product in products}.values():
+            by_category.setdefault(product.get("category") or "", []).append(product)
+        for category, members in by_category.items():
+            moved = [product["barcode"] for product in members
+                     if self._category_of.get(product["barcode"], category) != category]
+            self._remove(moved, changed)
+            for product in members:
+                self._category_of[product["barcode"]] = category
+            if category:
+                # Uncategorised products have nothing to compare with
+                group = self._categories.get(category)
+                if group is None:
+                    group = self._categories[category] = CategoryAlternatives(self.k)
+                changed.setdefault(category, []).extend(group.upsert(members))
+        self._refresh(changed)
+
+    def remove(self, barcodes: Iterable[str]):
+        changed: Dict[str, List[int]] = {}
+        self._remove(barcodes, changed)
+        self._refresh(changed)
+
+    def sync(self, products: Iterable[dict]):
+        """Make the index match a full pass over the catalog, touching only
+        the products that changed or disappeared since the last pass."""
+        seen = set()
+        batch = []
+        for product in products:
+            seen.add(product["barcode"])
+            batch.append(product)
+        self.update(batch)
+        self.remove([barcode for barcode in self._category_of if barcode not in seen])
+
+    def _remove(self, barcodes: Iterable[str], changed: Dict[str, List[int]]):
+        for barcode in barcodes:
+            category = self._category_of.pop(barcode, None)
+            self._alternatives.pop(barcode, None)
+            if category:
+                changed.setdefault(category, []).extend(self._categories[category].remove([barcode]))
+
+    def _refresh(self, changed: Dict[str, List[int]]):
+        for category, rows in changed.items():
+            group = self._categories[category]
+            for row in group.refresh(rows).tolist():
+                barcode = group.barcodes[row]
+                if group.alive[row]:
+                    self._alternatives[barcode] = tuple(
+                        group.barcodes[other] for other in group.top[row].tolist() if other >= 0)
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self),
+            "categories": len(self._categories),
+            "withAlternatives": sum(1 for alternatives in self._alternatives.values() if alternatives),
+        }
@@ -0,0 +1,255 @@
+"""Scan analytics for ops and partner reports.
+
+Scans are streamed from storage a chunk at a time, joined with the product
+catalogue and aggregated with vectorized pandas/NumPy operations, so memory
+is bounded by the chunk size and the catalogue whatever the number of scans.
+The report covers scans per category, the carbon-footprint distribution and
+how users are spread over the levels. `analyze` can also write the joined
+rows as CSV or Parquet (which needs pyarrow), one chunk at a time.
+"""
+import asyncio
+import math
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scoring import LEVELS, level_indexes
+from storage import Storage
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only needed for Parquet exports
+    pyarrow = None
+
+FORMATS = ("csv", "parquet")
+SCAN_COLUMNS = ["id", "scannedAt", "userId", "productBarcode", "productName", "score", "carbonFootprint"]
+# Exported rows: the scan plus its product's category and brand
+EXPORT_COLUMNS = ["id", "scannedAt", "userId", "productBarcode", "productName", "category", "brand",
+                  "score", "carbonFootprint"]
+NUMERIC_COLUMNS = ("score", "carbonFootprint")
+# All a report reads from each scan
+REPORT_FIELDS = ("productBarcode", "score", "carbonFootprint")
+# Scans of products without a category, or no longer in the catalogue
+UNCATEGORIZED = "Uncategorized"
+# Footprints are counted exactly up to CARBON_MAX (anything higher counts as
+# CARBON_MAX) and reported in CARBON_BIN_WIDTH bins up to CARBON_HISTOGRAM_MAX
+CARBON_MAX = 1000
+CARBON_BIN_WIDTH = 10
+CARBON_HISTOGRAM_MAX = 100
+CARBON_PERCENTILES = (50, 90, 99)
+
+
+def detect_format(path: Path) -> str:
+    suffix = path.suffix.lower().lstrip(".")
+    if suffix in FORMATS:
+        return suffix
+    raise ValueError(f"Can't tell the format of {path.name}; pass one of {FORMATS}")
+
+
+class Catalog:
+    """Product columns scans are joined with, as arrays indexed by position.
+
+    The extra last position stands for barcodes no longer in the catalogue.
+    """
+
+    def __init__(self, products: List[dict]):
+        self.positions = {product["barcode"]: index for index, product in enumerate(products)}
+        self.unknown = len(products)
+        categories = [product.get("category") or UNCATEGORIZED for product in products] + [UNCATEGORIZED]
+        self.categories, self.category_codes = np.unique(np.array(categories, dtype=object), return_inverse=True)
+        self.brands = np.array([product.get("brand") or "" for product in products] + [""], dtype=object)
+        self.carbon = np.array([product.get("carbonFootprint", 0) for product in products] + [0], dtype=np.int64)
+
+
+async def load_catalog(storage: Storage) -> Catalog:
+    return Catalog([product async for product in storage.products.iterate()])
+
+
+def join(scans: List[dict], catalog: Catalog) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Catalogue positions, scores and carbon footprints of a chunk of scans."""
+    count = len(scans)
+    positions = np.fromiter((catalog.positions.get(scan["productBarcode"], catalog.unknown) for scan in scans),
+                            np.int64, count)
+    scores = np.fromiter((scan.get("score", 0) for scan in scans), np.int64, count)
+    carbon = np.fromiter((scan.get("carbonFootprint", np.nan) for scan in scans), np.float64, count)
+    # Scans stored before they carried a footprint get the product's
+    carbon = np.where(np.isnan(carbon), catalog.carbon[positions], carbon).astype(np.int64)
+    return positions, scores, carbon
+
+
+def export_frame(scans: List[dict], catalog: Catalog, positions: np.ndarray, scores: np.ndarray,
+                 carbon: np.ndarray) -> pd.DataFrame:
+    strings = {column: np.array([scan.get(column) or "" for scan in scans], dtype=object)
+               for column in SCAN_COLUMNS if column not in NUMERIC_COLUMNS}
+    return pd.DataFrame({
+        **strings,
+        "category": catalog.categories[catalog.category_codes[positions]],
+        "brand": catalog.brands[positions],
+        "score": scores,
+        "carbonFootprint": carbon,
+    }, columns=EXPORT_COLUMNS)
+
+
+class ScanReport:
+    """Running totals over chunks of joined scans and users' ecoScores."""
+
+    def __init__(self, categories: np.ndarray):
+        self.categories = categories
+        self.scans = 0
+        self.users = 0
+        self._category_scans = np.zeros(len(categories), dtype=np.int64)
+        self._category_scores = np.zeros(len(categories))
+        self._category_carbon = np.zeros(len(categories))
+        self._carbon = np.zeros(CARBON_MAX + 1, dtype=np.int64)
+        self._carbon_total = 0
+        self._levels = np.zeros(len(LEVELS), dtype=np.int64)
+
+    def add_scans(self, category_codes: np.ndarray, scores: np.ndarray, carbon: np.ndarray):
+        size = len(self.categories)
+        self.scans += len(category_codes)
+        self._category_scans += np.bincount(category_codes, minlength=size)
+        self._category_scores += np.bincount(category_codes, weights=scores, minlength=size)
+        self._category_carbon += np.bincount(category_codes, weights=carbon, minlength=size)
+        self._carbon_total += int(carbon.sum())
+        self._carbon += np.bincount(np.clip(carbon, 0, CARBON_MAX), minlength=CARBON_MAX + 1)
+
+    def add_users(self, eco_scores: np.ndarray):
+        self.users += len(eco_scores)
+        self._levels += np.bincount(level_indexes(eco_scores), minlength=len(LEVELS))
+
+    def _carbon_percentile(self, pct: float) -> int:
+        # Nearest rank: the smallest footprint at least pct% of scans don't exceed
+        rank = max(1, math.ceil(pct / 100 * self.scans))
+        return int(np.searchsorted(np.cumsum(self._carbon), rank))
+
+    def result(self) -> dict:
+        table = pd.DataFrame({
+            "category": self.categories,
+            "scans": self._category_scans,
+            "share": (self._category_scans / max(1, self.scans)).round(4),
+            "averageScore": (self._category_scores / np.maximum(1, self._category_scans)).round(2),
+            "carbonFootprint": self._category_carbon.astype(np.int64),
+        })
+        table = table[table["scans"] > 0].sort_values(["scans", "category"], ascending=[False, True])
+        bins = self._carbon[:CARBON_HISTOGRAM_MAX].reshape(-1, CARBON_BIN_WIDTH).sum(axis=1)
+        histogram = [{"from": index * CARBON_BIN_WIDTH, "to": (index + 1) * CARBON_BIN_WIDTH, "scans": int(count)}
+                     for index, count in enumerate(bins)]
+        histogram.append({"from": CARBON_HISTOGRAM_MAX, "to": None,
+                          "scans": int(self._carbon[CARBON_HISTOGRAM_MAX:].sum())})
+        return {
+            "generatedAt": datetime.now(timezone.utc).isoformat(),
+            "scans": self.scans,
+            "categories": [{**row, "scans": int(row["scans"]), "carbonFootprint": int(row["carbonFootprint"])}
+                           for row in table.to_dict("records")],
+            "carbonFootprint": {
+                "total": self._carbon_total,
+                "average": round(self._carbon_total / self.scans, 2) if self.scans else None,
+                "percentiles": {f"p{pct}": self._carbon_percentile(pct) if self.scans else None
+                                for pct in CARBON_PERCENTILES},
+                "histogram": histogram,
+            },
+            "users": self.users,
+            "levels": [
+                {"level": level, "users": int(count), "share": round(int(count) / self.users, 4) if self.users else 0.0}
+                for level, count in zip(LEVELS, self._levels)
+            ],
+        }
+
+
+class CsvWriter:
+    def __init__(self, path: Path):
+        self._handle = open(path, "w", encoding="utf-8", newline="")
+        self._header = True
+
+    def write(self, frame: pd.DataFrame):
+        frame.to_csv(self._handle, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        if self._header:
+            self._handle.write(",".join(EXPORT_COLUMNS) + "\n")
+        self._handle.close()
+
+
+class ParquetWriter:
+    """Writes each chunk as one row group."""
+
+    def __init__(self, path: Path):
+        if pyarrow is None:
+            raise ValueError("Parquet exports need pyarrow (pip install pyarrow)")
+        self._schema = pyarrow.schema([
+            (column, pyarrow.int64() if column in NUMERIC_COLUMNS else pyarrow.string()) for column in EXPORT_COLUMNS
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, frame: pd.DataFrame):
+        self._writer.write_table(pyarrow.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_writer(path: Path, fmt: Optional[str] = None):
+    fmt = fmt or detect_format(path)
+    return ParquetWriter(path) if fmt == "parquet" else CsvWriter(path)
+
+
+async def batched(iterator: AsyncIterator[dict], size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for item in iterator:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def analyze(storage: Storage, chunk_size: int = 50000, writer=None) -> dict:
+    """Build the report, writing the joined scans to `writer` if given.
+
+    Chunks are joined and aggregated on a worker thread, so the event loop
+    stays free, while the next chunk is already being read.
+    """
+    catalog = await load_catalog(storage)
+    report = ScanReport(catalog.categories)
+
+    def process(scans: List[dict]):
+        positions, scores, carbon = join(scans, catalog)
+        report.add_scans(catalog.category_codes[positions], scores, carbon)
+        if writer is not None:
+            writer.write(export_frame(scans, catalog, positions, scores, carbon))
+
+    chunks = storage.scans.iterate_chunks(chunk_size, None if writer else REPORT_FIELDS)
+    pending = asyncio.ensure_future(anext(chunks, None))
+    try:
+        while (scans := await pending) is not None:
+            pending = asyncio.ensure_future(anext(chunks, None))
+            await asyncio.to_thread(process, scans)
+    finally:
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+        await chunks.aclose()
+
+    async for users in batched(storage.users.iter_by_score(["ecoScore"]), chunk_size):
+        report.add_users(np.fromiter((user.get("ecoScore", 0) for user in users), np.int64, len(users)))
+    return report.result()
+
+
+async def iter_csv(storage: Storage, chunk_size: int = 50000) -> AsyncIterator[str]:
+    """The joined scans as CSV text, one chunk at a time."""
+    catalog = await load_catalog(storage)
+
+    def encode(scans: List[dict], header: bool) -> str:
+        return export_frame(scans, catalog, *join(scans, catalog)).to_csv(header=header, index=False)
+
+    header = True
+    async for scans in storage.scans.iterate_chunks(chunk_size):
+        yield await asyncio.to_thread(encode, scans, header)
+        header = False
+    if header:
+        yield ",".join(EXPORT_COLUMNS) + "\n"
@@ -0,0 +1,268 @@
+"""Streaming bulk import of product feeds (CSV or JSONL).
+
+Rows are read one at a time and validated against the Product model a batch
+at a time. Valid rows are upserted by barcode with unordered bulk writes,
+and up to `concurrency` batches are in flight at once. Memory use is bounded
+by batch_size x concurrency, whatever the size of the feed.
+
+Progress is checkpointed as a byte offset into the feed. The offset only
+advances past batches that are written and that follow a contiguous run of
+written batches, so a resumed import never skips a row. It may re-apply a
+few batches, which is harmless because the writes are upserts. Rows that
+fail validation or the write go to a JSONL rejects report with the reason.
+"""
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+# (row number, byte offset just past the row, parsed row or None, parse error)
+Row = Tuple[int, int, Optional[dict], Optional[str]]
+
+
+def detect_format(path: Path) -> str:
+    suffix = path.suffix.lower().lstrip(".")
+    if suffix in ("jsonl", "ndjson"):
+        return "jsonl"
+    if suffix == "csv":
+        return "csv"
+    raise ValueError(f"Can't tell the format of {path.name}; pass one of {FORMATS}")
+
+
+class OffsetLines:
+    """Decoded lines of a binary file that remember where the last one ended."""
+
+    def __init__(self, handle):
+        self._handle = handle
+        self.offset = handle.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = self._handle.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8-sig" if self.offset == len(line) else "utf-8")
+
+
+def read_rows(path: Path, fmt: str, offset: int = 0, first_row: int = 1) -> Iterator[Row]:
+    with open(path, "rb") as handle:
+        if fmt == "csv":
+            lines = OffsetLines(handle)
+            # The header is always re-read, even when resuming mid-file
+            header = next(csv.reader(lines), None)
+            if header is None:
+                return
+            if offset > lines.offset:
+                handle.seek(offset)
+                lines.offset = offset
+            # csv pulls lines lazily, so after each row the offset is exactly
+            # the end of that row, even for quoted multi-line fields
+            row_number = first_row
+            for values in csv.reader(lines):
+                if not values:
+                    continue
+                if len(values) != len(header):
+                    yield row_number, lines.offset, None, f"expected {len(header)} columns, got {len(values)}"
+                else:
+                    yield row_number, lines.offset, dict(zip(header, values)), None
+                row_number += 1
+        else:
+            handle.seek(offset)
+            lines = OffsetLines(handle)
+            row_number = first_row
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    yield row_number, lines.offset, None, f"invalid JSON: {error}"
+                else:
+                    if isinstance(row, dict):
+                        yield row_number, lines.offset, row, None
+                    else:
+                        yield row_number, lines.offset, None, "expected a JSON object"
+                row_number += 1
+
+
+class Checkpoint:
+    """Resumable position in one feed, written atomically after each advance."""
+
+    def __init__(self, path: Optional[Path], source: Path):
+        self.path = path
+        self.source = str(source.resolve())
+        self.size = source.stat().st_size
+        self.offset = 0
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+
+    def load(self):
+        if not self.path or not self.path.exists():
+            return
+        saved = json.loads(self.path.read_text())
+        if saved["source"] != self.source or saved["size"] != self.size:
+            raise ValueError(f"{self.path} belongs to a different or changed feed; delete it to start over")
+        self.offset = saved["offset"]
+        self.rows = saved["rows"]
+        self.imported = saved["imported"]
+        self.rejected = saved["rejected"]
+
+    def save(self):
+        if not self.path:
+            return
+        temporary = self.path.with_suffix(self.path.suffix + ".tmp")
+        temporary.write_text(json.dumps({
+            "source": self.source, "size": self.size, "offset": self.offset,
+            "rows": self.rows, "imported": self.imported, "rejected": self.rejected,
+        }))
+        os.replace(temporary, self.path)
+
+
+class Rejects:
+    def __init__(self, path: Optional[Path], append: bool):
+        self._handle = open(path, "a" if append else "w", encoding="utf-8") if path else None
+
+    def write(self, row_number: int, reason: str, data):
+        if self._handle:
+            self._handle.write(json.dumps({"row": row_number, "reason": reason, "data": data}, default=str) + "\n")
+
+    def close(self):
+        if self._handle:
+            self._handle.close()
+
+
+def validate_batch(adapter: TypeAdapter, rows: List[Row], rejects: Rejects) -> Tuple[List[dict], List[int]]:
+    """Validate parsed rows in one call; returns the products and their row numbers."""
+    parsed = []
+    for row_number, _, data, error in rows:
+        if error:
+            rejects.write(row_number, error, data)
+        else:
+            parsed.append((row_number, data))
+    if not parsed:
+        return [], []
+    try:
+        products = adapter.validate_python([data for _, data in parsed])
+    except ValidationError as error:
+        invalid = {}
+        for detail in error.errors(include_url=False):
+            index, *field = detail["loc"]
+            invalid.setdefault(index, []).append(f"{'.'.join(map(str, field)) or 'row'}: {detail['msg']}")
+        for index, reasons in invalid.items():
+            rejects.write(parsed[index][0], "; ".join(reasons), parsed[index][1])
+        valid = [item for index, item in enumerate(parsed) if index not in invalid]
+        products = adapter.validate_python([data for _, data in valid]) if valid else []
+        parsed = valid
+    return [product.model_dump() for product in products], [row_number for row_number, _ in parsed]
+
+
+async def import_catalog(
+    storage: Storage,
+    path: Path,
+    model: Type[BaseModel],
+    fmt: Optional[str] = None,
+    batch_size: int = 1000,
+    concurrency: int = 4,
+    checkpoint_path: Optional[Path] = None,
+    rejects_path: Optional[Path] = None,
+    progress_interval: float = 5.0,
+) -> dict:
+    fmt = fmt or detect_format(path)
+    adapter = TypeAdapter(List[model])
+    checkpoint = Checkpoint(checkpoint_path, path)
+    checkpoint.load()
+    resumed = checkpoint.offset > 0
+    if resumed:
+        logger.info("Resuming %s at row %d (byte %d)", path.name, checkpoint.rows + 1, checkpoint.offset)
+    rejects = Rejects(rejects_path, append=resumed)
+
+    in_flight = set()
+    finished = {}  # batch sequence -> (end offset, rows, imported, rejected)
+    next_to_commit = 0
+    sequence = 0
+    started = time.monotonic()
+    last_report = started
+    session_rows = 0
+
+    async def write(batch_sequence: int, rows: List[Row]):
+        products, row_numbers = validate_batch(adapter, rows, rejects)
+        failures = await storage.products.upsert_many(products) if products else []
+        for index, reason in failures:
+            rejects.write(row_numbers[index], reason, products[index])
+        imported = len(products) - len(failures)
+        finished[batch_sequence] = (rows[-1][1], len(rows), imported, len(rows) - imported)
+
+    def commit():
+        # Advance the checkpoint over the contiguous prefix of written batches
+        nonlocal next_to_commit
+        advanced = False
+        while next_to_commit in finished:
+            offset, rows, imported, rejected = finished.pop(next_to_commit)
+            checkpoint.offset = offset
+            checkpoint.rows += rows
+            checkpoint.imported += imported
+            checkpoint.rejected += rejected
+            next_to_commit += 1
+            advanced = True
+        if advanced:
+            checkpoint.save()
+
+    async def wait_for_slot(limit: int):
+        while len(in_flight) > limit:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            in_flight.difference_update(done)
+            for task in done:
+                task.result()  # re-raise write failures
+            commit()
+
+    try:
+        batch = []
+        for row in read_rows(path, fmt, checkpoint.offset, checkpoint.rows + 1):
+            batch.append(row)
+            if len(batch) < batch_size:
+                continue
+            in_flight.add(asyncio.create_task(write(sequence, batch)))
+            sequence += 1
+            session_rows += len(batch)
+            batch = []
+            await wait_for_slot(concurrency - 1)
+            now = time.monotonic()
+            if now - last_report >= progress_interval:
+                last_report = now
+                logger.info("%d rows (%.0f rows/s), %d imported, %d rejected",
+                            checkpoint.rows, session_rows / (now - started), checkpoint.imported, checkpoint.rejected)
+        if batch:
+            in_flight.add(asyncio.create_task(write(sequence, batch)))
+            session_rows += len(batch)
+        await wait_for_slot(0)
+    finally:
+        if in_flight:
+            # Let started writes finish so the checkpoint is as far on as possible
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            commit()
+        rejects.close()
+
+    elapsed = time.monotonic() - started
+    return {
+        "rows": checkpoint.rows,
+        "imported": checkpoint.imported,
+        "rejected": checkpoint.rejected,
+        "seconds": round(elapsed, 2),
+        "rowsPerSecond": round(session_rows / elapsed) if elapsed else 0,
+        "resumed": resumed,
+    }
@@ -0,0 +1,263 @@
+"""Incremental challenge progress.
+
+Each challenge's free-text `requirement` is parsed once into a rule. Rules
+keep small per-user counters (a weekly count, a daily streak) that are
+advanced by every new scan, so evaluating a user's challenges costs
+O(#challenges) instead of a pass over their scan history. Counters only ever
+go up ($inc and $max), so concurrent scans for the same user are applied
+atomically by storage instead of racing on a read-modify-write. Counters no
+rule reads any more (past weeks) are removed the next time the user scans.
+
+With scan write-behind, counter updates are batched into the buffer's
+flushes too, and awards are evaluated against an in-process copy of each
+user's counters.
+"""
+import asyncio
+import logging
+import re
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from cache import MISSING, TTLCache
+from storage import Storage, apply_progress
+from write_behind import ScanWriteBuffer
+
+logger = logging.getLogger(__name__)
+
+# Score a product must beat to count as "high-score"/"eco-friendly"
+HIGH_SCORE = 70
+
+
+def scan_day(scan: dict) -> date:
+    return datetime.fromisoformat(scan["scannedAt"]).astimezone(timezone.utc).date()
+
+
+def week_key(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class Rule(ABC):
+    def __init__(self, challenge_id: str, target: int):
+        self.id = challenge_id
+        self.target = target
+
+    def advance(self, scans: List[dict], increments: Dict[str, int], maxima: Dict[str, str]):
+        """Add the counter updates for `scans` to `increments` and `maxima`,
+        keyed by dotted path under the user's progress "rules"."""
+
+    def stale(self, state: dict, today: date) -> List[str]:
+        """Dotted paths of counters in `state` that current() no longer reads."""
+        return []
+
+    @abstractmethod
+    def current(self, state: dict, eco_score: int, today: date) -> int:
+        ...
+
+
+class ScanCountRule(Rule):
+    """N scans above a score, optionally counted per ISO week.
+
+    State: {"counts": {window: scans}}, one counter per week (or "all");
+    past weeks are stale.
+    """
+
+    def __init__(self, challenge_id: str, target: int, min_score: int, weekly: bool):
+        super().__init__(challenge_id, target)
+        self.min_score = min_score
+        self.weekly = weekly
+
+    def _window(self, day: date) -> str:
+        return week_key(day) if self.weekly else "all"
+
+    def advance(self, scans, increments, maxima):
+        for scan in scans:
+            if scan["score"] > self.min_score:
+                path = f"{self.id}.counts.{self._window(scan_day(scan))}"
+                increments[path] = increments.get(path, 0) + 1
+
+    def stale(self, state, today):
+        window = self._window(today)
+        return [f"{self.id}.counts.{key}" for key in state.get("counts", {}) if key != window]
+
+    def current(self, state, eco_score, today):
+        return state.get("counts", {}).get(self._window(today), 0)
+
+
+class DailyStreakRule(Rule):
+    """N consecutive days with at least one high-score scan.
+
+    State: {"days": {slot: day}}, the latest qualifying day in each of
+    target + 2 slots, enough to hold a full streak ending yesterday plus
+    today. Days go into slot ordinal % slots with $max, so a slot always
+    keeps its most recent day whatever order scans arrive in.
+    """
+
+    def __init__(self, challenge_id: str, target: int, min_score: int = HIGH_SCORE):
+        super().__init__(challenge_id, target)
+        self.min_score = min_score
+        self.slots = target + 2
+
+    def advance(self, scans, increments, maxima):
+        for scan in scans:
+            if scan["score"] > self.min_score:
+                day = scan_day(scan)
+                path = f"{self.id}.days.{day.toordinal() % self.slots}"
+                maxima[path] = max(maxima.get(path, ""), day.isoformat())
+
+    def current(self, state, eco_score, today):
+        days = {date.fromisoformat(day) for day in state.get("days", {}).values()}
+        # A streak survives until the end of the day after its last scan
+        day = today if today in days else today - timedelta(days=1)
+        streak = 0
+        while day in days:
+            streak += 1
+            day -= timedelta(days=1)
+        return streak
+
+
+class EcoScoreRule(Rule):
+    """Total EcoScore at or above a threshold."""
+
+    def current(self, state, eco_score, today):
+        return eco_score
+
+
+RULE_PATTERNS = [
+    (re.compile(r"(\d+)\s+scans?\s+with\s+score\s*>\s*(\d+)", re.I),
+     lambda challenge, match: ScanCountRule(
+         challenge["id"], int(match[1]), int(match[2]), weekly="week" in challenge.get("description", "").lower())),
+    (re.compile(r"(\d+)\s+days?\s+of\s+high-score\s+products", re.I),
+     lambda challenge, match: DailyStreakRule(challenge["id"], int(match[1]))),
+    (re.compile(r"total\s+ecoscore\s*>=\s*(\d+)", re.I),
+     lambda challenge, match: EcoScoreRule(challenge["id"], int(match[1]))),
+]
+
+
+def parse_rule(challenge: dict) -> Optional[Rule]:
+    for pattern, build in RULE_PATTERNS:
+        match = pattern.search(challenge.get("requirement", ""))
+        if match:
+            return build(challenge, match)
+    return None
+
+
+class ChallengeEngine:
+    def __init__(self, storage: Storage):
+        self._storage = storage
+        self.challenges = []
+        self.rules = []
+        self._buffer: Optional[ScanWriteBuffer] = None
+        # userId -> {"rules": counters, "awarded": challenge ids}, while buffered
+        self._cache: Optional[TTLCache] = None
+
+    def buffer_progress(self, buffer: ScanWriteBuffer, cache: TTLCache):
+        """Send counter updates through `buffer` instead of writing them per
+        scan. `cache` holds each active user's counters, including updates
+        not flushed yet, so its TTL must outlast a flush by far."""
+        self._buffer = buffer
+        self._cache = cache
+
+    def load(self, challenges: List[dict]):
+        self.challenges = challenges
+        self.rules = []
+        for challenge in challenges:
+            rule = parse_rule(challenge)
+            if rule is None:
+                logger.warning("Challenge %s has an unrecognised requirement: %r",
+                               challenge.get("id"), challenge.get("requirement"))
+            else:
+                self.rules.append(rule)
+
+    async def record_scans(self, user_id: str, scans: List[dict], user: dict) -> tuple:
+        """Advance the user's counters by `scans` and award newly met challenges.
+
+        `user` is the user's current document. Returns the (possibly updated)
+        user and the challenges awarded by this call.
+        """
+        increments, maxima = {}, {}
+        for rule in self.rules:
+            rule.advance(scans, increments, maxima)
+        today = datetime.now(timezone.utc).date()
+        if self._buffer is None:
+            progress = await self._storage.challenge_progress.advance(user_id, increments, maxima)
+            states = progress.get("rules", {})
+            stale = self._stale(states, today)
+            if stale:
+                # Once a week per user at most
+                await self._storage.challenge_progress.advance(user_id, {}, {}, stale)
+            return await self._award(user_id, states, user)
+        cached = await self._cached(user_id)
+        apply_progress(cached["rules"], increments, maxima)
+        stale = self._stale(cached["rules"], today)
+        apply_progress(cached["rules"], {}, {}, stale)
+        await self._buffer.submit_progress(user_id, increments, maxima, stale)
+        return await self._award(user_id, cached["rules"], {**user, "awardedChallenges": cached["awarded"]}, cached)
+
+    def _stale(self, states: dict, today: date) -> List[str]:
+        return [path for rule in self.rules for path in rule.stale(states.get(rule.id, {}), today)]
+
+    async def _cached(self, user_id: str) -> dict:
+        cached = self._cache.get(user_id)
+        if cached is MISSING:
+            progress, user = await asyncio.gather(
+                self._storage.challenge_progress.get(user_id), self._storage.users.get_by_id(user_id))
+            # A concurrent scan may have loaded (and advanced) it meanwhile
+            cached = self._cache.get(user_id)
+            if cached is MISSING:
+                cached = {
+                    "rules": progress["rules"] if progress else {},
+                    "awarded": list((user or {}).get("awardedChallenges") or []),
+                }
+        self._cache.set(user_id, cached)
+        return cached
+
+    async def _award(self, user_id: str, states: dict, user: dict, cached: Optional[dict] = None) -> tuple:
+        today = datetime.now(timezone.utc).date()
+        awarded = []
+        # An award raises the EcoScore, which may complete a score challenge
+        progressed = True
+        while progressed:
+            progressed = False
+            done = set(user.get("awardedChallenges") or [])
+            for rule in self.rules:
+                if rule.id in done or rule.current(states.get(rule.id, {}), user.get("ecoScore", 0), today) < rule.target:
+                    continue
+                challenge = next(c for c in self.challenges if c["id"] == rule.id)
+                # Guarded on the user document, so each award happens exactly once
+                updated = await self._storage.users.award_challenge(user_id, rule.id, challenge["reward"])
+                if cached is not None:
+                    # Awarded now or, by another worker, before; either way it's done
+                    cached["awarded"].append(rule.id)
+                    if updated:
+                        # The stored score lags behind the buffered scans
+                        updated = {**updated, "ecoScore": user.get("ecoScore", 0) + challenge["reward"]}
+                if updated:
+                    user = updated
+                    awarded.append(challenge)
+                    progressed = True
+                    break
+        return user, awarded
+
+    async def progress(self, user_id: str, user: dict) -> List[dict]:
+        if self._buffer is None:
+            progress = await self._storage.challenge_progress.get(user_id)
+            states = progress["rules"] if progress else {}
+        else:
+            states = (await self._cached(user_id))["rules"]
+        rules = {rule.id: rule for rule in self.rules}
+        done = set(user.get("awardedChallenges") or [])
+        today = datetime.now(timezone.utc).date()
+        results = []
+        for challenge in self.challenges:
+            rule = rules.get(challenge["id"])
+            current = rule.current(states.get(rule.id, {}), user.get("ecoScore", 0), today) if rule else 0
+            target = rule.target if rule else None
+            results.append({
+                **challenge,
+                "progress": min(current, target) if target else current,
+                "target": target,
+                "completed": challenge["id"] in done,
+            })
+        return results
@@ -0,0 +1,174 @@
+"""Maintenance commands, run from the backend directory:
+
+    python manage.py backfill-rollups
+    python manage.py migrate-scans --to buckets
+    python manage.py import-catalog products.csv --checkpoint products.ckpt --rejects rejects.jsonl
+    python manage.py export-analytics scans.parquet --report report.json
+"""
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Optional
+
+import typer
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from analytics import FORMATS as EXPORT_FORMATS, analyze, open_writer  # noqa: E402
+from catalog_import import FORMATS, import_catalog  # noqa: E402
+from rollups import backfill  # noqa: E402
+from storage import SCAN_LAYOUTS, MongoStorage, create_storage  # noqa: E402
+
+logger = logging.getLogger("manage")
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+cli = typer.Typer()
+
+
+@cli.callback()
+def main():
+    """TerraQuest maintenance commands."""
+
+
+@cli.command("backfill-rollups")
+def backfill_rollups(batch_size: int = typer.Option(1000, help="Scans per catalogue lookup and rollups per write.")):
+    """Rebuild every user's daily scan rollups from the raw scans."""
+    async def run():
+        storage = create_storage()
+        try:
+            await storage.ensure_indexes()
+            return await backfill(storage, batch_size)
+        finally:
+            storage.close()
+
+    result = asyncio.run(run())
+    typer.echo(f"{result['rollups']} daily rollups from {result['scans']} scans")
+
+
+@cli.command("migrate-scans")
+def migrate_scans(
+    to: str = typer.Option(..., help=f"Target scan layout: {' or '.join(SCAN_LAYOUTS)}."),
+    batch_size: int = typer.Option(1000, help="Scans per write."),
+    replace: bool = typer.Option(False, help="Drop whatever the target layout already holds first."),
+):
+    """Copy every scan from the other layout into the `to` layout.
+
+    The source is left untouched; switch SCAN_LAYOUT and restart once the
+    copy is done, then drop the old collection.
+    """
+    if to not in SCAN_LAYOUTS:
+        raise typer.BadParameter(f"expected one of {SCAN_LAYOUTS}", param_hint="--to")
+
+    async def run():
+        storage = create_storage()
+        if not isinstance(storage, MongoStorage):
+            raise typer.BadParameter("scan layouts only apply to the mongo storage engine")
+        try:
+            await storage.ensure_indexes()
+            source = storage.scan_repository(next(layout for layout in SCAN_LAYOUTS if layout != to))
+            target = storage.scan_repository(to)
+            if replace:
+                await target.collection.drop()
+                await storage.ensure_indexes()
+            elif await target.collection.estimated_document_count():
+                raise typer.BadParameter(f"{target.collection.name} is not empty; pass --replace to overwrite it")
+
+            copied = 0
+            started = time.perf_counter()
+            batch = []
+            async for scan in source.iterate_by_user():
+                batch.append(scan)
+                if len(batch) >= batch_size:
+                    await target.insert_many(batch)
+                    copied += len(batch)
+                    batch = []
+                    logger.info("Copied %d scans", copied)
+            if batch:
+                await target.insert_many(batch)
+                copied += len(batch)
+            return copied, time.perf_counter() - started
+        finally:
+            storage.close()
+
+    copied, elapsed = asyncio.run(run())
+    typer.echo(f"Copied {copied} scans into the {to} layout in {elapsed:.1f}s")
+
+
+@cli.command("import-catalog")
+def import_catalog_command(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV (with a header row) or JSONL feed."),
+    format: Optional[str] = typer.Option(None, help=f"One of {FORMATS}; guessed from the extension by default."),
+    batch_size: int = typer.Option(1000, help="Rows per validation call and bulk write."),
+    concurrency: int = typer.Option(4, help="Bulk writes in flight at once."),
+    checkpoint: Optional[Path] = typer.Option(None, help="Progress file; an existing one resumes the import."),
+    rejects: Optional[Path] = typer.Option(None, help="JSONL report of rows that were not imported."),
+    progress_interval: float = typer.Option(5.0, help="Seconds between progress lines."),
+):
+    """Stream a product feed into the catalog, upserting by barcode.
+
+    Running servers pick the changes up through SNAPSHOT_TTL, PRODUCT_CACHE_TTL
+    and SEARCH_INDEX_REFRESH_SECONDS.
+    """
+    if format is not None and format not in FORMATS:
+        raise typer.BadParameter(f"expected one of {FORMATS}", param_hint="--format")
+    # The app module holds the Product model; importing it connects nothing
+    from server import Product
+
+    async def run():
+        storage = create_storage()
+        try:
+            await storage.ensure_indexes()
+            return await import_catalog(storage, path, Product, format, batch_size, max(1, concurrency),
+                                        checkpoint, rejects, progress_interval)
+        finally:
+            storage.close()
+
+    try:
+        result = asyncio.run(run())
+    except ValueError as error:
+        raise typer.BadParameter(str(error))
+    typer.echo(f"{result['rows']} rows: {result['imported']} imported, {result['rejected']} rejected "
+               f"in {result['seconds']}s ({result['rowsPerSecond']} rows/s)")
+
+
+@cli.command("export-analytics")
+def export_analytics(
+    output: Optional[Path] = typer.Argument(None, dir_okay=False, help="Where to write the scans joined with "
+                                                                       "their products; omit for the report only."),
+    format: Optional[str] = typer.Option(None, help=f"One of {EXPORT_FORMATS}; guessed from the extension by default."),
+    report: Optional[Path] = typer.Option(None, help="Write the JSON report here instead of printing it."),
+    chunk_size: int = typer.Option(50000, help="Scans per chunk read, joined and written."),
+):
+    """Report scans per category, carbon footprints and levels, optionally
+    exporting every scan as CSV or Parquet."""
+    if format is not None and format not in EXPORT_FORMATS:
+        raise typer.BadParameter(f"expected one of {EXPORT_FORMATS}", param_hint="--format")
+
+    async def run():
+        storage = create_storage()
+        writer = open_writer(output, format) if output else None
+        try:
+            return await analyze(storage, max(1, chunk_size), writer)
+        finally:
+            if writer:
+                writer.close()
+            storage.close()
+
+    started = time.perf_counter()
+    try:
+        result = asyncio.run(run())
+    except ValueError as error:
+        raise typer.BadParameter(str(error))
+    if report:
+        report.write_text(json.dumps(result, indent=2))
+    else:
+        typer.echo(json.dumps(result, indent=2))
+    logger.info("Analyzed %d scans in %.1fs", result["scans"], time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    cli()
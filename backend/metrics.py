@@ -0,0 +1,223 @@
+"""Prometheus text-format metrics without a client library.
+
+Request latency comes from an ASGI middleware, Mongo command latency from a
+pymongo CommandListener, event-loop lag from a sleeping task, and everything
+else (cache, queue, pool sizes) from gauge callbacks that only run when
+/metrics is scraped.
+
+The hot path is deliberately cheap: each observation is a dict lookup, a
+bisect and two in-place additions on a preallocated list, with no locks.
+Request metrics are only touched from the event loop. Mongo command events
+arrive on driver threads; the GIL makes each addition effectively atomic,
+and an occasional lost increment under contention is an acceptable price for
+staying lock-free.
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.monitoring import CommandListener
+
+# Seconds; fine-grained at the low end, where healthy requests and commands live
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class HistogramFamily:
+    def __init__(self, name: str, help: str, label_names: Labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._children: Dict[Labels, Histogram] = {}
+
+    def labels(self, *values: str) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = Histogram(self.buckets)
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(child.counts)):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, values, le)} {cumulative}")
+            labels = format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name: str, help: str, label_names: Labels):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.values: Dict[Labels, int] = {}
+
+    def inc(self, values: Labels, amount: int = 1):
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, value in list(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, values)} {value}")
+        return lines
+
+
+class CallbackMetric:
+    """A gauge or counter whose samples are read from elsewhere at scrape time."""
+
+    def __init__(self, name: str, help: str, kind: str, label_names: Labels,
+                 collect: Callable[[], Iterable[Tuple[Labels, float]]]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = label_names
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in self.collect():
+            lines.append(f"{self.name}{format_labels(self.label_names, values)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, help: str, label_names: Labels = (), buckets=LATENCY_BUCKETS) -> HistogramFamily:
+        return self._register(HistogramFamily(name, help, label_names, buckets))
+
+    def counter(self, name: str, help: str, label_names: Labels = ()) -> CounterFamily:
+        return self._register(CounterFamily(name, help, label_names))
+
+    def callback(self, name: str, help: str, collect: Callable[[], Iterable[Tuple[Labels, float]]],
+                 label_names: Labels = (), kind: str = "gauge") -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, kind, label_names, collect))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Per-route request counts and latency, keyed by the route template.
+
+    Plain ASGI rather than BaseHTTPMiddleware, which would add a task and a
+    stream per request. Requests that match no route share one "unmatched"
+    label so scanners can't blow up the series count.
+    """
+
+    def __init__(self, app, requests: CounterFamily, latency: HistogramFamily):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the (shared) scope
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            self.latency.labels(method, path).observe(time.perf_counter() - started)
+            self.requests.inc((method, path, str(status_code)))
+
+
+class MongoCommandMetrics(CommandListener):
+    """Mongo command latency per collection and command name."""
+
+    def __init__(self, latency: HistogramFamily, failures: CounterFamily):
+        self.latency = latency
+        self.failures = failures
+        self._collections: Dict[Tuple[object, int], str] = {}
+
+    @staticmethod
+    def _collection(event) -> str:
+        command = event.command
+        target = command.get(event.command_name)
+        if isinstance(target, str):
+            return target
+        # getMore names its collection separately; admin commands have none
+        return command.get("collection", "")
+
+    def started(self, event):
+        self._collections[(event.connection_id, event.request_id)] = self._collection(event)
+
+    def _finish(self, event) -> Optional[str]:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.latency.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        return collection
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self.failures.inc((self._finish(event), event.command_name))
+
+
+class LoopLagMonitor:
+    """How late the event loop wakes a sleeping task: time during which no
+    other coroutine could run."""
+
+    def __init__(self, lag: HistogramFamily):
+        self._lag = lag.labels()
+        self.last = 0.0
+
+    async def run(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.last = max(0.0, loop.time() - expected)
+            self._lag.observe(self.last)
@@ -0,0 +1,57 @@
+"""JSON encoding and response shaping for documents we already trust.
+
+FastAPI validates and re-serializes every returned dict against the route's
+response_model. For documents read from our own collections that work is
+redundant, and for large catalogue pages it dominates the request.
+`TrustedShape` does what the model would do to such a document (drop unknown
+keys, fill defaults) with a dict comprehension, and `json_response` encodes
+the result with orjson when it is installed. Returning a Response skips
+FastAPI's own validation while the response_model still documents the route.
+
+`strict=True` validates through the model instead, so tests and benchmarks
+catch drift between the models and the stored data.
+"""
+import json
+from typing import Dict, List, Optional, Type
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON, via orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class TrustedShape:
+    """Shape documents from a trusted source the way `model` would."""
+
+    def __init__(self, model: Type[BaseModel], strict: bool = False):
+        self.model = model
+        self.strict = strict
+        self._fields = list(model.model_fields.items())
+
+    def one(self, document: dict) -> dict:
+        if self.strict:
+            return self.model.model_validate(document).model_dump()
+        shaped = {}
+        for name, field in self._fields:
+            if name in document:
+                shaped[name] = document[name]
+            elif not field.is_required():
+                shaped[name] = field.get_default(call_default_factory=True)
+        return shaped
+
+    def many(self, documents: List[dict]) -> List[dict]:
+        return [self.one(document) for document in documents]
+
+
+def json_response(content, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> Response:
+    return Response(dumps(content), status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,127 @@
+"""Per-user daily scan rollups.
+
+Every stored scan is also added to a (userId, day) rollup, so the stats
+endpoint reads one small document per day in the requested range instead of
+the user's whole scan history. `backfill` rebuilds the rollups from the raw
+scans for data written before they existed.
+"""
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from storage import ROLLUP_FIELDS, RollupKey, Storage
+
+logger = logging.getLogger(__name__)
+
+# ?range= values accepted by the stats endpoint, in days (today included)
+RANGES = {"7d": 7, "30d": 30, "90d": 90, "365d": 365}
+
+
+def scan_day(scan: dict) -> str:
+    return datetime.fromisoformat(scan["scannedAt"]).astimezone(timezone.utc).date().isoformat()
+
+
+def rollup_deltas(scans: List[dict]) -> Dict[RollupKey, dict]:
+    """Sum `scans` into one increment per (userId, day)."""
+    deltas = {}
+    for scan in scans:
+        delta = deltas.setdefault((scan["userId"], scan_day(scan)), dict.fromkeys(ROLLUP_FIELDS, 0))
+        delta["scans"] += 1
+        delta["scoreTotal"] += scan["score"]
+        delta["carbonFootprint"] += scan.get("carbonFootprint", 0)
+    return deltas
+
+
+def summarize(rollups: List[dict], start: date, end: date) -> dict:
+    """Totals plus a zero-filled per-day series for [start, end]."""
+    by_day = {rollup["day"]: rollup for rollup in rollups}
+    days = []
+    totals = dict.fromkeys(ROLLUP_FIELDS, 0)
+    day = start
+    while day <= end:
+        rollup = by_day.get(day.isoformat(), {})
+        entry = {field: rollup.get(field, 0) for field in ROLLUP_FIELDS}
+        for field in ROLLUP_FIELDS:
+            totals[field] += entry[field]
+        days.append({
+            "day": day.isoformat(),
+            "scans": entry["scans"],
+            "averageScore": round(entry["scoreTotal"] / entry["scans"], 2) if entry["scans"] else None,
+            "carbonFootprint": entry["carbonFootprint"],
+        })
+        day += timedelta(days=1)
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "scans": totals["scans"],
+        "averageScore": round(totals["scoreTotal"] / totals["scans"], 2) if totals["scans"] else None,
+        "carbonFootprint": totals["carbonFootprint"],
+        "days": days,
+    }
+
+
+async def user_stats(storage: Storage, user_id: str, days: int, today: Optional[date] = None) -> dict:
+    end = today or datetime.now(timezone.utc).date()
+    start = end - timedelta(days=days - 1)
+    rollups = await storage.daily_stats.range(user_id, start.isoformat(), end.isoformat())
+    return summarize(rollups, start, end)
+
+
+async def backfill(storage: Storage, batch_size: int = 1000) -> dict:
+    """Recompute every rollup from the raw scans.
+
+    Scans are streamed grouped by user, so each user's days are complete once
+    the stream moves past that user and can be written with replace_many;
+    rerunning the job is harmless. Scans stored before they carried a
+    carbonFootprint get it from the product catalogue.
+    """
+    footprints = {}  # barcode -> carbonFootprint
+    pending = []  # finished rollups not yet written
+    current_user = None
+    current = {}  # day -> rollup for current_user
+    scans = rollups = 0
+
+    async def resolve_footprints(barcodes):
+        missing = [barcode for barcode in barcodes if barcode not in footprints]
+        if missing:
+            products = await storage.products.get_many(missing)
+            footprints.update(dict.fromkeys(missing, 0))
+            footprints.update({product["barcode"]: product.get("carbonFootprint", 0) for product in products})
+
+    async def finish_user():
+        nonlocal current, rollups
+        pending.extend(current.values())
+        rollups += len(current)
+        current = {}
+        if len(pending) >= batch_size:
+            await storage.daily_stats.replace_many(pending)
+            pending.clear()
+
+    buffered = []  # scans waiting on a batched catalogue lookup
+
+    async def fold(batch):
+        nonlocal current_user
+        await resolve_footprints({scan["productBarcode"] for scan in batch if "carbonFootprint" not in scan})
+        for scan in batch:
+            if scan["userId"] != current_user:
+                await finish_user()
+                current_user = scan["userId"]
+            if "carbonFootprint" not in scan:
+                scan["carbonFootprint"] = footprints[scan["productBarcode"]]
+            day = scan_day(scan)
+            rollup = current.setdefault(day, {"userId": scan["userId"], "day": day, **dict.fromkeys(ROLLUP_FIELDS, 0)})
+            rollup["scans"] += 1
+            rollup["scoreTotal"] += scan["score"]
+            rollup["carbonFootprint"] += scan["carbonFootprint"]
+
+    async for scan in storage.scans.iterate_by_user():
+        buffered.append(scan)
+        scans += 1
+        if len(buffered) >= batch_size:
+            await fold(buffered)
+            buffered = []
+    await fold(buffered)
+    await finish_user()
+    await storage.daily_stats.replace_many(pending)
+    logger.info("Backfilled %d daily rollups from %d scans", rollups, scans)
+    return {"scans": scans, "rollups": rollups}
@@ -0,0 +1,59 @@
+import numpy as np
+
+# Upper (exclusive) EcoScore bound for each level; anything above the last
+# bound is TOP_LEVEL. Shared by calculate_level, calculate_levels and
+# level_expression so the Python, NumPy and pipeline-update versions can't
+# drift apart.
+LEVEL_THRESHOLDS = [
+    (500, "Eco Rookie"),
+    (1000, "Green Explorer"),
+    (2000, "Eco Guardian"),
+    (3500, "Sustainability Champion"),
+]
+TOP_LEVEL = "Green Legend"
+LEVELS = [level for _, level in LEVEL_THRESHOLDS] + [TOP_LEVEL]
+
+_LEVEL_BOUNDS = np.array([limit for limit, _ in LEVEL_THRESHOLDS])
+_LEVEL_NAMES = np.array(LEVELS, dtype=object)
+
+
+def calculate_level(eco_score: int) -> str:
+    for limit, level in LEVEL_THRESHOLDS:
+        if eco_score < limit:
+            return level
+    return TOP_LEVEL
+
+
+def level_indexes(eco_scores) -> np.ndarray:
+    """Position in LEVELS of each score's level; vectorized calculate_level."""
+    return np.searchsorted(_LEVEL_BOUNDS, eco_scores, side="right")
+
+
+def calculate_levels(eco_scores) -> np.ndarray:
+    """calculate_level over an array of scores."""
+    return _LEVEL_NAMES[level_indexes(eco_scores)]
+
+
+def level_expression(score_expr) -> dict:
+    """Aggregation-expression equivalent of calculate_level."""
+    return {"$switch": {
+        "branches": [{"case": {"$lt": [score_expr, limit]}, "then": level} for limit, level in LEVEL_THRESHOLDS],
+        "default": TOP_LEVEL,
+    }}
+
+
+def scan_stats_update(score: int, scans: int = 1) -> list:
+    """Pipeline update adding scans/score to a user and re-deriving its level.
+
+    Runs entirely server-side, so concurrent scans for the same user can't lose
+    increments the way a read-modify-write in Python does. It also bumps
+    statsVersion, which tells the order of the documents it returns.
+    """
+    return [
+        {"$set": {
+            "totalScans": {"$add": [{"$ifNull": ["$totalScans", 0]}, scans]},
+            "ecoScore": {"$add": [{"$ifNull": ["$ecoScore", 0]}, score]},
+            "statsVersion": {"$add": [{"$ifNull": ["$statsVersion", 0]}, 1]},
+        }},
+        {"$set": {"level": level_expression("$ecoScore")}},
+    ]
@@ -0,0 +1,225 @@
+"""In-process product search.
+
+An inverted index over the tokens of each product's name, brand and category,
+with the filterable fields kept in compact columns (`array`s, read through
+zero-copy NumPy views). Text matching is per token: exact, prefix (for
+search-as-you-type) or one edit away (typos, via a deletion index in the
+style of SymSpell). Every query token must match. Range filters, facet counts
+and ranking are vectorized over the candidates, so a filter-only query over a
+million products is a handful of array passes rather than a Python loop.
+
+Products are referenced by dense integer ids. Replacing or removing a product
+tombstones its id; `dead` counts tombstones and a rebuild drops them.
+"""
+import re
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Relevance of a token match, per query token
+EXACT, PREFIX, FUZZY = 3, 2, 1
+# Shorter tokens only match exactly (prefix) or without typos (fuzzy)
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 4
+# Extra query tokens are ignored; also keeps relevance within its sort-key bits
+MAX_QUERY_TOKENS = 16
+TEXT_FIELDS = ("name", "brand", "category")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def deletions(term: str) -> List[str]:
+    return [term[:index] + term[index + 1:] for index in range(len(term))]
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Levenshtein distance <= 1, counting an adjacent transposition as one edit."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    start = 0
+    while start < len(a) and a[start] == b[start]:
+        start += 1
+    if len(a) == len(b):
+        return (a[start + 1:] == b[start + 1:]
+                or (a[start + 2:] == b[start + 2:] and a[start:start + 2] == b[start:start + 2][::-1]))
+    return a[start:] == b[start + 1:]
+
+
+def union(arrays: List[np.ndarray]) -> np.ndarray:
+    """Sorted, de-duplicated union of ascending id arrays."""
+    if not arrays:
+        return np.empty(0, dtype=np.uintc)
+    return arrays[0] if len(arrays) == 1 else np.unique(np.concatenate(arrays))
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self._postings: Dict[str, array] = {}  # term -> ascending doc ids
+        self._vocabulary: List[str] = []  # sorted lazily
+        self._vocabulary_sorted = True
+        self._deletes: Dict[str, List[str]] = {}  # deletion variant -> terms
+        self._doc_by_barcode: Dict[str, int] = {}
+        self._barcodes: List[str] = []
+        self._categories: List[str] = []
+        self._category_ids: Dict[str, int] = {}
+        self._alive = bytearray()
+        self._category = array("I")
+        self._recyclable = array("b")
+        self._score = array("i")
+        self._carbon = array("i")
+        self.dead = 0
+
+    def __len__(self):
+        return len(self._doc_by_barcode)
+
+    def add(self, product: dict):
+        """Index `product`, replacing any earlier version with its barcode."""
+        barcode = product["barcode"]
+        self.remove(barcode)
+        doc = len(self._barcodes)
+        self._doc_by_barcode[barcode] = doc
+        self._barcodes.append(barcode)
+        category = product.get("category") or ""
+        if category not in self._category_ids:
+            self._category_ids[category] = len(self._categories)
+            self._categories.append(category)
+        self._alive.append(1)
+        self._category.append(self._category_ids[category])
+        self._recyclable.append(1 if product.get("recyclable") else 0)
+        self._score.append(int(product.get("sustainabilityScore", 0)))
+        self._carbon.append(int(product.get("carbonFootprint", 0)))
+
+        terms = set()
+        for field in TEXT_FIELDS:
+            terms.update(tokenize(product.get(field) or ""))
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array("I")
+                self._vocabulary.append(term)
+                self._vocabulary_sorted = False
+                if len(term) >= MIN_FUZZY_LENGTH:
+                    for variant in [term] + deletions(term):
+                        self._deletes.setdefault(variant, []).append(term)
+            postings.append(doc)
+
+    def add_many(self, products: Iterable[dict]):
+        for product in products:
+            self.add(product)
+
+    def remove(self, barcode: str):
+        doc = self._doc_by_barcode.pop(barcode, None)
+        if doc is not None:
+            self._alive[doc] = 0
+            self.dead += 1
+
+    def _ids(self, terms: Iterable[str]) -> np.ndarray:
+        return union([np.frombuffer(self._postings[term], dtype=np.uintc) for term in terms])
+
+    def _matches(self, token: str) -> List[Tuple[int, np.ndarray]]:
+        """(relevance, doc ids) for each way `token` matches, best first."""
+        if not self._vocabulary_sorted:
+            self._vocabulary.sort()
+            self._vocabulary_sorted = True
+        exact = [token] if token in self._postings else []
+        prefixed = []
+        if len(token) >= MIN_PREFIX_LENGTH:
+            start = bisect_left(self._vocabulary, token)
+            stop = bisect_left(self._vocabulary, token + "\uffff", start)
+            prefixed = [term for term in self._vocabulary[start:stop] if term != token]
+        fuzzy = set()
+        if len(token) >= MIN_FUZZY_LENGTH:
+            for variant in [token] + deletions(token):
+                fuzzy.update(self._deletes.get(variant, ()))
+            fuzzy = {term for term in fuzzy if term != token and not term.startswith(token)
+                     and within_one_edit(token, term)}
+        return [(relevance, self._ids(terms))
+                for relevance, terms in ((EXACT, exact), (PREFIX, prefixed), (FUZZY, sorted(fuzzy))) if terms]
+
+    def search(
+        self,
+        query: str = "",
+        category: Optional[str] = None,
+        recyclable: Optional[bool] = None,
+        score_range: Tuple[Optional[int], Optional[int]] = (None, None),
+        carbon_range: Tuple[Optional[int], Optional[int]] = (None, None),
+        limit: int = 20,
+        offset: int = 0,
+    ) -> dict:
+        """Barcodes of one page of matches, best first, with the total and
+        facet counts. Each facet is counted with every filter but its own
+        applied, so clients can show what selecting another value would give."""
+        tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+        if tokens:
+            candidates = None
+            per_token = []
+            for token in tokens:
+                matches = self._matches(token)
+                ids = union([ids for _, ids in matches])
+                candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+                per_token.append(matches)
+                if not len(candidates):
+                    break
+            relevance = np.zeros(len(candidates), dtype=np.int64)
+            for matches in per_token:
+                best = np.zeros(len(candidates), dtype=np.int64)
+                for weight, ids in matches:
+                    best = np.maximum(best, np.isin(candidates, ids, assume_unique=True) * weight)
+                relevance += best
+        else:
+            candidates = np.arange(len(self._barcodes), dtype=np.uintc)
+            relevance = np.zeros(len(candidates), dtype=np.int64)
+
+        alive = np.frombuffer(self._alive, dtype=np.uint8)[candidates].astype(bool)
+        scores = np.frombuffer(self._score, dtype=np.intc)[candidates]
+        carbon = np.frombuffer(self._carbon, dtype=np.intc)[candidates]
+        categories = np.frombuffer(self._category, dtype=np.uintc)[candidates]
+        recyclables = np.frombuffer(self._recyclable, dtype=np.int8)[candidates].astype(bool)
+
+        mask = alive
+        for values, (low, high) in ((scores, score_range), (carbon, carbon_range)):
+            if low is not None:
+                mask = mask & (values >= low)
+            if high is not None:
+                mask = mask & (values <= high)
+        category_mask = mask if category is None else (
+            categories == self._category_ids[category] if category in self._category_ids else np.zeros_like(mask))
+        recyclable_mask = mask if recyclable is None else recyclables == recyclable
+
+        category_counts = np.bincount(categories[mask & recyclable_mask], minlength=len(self._categories))
+        recyclable_hits = recyclables[mask & category_mask]
+        facets = {
+            "category": {self._categories[index]: int(count)
+                         for index, count in enumerate(category_counts) if count},
+            "recyclable": {"true": int(recyclable_hits.sum()),
+                           "false": int(len(recyclable_hits) - recyclable_hits.sum())},
+        }
+
+        selected = mask & category_mask & recyclable_mask
+        hits = candidates[selected]
+        # One sortable key per hit: relevance, then score, then doc id (older
+        # first), so paging is deterministic even through ties
+        keys = ((relevance[selected] << 52)
+                | (np.clip(scores[selected], 0, (1 << 20) - 1).astype(np.int64) << 32)
+                | ((1 << 32) - 1 - hits.astype(np.int64)))
+        wanted = min(offset + limit, len(keys))
+        if wanted < len(keys):
+            top = np.argpartition(-keys, wanted - 1)[:wanted] if wanted else np.empty(0, dtype=np.int64)
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(-keys[top])][offset:offset + limit]
+        return {
+            "total": int(len(hits)),
+            "barcodes": [self._barcodes[doc] for doc in hits[top].tolist()],
+            "facets": facets,
+        }
+
+    def stats(self) -> dict:
+        return {"products": len(self), "terms": len(self._postings), "tombstones": self.dead}
@@ -1,30 +1,167 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import base64
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Annotated, List, Literal, Optional
 import uuid
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
+from pymongo.errors import DuplicateKeyError
 import jwt
 from jwt.exceptions import InvalidTokenError
 
+from alternatives import AlternativesIndex
+from analytics import analyze, iter_csv
+from cache import MISSING, TTLCache
+from challenges import ChallengeEngine
+from leaderboard import LOAD_FIELDS, Leaderboard
+from metrics import LoopLagMonitor, MetricsMiddleware, MongoCommandMetrics, Registry
+from responses import TrustedShape, dumps, json_response
+from rollups import RANGES, rollup_deltas, user_stats
+from search import ProductSearchIndex
+from scoring import calculate_level
+from snapshots import ResponseSnapshot
+from storage import PRIVATE_USER_FIELDS, create_storage
+from write_behind import FLUSH_WRITES, ScanWriteBuffer
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Prometheus metrics served at /metrics; gauges are registered further down
+metrics = Registry()
+request_count = metrics.counter(
+    "terraquest_http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status"))
+request_latency = metrics.histogram(
+    "terraquest_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+mongo_command_metrics = MongoCommandMetrics(
+    metrics.histogram("terraquest_mongo_command_duration_seconds", "MongoDB command latency.",
+                      ("collection", "command")),
+    metrics.counter("terraquest_mongo_command_failures_total", "Failed MongoDB commands.",
+                    ("collection", "command")),
+)
+loop_lag = LoopLagMonitor(metrics.histogram(
+    "terraquest_event_loop_lag_seconds", "How late the event loop wakes a sleeping task."))
+# How often to sample event-loop lag; 0 disables it
+LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', '0.5'))
+
+# Storage engine: "mongo" (MONGO_URL/DB_NAME, SCAN_LAYOUT) or "memory". The
+# Mongo client is only created on first use, at startup.
+storage = create_storage(event_listeners=[mongo_command_metrics])
+# Set at startup when SCAN_WRITE_BEHIND is enabled
+scan_buffer: Optional[ScanWriteBuffer] = None
+challenge_engine = ChallengeEngine(storage)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on a bounded worker pool so it never blocks the event loop;
+# 0 workers runs it inline (the old behaviour).
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '64'))
 SECRET_KEY = os.environ.get('SECRET_KEY', 'terraquest-secret-key-change-in-production')
 ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', str(7 * 24 * 60)))
+
+# Verified token -> claims, so repeat requests skip signature verification.
+# Entries never outlive the token's own exp.
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', '300'))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# Barcode -> product cache; unknown barcodes are cached (as None) for a
+# shorter TTL so a burst of bad scans doesn't hammer Mongo either.
+PRODUCT_CACHE_SIZE = int(os.environ.get('PRODUCT_CACHE_SIZE', '10000'))
+PRODUCT_CACHE_TTL = float(os.environ.get('PRODUCT_CACHE_TTL', '300'))
+PRODUCT_CACHE_NEGATIVE_TTL = float(os.environ.get('PRODUCT_CACHE_NEGATIVE_TTL', '30'))
+product_cache = TTLCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
+
+# Scan de-duplication: a repeated Idempotency-Key or, for requests without
+# one, the same barcode from the same user within SCAN_DEDUPE_SECONDS (0
+# disables the window), gets the original scan back instead of recording
+# another. Keys are stored on the scans themselves, unique per user; the
+# window is kept per process, in a bounded map of (userId, barcode) -> scan id.
+SCAN_DEDUPE_SECONDS = float(os.environ.get('SCAN_DEDUPE_SECONDS', '2'))
+SCAN_DEDUPE_CACHE_SIZE = int(os.environ.get('SCAN_DEDUPE_CACHE_SIZE', '100000'))
+recent_scans = TTLCache(SCAN_DEDUPE_CACHE_SIZE, SCAN_DEDUPE_SECONDS)
+# Scans being recorded by a request in this process, by id
+scans_in_flight = {}
+scans_suppressed = metrics.counter(
+    "terraquest_scans_suppressed_total", "Duplicate scans answered without a write.", ("reason",))
+
+# Leaderboard paging limits; with several workers, set
+# LEADERBOARD_RESYNC_SECONDS so each one periodically reloads the ranking
+# and picks up the others' writes (0 disables the resync).
+LEADERBOARD_PAGE_SIZE = int(os.environ.get('LEADERBOARD_PAGE_SIZE', '10'))
+LEADERBOARD_MAX_PAGE_SIZE = int(os.environ.get('LEADERBOARD_MAX_PAGE_SIZE', '100'))
+LEADERBOARD_RESYNC_SECONDS = float(os.environ.get('LEADERBOARD_RESYNC_SECONDS', '0'))
+
+# Keyset pagination; responses carry the next page's cursor in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PRODUCTS_PAGE_SIZE = int(os.environ.get('PRODUCTS_PAGE_SIZE', '1000'))
+SCANS_PAGE_SIZE = int(os.environ.get('SCANS_PAGE_SIZE', '100'))
+LEDGER_PAGE_SIZE = int(os.environ.get('LEDGER_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+
+# Product search runs on an in-process index built at startup and kept up to
+# date by this process's catalog writes; set SEARCH_INDEX_REFRESH_SECONDS to
+# also pick up writes from other processes (0 disables the rebuild).
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', '20'))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', '100'))
+SEARCH_INDEX_REFRESH_SECONDS = float(os.environ.get('SEARCH_INDEX_REFRESH_SECONDS', '0'))
+
+# Greener alternatives are precomputed per product and kept up to date the
+# same way; ALTERNATIVES_REFRESH_SECONDS re-reads the catalog but only
+# recomputes what changed. Scans of products scored below
+# ALTERNATIVES_BELOW_SCORE carry suggestions in the response.
+ALTERNATIVES_COUNT = int(os.environ.get('ALTERNATIVES_COUNT', '5'))
+ALTERNATIVES_BELOW_SCORE = int(os.environ.get('ALTERNATIVES_BELOW_SCORE', '70'))
+ALTERNATIVES_REFRESH_SECONDS = float(os.environ.get('ALTERNATIVES_REFRESH_SECONDS', '0'))
+
+# /readyz fails until startup has warmed everything up, and whenever the
+# database doesn't answer a ping within this many seconds
+READY_PING_TIMEOUT = float(os.environ.get('READY_PING_TIMEOUT', '2'))
+
+# Pre-encoded reference-data responses are rebuilt on local writes or, to
+# pick up writes from other processes, after SNAPSHOT_TTL seconds.
+SNAPSHOT_TTL = float(os.environ.get('SNAPSHOT_TTL', '60'))
+SNAPSHOT_GZIP = os.environ.get('SNAPSHOT_GZIP', 'true').lower() == 'true'
+
+# Optional write-behind for scans: acknowledged scans are flushed in
+# micro-batches, trading a few milliseconds of durability for far fewer writes
+SCAN_WRITE_BEHIND = os.environ.get('SCAN_WRITE_BEHIND', 'false').lower() == 'true'
+SCAN_FLUSH_INTERVAL_MS = float(os.environ.get('SCAN_FLUSH_INTERVAL_MS', '50'))
+SCAN_FLUSH_MAX_BATCH = int(os.environ.get('SCAN_FLUSH_MAX_BATCH', '500'))
+SCAN_BUFFER_MAX = int(os.environ.get('SCAN_BUFFER_MAX', '10000'))
+# Challenge counters of recently active users, kept in process while their
+# updates go through the write-behind buffer
+PROGRESS_CACHE_SIZE = int(os.environ.get('PROGRESS_CACHE_SIZE', '100000'))
+PROGRESS_CACHE_TTL = float(os.environ.get('PROGRESS_CACHE_TTL', '600'))
+progress_cache = TTLCache(PROGRESS_CACHE_SIZE, PROGRESS_CACHE_TTL)
+
+# Users allowed to read the /api/admin endpoints, comma-separated; with none
+# set they are closed to everyone (manage.py export-analytics still works)
+ADMIN_USER_IDS = frozenset(filter(None, (user_id.strip() for user_id in os.environ.get('ADMIN_USER_IDS', '').split(','))))
+# Scans per chunk read, joined and aggregated by the analytics endpoints
+ANALYTICS_CHUNK_SIZE = int(os.environ.get('ANALYTICS_CHUNK_SIZE', '50000'))
+
+# Opt-in fast responses: catalogue and reference documents read through our
+# own storage layer are shaped without response-model validation and encoded
+# with orjson. STRICT_RESPONSES validates them anyway (tests, benchmarks).
+FAST_RESPONSES = os.environ.get('FAST_RESPONSES', 'false').lower() == 'true'
+STRICT_RESPONSES = os.environ.get('STRICT_RESPONSES', 'false').lower() == 'true'
+
+# Upper bound on items accepted by POST /api/scans/batch (all for the caller)
+MAX_SCAN_BATCH = int(os.environ.get('MAX_SCAN_BATCH', '1000'))
 
 # Create the main app
 app = FastAPI()
@@ -68,12 +205,17 @@ class Scan(BaseModel):
     productBarcode: str
     productName: str
     score: int
+    carbonFootprint: int = 0
     scannedAt: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class ScanCreate(BaseModel):
-    userId: str
+    # Taken from the access token; if sent it must match the token's user
+    userId: Optional[str] = None
     productBarcode: str
 
+class ScanBatch(BaseModel):
+    scans: List[ScanCreate] = Field(min_length=1, max_length=MAX_SCAN_BATCH)
+
 class Challenge(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -93,34 +235,246 @@ class Reward(BaseModel):
     icon: str
 
 # Helper functions
+class BoundedExecutor:
+    """Runs blocking calls on a thread pool with a cap on queued work.
+
+    Once `workers + queue_size` calls are pending, new calls fail fast with a
+    503 instead of piling up behind the pool.
+    """
+
+    def __init__(self, workers: int, queue_size: int, name: str):
+        self.workers = workers
+        self.max_pending = workers + queue_size
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) if workers > 0 else None
+
+    async def run(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"}
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_pool = BoundedExecutor(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, "password-hash")
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict) -> str:
-    return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
-
-def calculate_level(eco_score: int) -> str:
-    if eco_score < 500:
-        return "Eco Rookie"
-    elif eco_score < 1000:
-        return "Green Explorer"
-    elif eco_score < 2000:
-        return "Eco Guardian"
-    elif eco_score < 3500:
-        return "Sustainability Champion"
-    else:
-        return "Green Legend"
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return jwt.encode({**data, "exp": expires_at}, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_access_token(token: str) -> dict:
+    claims = token_cache.get(token)
+    if claims is MISSING:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp", "user_id"]})
+        token_cache.set(token, claims, ttl=min(TOKEN_CACHE_TTL, claims["exp"] - time.time()))
+    elif claims["exp"] <= time.time():
+        token_cache.invalidate(token)
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return claims
+
+async def get_current_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> str:
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    try:
+        return decode_access_token(credentials.credentials)["user_id"]
+    except InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+def require_same_user(user_id: Optional[str], current_user_id: str):
+    if user_id is not None and user_id != current_user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed for this user")
+
+async def require_admin(current_user_id: str = Depends(get_current_user_id)) -> str:
+    if current_user_id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admins only")
+    return current_user_id
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def check_page_size(limit: Optional[int]):
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+def set_next_cursor(response: Response, page: List[dict], limit: int, cursor_fields):
+    """Set the next-page cursor header if there may be more results."""
+    if len(page) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*(page[-1][field] for field in cursor_fields))
+
+def ndjson_response(documents) -> StreamingResponse:
+    """Stream an async iterator of documents as newline-delimited JSON."""
+    async def lines():
+        async for document in documents:
+            yield dumps(document) + b"\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+leaderboard = Leaderboard(calculate_level)
+
+async def load_leaderboard():
+    leaderboard.load([user async for user in storage.users.iter_by_score(LOAD_FIELDS)])
+
+async def resync_leaderboard_forever(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_leaderboard()
+        except Exception:
+            logger.exception("Leaderboard resync failed")
+
+async def get_cached_product(barcode: str) -> Optional[dict]:
+    product = product_cache.get(barcode)
+    if product is MISSING:
+        product = await storage.products.get(barcode)
+        product_cache.set(barcode, product, ttl=None if product else PRODUCT_CACHE_NEGATIVE_TTL)
+    return product
+
+async def get_cached_products(barcodes) -> dict:
+    """Resolve many barcodes, fetching all cache misses with one $in query."""
+    products = {}
+    misses = []
+    for barcode in set(barcodes):
+        product = product_cache.get(barcode)
+        if product is MISSING:
+            misses.append(barcode)
+        elif product:
+            products[barcode] = product
+    if misses:
+        for product in await storage.products.get_many(misses):
+            products[product['barcode']] = product
+        for barcode in misses:
+            product = products.get(barcode)
+            product_cache.set(barcode, product, ttl=None if product else PRODUCT_CACHE_NEGATIVE_TTL)
+    return products
+
+def response_shape(model) -> TrustedShape:
+    # Without the fast path, always validate through the model
+    return TrustedShape(model, strict=STRICT_RESPONSES or not FAST_RESPONSES)
+
+product_shape = response_shape(Product)
+challenge_shape = response_shape(Challenge)
+reward_shape = response_shape(Reward)
+
+async def load_products_snapshot():
+    products = await storage.products.page(None, PRODUCTS_PAGE_SIZE)
+    headers = {}
+    if len(products) == PRODUCTS_PAGE_SIZE:
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(products[-1]['barcode'])
+    return product_shape.many(products), headers
+
+async def load_challenges_snapshot():
+    return challenge_shape.many(await storage.challenges.all()), {}
+
+async def load_rewards_snapshot():
+    return reward_shape.many(await storage.rewards.all()), {}
+
+products_snapshot = ResponseSnapshot(load_products_snapshot, SNAPSHOT_TTL, SNAPSHOT_GZIP)
+challenges_snapshot = ResponseSnapshot(load_challenges_snapshot, SNAPSHOT_TTL, SNAPSHOT_GZIP)
+rewards_snapshot = ResponseSnapshot(load_rewards_snapshot, SNAPSHOT_TTL, SNAPSHOT_GZIP)
+
+search_index = ProductSearchIndex()
+
+async def load_search_index():
+    """Build a fresh index from the whole catalog and swap it in."""
+    global search_index
+    index = ProductSearchIndex()
+    async for product in storage.products.iterate():
+        index.add(product)
+    search_index = index
+
+async def refresh_search_index_forever(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_search_index()
+        except Exception:
+            logger.exception("Search index refresh failed")
+
+alternatives_index = AlternativesIndex(ALTERNATIVES_COUNT)
+
+async def sync_alternatives():
+    """Bring the alternatives index in line with the catalog; only products
+    that changed or disappeared are recomputed."""
+    alternatives_index.sync([product async for product in storage.products.iterate()])
+
+async def refresh_alternatives_forever(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sync_alternatives()
+        except Exception:
+            logger.exception("Alternatives refresh failed")
+
+async def get_alternatives(barcode: str) -> List[dict]:
+    barcodes = alternatives_index.get(barcode)
+    products = await get_cached_products(barcodes)
+    # A product deleted since the index was refreshed simply drops out
+    return [products[alternative] for alternative in barcodes if alternative in products]
+
+def catalog_written(products: List[dict]):
+    """Hook for in-process catalog writes: reindex and drop stale caches."""
+    search_index.add_many(products)
+    alternatives_index.update(products)
+    invalidate_products([product['barcode'] for product in products])
+
+def invalidate_products(barcodes=None):
+    """Catalog write hook: drop the given barcodes, or everything if None."""
+    products_snapshot.invalidate()
+    if barcodes is None:
+        product_cache.clear()
+        return
+    for barcode in barcodes:
+        product_cache.invalidate(barcode)
 
 # Initialize mock data
 async def init_db():
-    # Check if products already exist
-    existing = await db.products.count_documents({})
-    if existing > 0:
-        return
-    
+    """Seed the demo catalog, challenges and rewards.
+
+    Each document is inserted only if its barcode or id is missing, so this
+    repairs partially seeded data, never overwrites edits, and is safe to run
+    from several workers starting at once.
+    """
     # Mock products
     products = [
         {"barcode": "1001", "name": "Coca-Cola", "carbonFootprint": 65, "recyclable": False, "ethicalScore": 40, "sustainabilityScore": 45, "brand": "Coca-Cola", "category": "Beverages"},
@@ -132,7 +486,6 @@ async def init_db():
         {"barcode": "1007", "name": "Organic Cotton T-Shirt", "carbonFootprint": 25, "recyclable": True, "ethicalScore": 90, "sustainabilityScore": 88, "brand": "GreenWear", "category": "Clothing"},
         {"barcode": "1008", "name": "Instant Noodles", "carbonFootprint": 70, "recyclable": False, "ethicalScore": 45, "sustainabilityScore": 50, "brand": "QuickEat", "category": "Food"},
     ]
-    await db.products.insert_many(products)
     
     # Mock challenges
     challenges = [
@@ -140,7 +493,6 @@ async def init_db():
         {"id": "c2", "title": "Plastic-Free Week", "description": "Avoid products with low recyclability", "requirement": "7 days of high-score products", "reward": 200, "icon": "recycle"},
         {"id": "c3", "title": "Green Guardian Quest", "description": "Reach 1000 EcoScore", "requirement": "Total EcoScore >= 1000", "reward": 300, "icon": "trophy"},
     ]
-    await db.challenges.insert_many(challenges)
     
     # Mock rewards
     rewards = [
@@ -149,13 +501,24 @@ async def init_db():
         {"id": "r3", "name": "Ocean Cleanup Support", "ngoName": "Blue Ocean Initiative", "description": "Support ocean plastic removal", "pointsRequired": 800, "icon": "waves"},
         {"id": "r4", "name": "₹100 Organic Store Voucher", "ngoName": "OrganicLife", "description": "Fresh organic produce", "pointsRequired": 600, "icon": "sprout"},
     ]
-    await db.rewards.insert_many(rewards)
+    
+    seeded = await asyncio.gather(
+        storage.products.seed(products), storage.challenges.seed(challenges), storage.rewards.seed(rewards)
+    )
+    # Only what was inserted: products already stored may have been edited
+    if seeded[0]:
+        catalog_written(seeded[0])
+    if seeded[1]:
+        challenges_snapshot.invalidate()
+    if seeded[2]:
+        rewards_snapshot.invalidate()
+    return {name: len(documents) for name, documents in zip(("products", "challenges", "rewards"), seeded)}
 
 # Auth endpoints
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
     # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    existing = await storage.users.get_by_email(user_data.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -164,100 +527,497 @@ async def register(user_data: UserCreate):
         email=user_data.email
     )
     user_dict = user.model_dump()
-    user_dict['password'] = hash_password(user_data.password)
+    user_dict['password'] = await hash_password_async(user_data.password)
     
-    await db.users.insert_one(user_dict)
+    try:
+        await storage.users.insert(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
+    leaderboard.update(user_dict)
     
     token = create_access_token({"user_id": user.id, "email": user.email})
     return {"user": user, "token": token}
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user['password']):
+    user = await storage.users.get_by_email(credentials.email)
+    if not user or not await verify_password_async(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    del user['password']
+    for field in PRIVATE_USER_FIELDS:
+        user.pop(field, None)
     token = create_access_token({"user_id": user['id'], "email": user['email']})
     return {"user": user, "token": token}
 
 # Product endpoints
 @api_router.get("/products", response_model=List[Product])
-async def get_products():
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
+async def get_products(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    format: Literal["json", "ndjson"] = "json"
+):
+    check_page_size(limit)
+    if not cursor and limit is None and format == "json":
+        # The default first page is what every client polls; serve it pre-encoded
+        return await products_snapshot.respond(request)
+    after = decode_cursor(cursor, 1)[0] if cursor else None
+    if format == "ndjson":
+        # Streams the whole catalog past the cursor unless a limit is given
+        return ndjson_response(storage.products.iterate(after, limit or 0))
+    limit = limit or PRODUCTS_PAGE_SIZE
+    products = await storage.products.page(after, limit)
+    if FAST_RESPONSES:
+        response = json_response(product_shape.many(products))
+        set_next_cursor(response, products, limit, ["barcode"])
+        return response
+    set_next_cursor(response, products, limit, ["barcode"])
     return products
 
+# Must be registered before /products/{barcode}, which would otherwise match
+@api_router.get("/products/search")
+async def search_products(
+    q: str = "",
+    category: Optional[str] = None,
+    recyclable: Optional[bool] = None,
+    minScore: Optional[int] = None,
+    maxScore: Optional[int] = None,
+    minCarbon: Optional[int] = None,
+    maxCarbon: Optional[int] = None,
+    limit: int = SEARCH_PAGE_SIZE,
+    offset: int = 0
+):
+    if limit < 1 or limit > SEARCH_MAX_PAGE_SIZE or offset < 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be between 1 and {SEARCH_MAX_PAGE_SIZE} and offset must not be negative"
+        )
+    result = search_index.search(
+        q, category, recyclable, (minScore, maxScore), (minCarbon, maxCarbon), limit, offset
+    )
+    products = await get_cached_products(result["barcodes"])
+    return {
+        "total": result["total"],
+        # A product deleted since the index was built simply drops out
+        "results": [product_shape.one(products[barcode]) for barcode in result["barcodes"] if barcode in products],
+        "facets": result["facets"],
+    }
+
 @api_router.get("/products/{barcode}", response_model=Product)
 async def get_product(barcode: str):
-    product = await db.products.find_one({"barcode": barcode}, {"_id": 0})
+    product = await get_cached_product(barcode)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
+    if FAST_RESPONSES:
+        return json_response(product_shape.one(product))
     return product
 
+@api_router.get("/products/{barcode}/alternatives", response_model=List[Product])
+async def get_product_alternatives(barcode: str):
+    if barcode not in alternatives_index and not await get_cached_product(barcode):
+        raise HTTPException(status_code=404, detail="Product not found")
+    alternatives = await get_alternatives(barcode)
+    if FAST_RESPONSES:
+        return json_response(product_shape.many(alternatives))
+    return alternatives
+
+async def get_live_user(user_id: str) -> Optional[dict]:
+    user = await storage.users.get_by_id(user_id)
+    if user and scan_buffer:
+        # Buffered scans aren't in the stored stats yet; the in-process ranking has them
+        entry = leaderboard.rank(user_id)
+        if entry:
+            user.update(ecoScore=entry['ecoScore'], totalScans=entry['totalScans'], level=entry['level'])
+    return user
+
+async def ingest_scans(user_id: str, scans: List[dict], stored: bool = False) -> List[str]:
+    """Store new scans (unless already `stored`) and update the user's stats,
+    ranking and challenges.
+
+    Returns the ids of the challenges these scans completed.
+    """
+    total_score = sum(scan['score'] for scan in scans)
+    if scan_buffer:
+        for scan in scans:
+            await scan_buffer.submit(scan, stored)
+        leaderboard.increment(user_id, total_score, len(scans))
+        # The ranking has the live score, and the challenge engine keeps the
+        # rest of what awards need, so this usually skips reading the user
+        user = leaderboard.rank(user_id) or await get_live_user(user_id)
+    else:
+        # Insert the scans (unless stored), apply one coalesced stats update
+        # and bump the daily rollups concurrently; each is a single atomic write.
+        writes = [
+            storage.users.apply_scan_stats(user_id, total_score, len(scans)),
+            storage.daily_stats.add_many(rollup_deltas(scans)),
+        ]
+        if not stored:
+            writes.append(storage.scans.insert(scans[0]) if len(scans) == 1 else storage.scans.insert_many(scans))
+        user, *_ = await asyncio.gather(*writes)
+    if not user:
+        return []
+    
+    user, awarded = await challenge_engine.record_scans(user_id, scans, user)
+    if scan_buffer:
+        for challenge in awarded:
+            leaderboard.increment(user_id, challenge['reward'])
+    else:
+        leaderboard.update(user)
+    return [challenge['id'] for challenge in awarded]
+
+async def store_keyed_scan(user_id: str, scan: dict) -> Optional[dict]:
+    """Store a scan carrying an Idempotency-Key; returns the original scan
+    instead if the key was used before."""
+    if await storage.scans.insert(scan):
+        return None
+    original = await storage.scans.get_by_idempotency_key(user_id, scan["idempotencyKey"])
+    if original is None:
+        # Only the id collided, which a fresh uuid4 never does
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Scan could not be recorded; retry")
+    if original["productBarcode"] != scan["productBarcode"]:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Idempotency-Key already used for a different scan")
+    scans_suppressed.inc(("idempotency_key",))
+    return original
+
+async def recent_scan(user_id: str, scan: dict) -> Optional[dict]:
+    """The user's scan of the same barcode within the dedupe window, if any;
+    otherwise opens a window for `scan`."""
+    if SCAN_DEDUPE_SECONDS <= 0:
+        return None
+    scan_id = recent_scans.get((user_id, scan["productBarcode"]))
+    if scan_id is MISSING:
+        # Set before the first await, so concurrent repeats see it
+        recent_scans.set((user_id, scan["productBarcode"]), scan["id"])
+        scans_in_flight[scan["id"]] = scan
+        return None
+    original = (scans_in_flight.get(scan_id) or (scan_buffer and scan_buffer.pending_scan(scan_id))
+                or await storage.scans.get(user_id, scan_id))
+    if original is None:
+        # Its request failed after opening the window
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="The original scan is still being recorded; retry shortly")
+    scans_suppressed.inc(("window",))
+    return original
+
 # Scan endpoints
 @api_router.post("/scans")
-async def create_scan(scan_data: ScanCreate):
+async def create_scan(
+    scan_data: ScanCreate,
+    user_id: str = Depends(get_current_user_id),
+    idempotency_key: Annotated[Optional[str], Header(alias="Idempotency-Key", min_length=1, max_length=128)] = None
+):
+    require_same_user(scan_data.userId, user_id)
+    
     # Get product
-    product = await db.products.find_one({"barcode": scan_data.productBarcode}, {"_id": 0})
+    product = await get_cached_product(scan_data.productBarcode)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Create scan
     scan = Scan(
-        userId=scan_data.userId,
+        userId=user_id,
         productBarcode=scan_data.productBarcode,
         productName=product['name'],
-        score=product['sustainabilityScore']
-    )
-    await db.scans.insert_one(scan.model_dump())
+        score=product['sustainabilityScore'],
+        carbonFootprint=product['carbonFootprint']
+    ).model_dump()
     
-    # Update user stats
-    user = await db.users.find_one({"id": scan_data.userId}, {"_id": 0})
-    if user:
-        new_total_scans = user['totalScans'] + 1
-        new_eco_score = user['ecoScore'] + product['sustainabilityScore']
-        new_level = calculate_level(new_eco_score)
+    # A client's Idempotency-Key says which requests are the same one, so it
+    # replaces the dedupe window
+    if idempotency_key:
+        scan["idempotencyKey"] = idempotency_key
+        original = await store_keyed_scan(user_id, scan)
+    else:
+        original = await recent_scan(user_id, scan)
+    completed = []
+    if original:
+        scan = original
+    else:
+        try:
+            completed = await ingest_scans(user_id, [scan], stored=idempotency_key is not None)
+        except Exception:
+            if recent_scans.get((user_id, scan["productBarcode"])) == scan["id"]:
+                recent_scans.invalidate((user_id, scan["productBarcode"]))
+            raise
+        finally:
+            scans_in_flight.pop(scan["id"], None)
+    alternatives = []
+    if product['sustainabilityScore'] < ALTERNATIVES_BELOW_SCORE:
+        alternatives = [product_shape.one(alternative)
+                        for alternative in await get_alternatives(scan_data.productBarcode)]
+    return {"scan": scan, "product": product, "completedChallenges": completed, "alternatives": alternatives,
+            "duplicate": original is not None}
+
+@api_router.post("/scans/batch")
+async def create_scans_batch(batch: ScanBatch, user_id: str = Depends(get_current_user_id)):
+    for item in batch.scans:
+        require_same_user(item.userId, user_id)
+    
+    # Resolve every barcode in the batch with at most one query
+    products = await get_cached_products(item.productBarcode for item in batch.scans)
+    
+    scans = []
+    results = []
+    for item in batch.scans:
+        product = products.get(item.productBarcode)
+        if not product:
+            results.append({"productBarcode": item.productBarcode, "status": "not_found"})
+            continue
         
-        await db.users.update_one(
-            {"id": scan_data.userId},
-            {"$set": {
-                "totalScans": new_total_scans,
-                "ecoScore": new_eco_score,
-                "level": new_level
-            }}
+        scan = Scan(
+            userId=user_id,
+            productBarcode=item.productBarcode,
+            productName=product['name'],
+            score=product['sustainabilityScore'],
+            carbonFootprint=product['carbonFootprint']
         )
+        scans.append(scan)
+        results.append({"productBarcode": item.productBarcode, "status": "created", "scan": scan})
     
-    return {"scan": scan, "product": product}
+    completed = await ingest_scans(user_id, [scan.model_dump() for scan in scans]) if scans else []
+    
+    return {
+        "created": len(scans),
+        "notFound": len(results) - len(scans),
+        "results": results,
+        "completedChallenges": completed,
+    }
 
 @api_router.get("/scans/user/{user_id}")
-async def get_user_scans(user_id: str):
-    scans = await db.scans.find({"userId": user_id}, {"_id": 0}).sort("scannedAt", -1).to_list(100)
+async def get_user_scans(
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    format: Literal["json", "ndjson"] = "json",
+    current_user_id: str = Depends(get_current_user_id)
+):
+    require_same_user(user_id, current_user_id)
+    check_page_size(limit)
+    before = tuple(decode_cursor(cursor, 2)) if cursor else None
+    if format == "ndjson":
+        return ndjson_response(storage.scans.iterate_for_user(user_id, before, limit or 0))
+    limit = limit or SCANS_PAGE_SIZE
+    scans = await storage.scans.page_for_user(user_id, before, limit)
+    set_next_cursor(response, scans, limit, ["scannedAt", "id"])
     return scans
 
 # User endpoints
 @api_router.get("/users/leaderboard")
-async def get_leaderboard():
-    users = await db.users.find({}, {"_id": 0, "password": 0}).sort("ecoScore", -1).limit(10).to_list(10)
-    return users
+async def get_leaderboard(limit: int = LEADERBOARD_PAGE_SIZE, offset: int = 0):
+    if limit < 1 or limit > LEADERBOARD_MAX_PAGE_SIZE or offset < 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be between 1 and {LEADERBOARD_MAX_PAGE_SIZE} and offset must not be negative"
+        )
+    return leaderboard.top(limit, offset)
+
+@api_router.get("/users/{user_id}/rank")
+async def get_user_rank(user_id: str):
+    entry = leaderboard.rank(user_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {**entry, "totalUsers": len(leaderboard)}
 
 @api_router.get("/users/{user_id}")
-async def get_user(user_id: str):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+async def get_user(user_id: str, current_user_id: str = Depends(get_current_user_id)):
+    require_same_user(user_id, current_user_id)
+    user = await get_live_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+@api_router.get("/users/{user_id}/stats")
+async def get_user_stats(
+    user_id: str,
+    range: Literal["7d", "30d", "90d", "365d"] = "7d",
+    current_user_id: str = Depends(get_current_user_id)
+):
+    require_same_user(user_id, current_user_id)
+    return {"range": range, **await user_stats(storage, user_id, RANGES[range])}
+
+@api_router.get("/users/{user_id}/ledger")
+async def get_user_ledger(
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    require_same_user(user_id, current_user_id)
+    check_page_size(limit)
+    before = tuple(decode_cursor(cursor, 2)) if cursor else None
+    limit = limit or LEDGER_PAGE_SIZE
+    entries = await storage.ledger.page_for_user(user_id, before, limit)
+    set_next_cursor(response, entries, limit, ["createdAt", "id"])
+    return entries
+
+@api_router.get("/users/{user_id}/challenges")
+async def get_user_challenges(user_id: str, current_user_id: str = Depends(get_current_user_id)):
+    require_same_user(user_id, current_user_id)
+    user = await get_live_user(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return await challenge_engine.progress(user_id, user)
+
 # Challenge endpoints
 @api_router.get("/challenges", response_model=List[Challenge])
-async def get_challenges():
-    challenges = await db.challenges.find({}, {"_id": 0}).to_list(100)
-    return challenges
+async def get_challenges(request: Request):
+    return await challenges_snapshot.respond(request)
 
 # Reward endpoints
 @api_router.get("/rewards", response_model=List[Reward])
-async def get_rewards():
-    rewards = await db.rewards.find({}, {"_id": 0}).to_list(100)
-    return rewards
+async def get_rewards(request: Request):
+    return await rewards_snapshot.respond(request)
+
+def replayed_redemption(entry: dict, reward_id: str) -> dict:
+    if entry["rewardId"] != reward_id:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Idempotency-Key already used for a different reward")
+    return {"entry": entry, "replayed": True}
+
+@api_router.post("/rewards/{reward_id}/redeem")
+async def redeem_reward(
+    reward_id: str,
+    user_id: str = Depends(get_current_user_id),
+    idempotency_key: Annotated[Optional[str], Header(alias="Idempotency-Key", min_length=1, max_length=128)] = None
+):
+    """Spend the reward's points and append the redemption to the ledger.
+
+    The points come off in one conditional update, so concurrent requests
+    can't spend more than the balance. Retries with the same Idempotency-Key
+    return the original redemption instead of spending again.
+    """
+    key = idempotency_key or str(uuid.uuid4())
+    recorded = await storage.ledger.get_by_key(user_id, key)
+    if recorded:
+        return replayed_redemption(recorded, reward_id)
+    reward = await storage.rewards.get(reward_id)
+    if not reward:
+        raise HTTPException(status_code=404, detail="Reward not found")
+    
+    points = reward['pointsRequired']
+    entry = {
+        "id": str(uuid.uuid4()),
+        "userId": user_id,
+        "type": "redeem",
+        "rewardId": reward_id,
+        "rewardName": reward['name'],
+        "points": -points,
+        "idempotencyKey": key,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+    }
+    user = await storage.users.spend_points(user_id, points, entry)
+    if user:
+        recorded = await storage.ledger.record({**entry, "balance": user['ecoScore']})
+        if scan_buffer:
+            leaderboard.increment(user_id, -points)
+        else:
+            leaderboard.update(user)
+        return {"entry": recorded, "replayed": False}
+    
+    # Either the key was spent by a request that didn't get to write the
+    # ledger (or is still writing it), or the balance doesn't cover the reward
+    spent = await storage.users.recent_redemption(user_id, key)
+    if spent:
+        return replayed_redemption(await storage.ledger.record(spent), reward_id)
+    if not await storage.users.get_by_id(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Not enough points")
+
+# Admin endpoints
+@api_router.get("/admin/query-plans", dependencies=[Depends(require_admin)])
+async def get_query_plans():
+    return await storage.explain_hot_queries()
+
+@api_router.get("/admin/analytics", dependencies=[Depends(require_admin)])
+async def get_analytics():
+    return await analyze(storage, ANALYTICS_CHUNK_SIZE)
+
+@api_router.get("/admin/analytics/scans.csv", dependencies=[Depends(require_admin)])
+async def export_scans_csv():
+    return StreamingResponse(iter_csv(storage, ANALYTICS_CHUNK_SIZE), media_type="text/csv",
+                             headers={"Content-Disposition": 'attachment; filename="scans.csv"'})
+
+@api_router.get("/admin/write-buffer", dependencies=[Depends(require_admin)])
+async def get_write_buffer_stats():
+    return {"enabled": scan_buffer is not None, **(scan_buffer.stats() if scan_buffer else {})}
+
+@api_router.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    return {
+        "products": product_cache.stats(),
+        "tokens": token_cache.stats(),
+        "recentScans": recent_scans.stats(),
+        "challengeProgress": progress_cache.stats(),
+        "snapshotRefreshes": {
+            "products": products_snapshot.refreshes,
+            "challenges": challenges_snapshot.refreshes,
+            "rewards": rewards_snapshot.refreshes,
+        },
+    }
+
+def cache_samples(field: str):
+    return [((name,), cache.stats()[field]) for name, cache in (
+        ("products", product_cache), ("tokens", token_cache), ("recent_scans", recent_scans),
+        ("challenge_progress", progress_cache))]
+
+metrics.callback("terraquest_cache_entries", "Entries held per cache.",
+                 lambda: cache_samples("size"), ("cache",))
+metrics.callback("terraquest_cache_hits_total", "Cache hits.",
+                 lambda: cache_samples("hits"), ("cache",), kind="counter")
+metrics.callback("terraquest_cache_misses_total", "Cache misses.",
+                 lambda: cache_samples("misses"), ("cache",), kind="counter")
+metrics.callback("terraquest_cache_evictions_total", "Entries evicted to stay under maxsize.",
+                 lambda: cache_samples("evictions"), ("cache",), kind="counter")
+metrics.callback("terraquest_snapshot_refreshes_total", "Pre-encoded snapshot rebuilds.",
+                 lambda: [(("products",), products_snapshot.refreshes), (("challenges",), challenges_snapshot.refreshes),
+                          (("rewards",), rewards_snapshot.refreshes)], ("snapshot",), kind="counter")
+metrics.callback("terraquest_password_pool_pending", "Password hashes running or queued.",
+                 lambda: [((), password_pool.pending)])
+metrics.callback("terraquest_password_pool_rejected_total", "Password hashes rejected with 503.",
+                 lambda: [((), password_pool.rejected)], kind="counter")
+metrics.callback("terraquest_scan_buffer_depth", "Scans waiting in the write-behind buffer.",
+                 lambda: [((), scan_buffer.depth if scan_buffer else 0)])
+metrics.callback("terraquest_scan_buffer_dropped_total",
+                 "Buffered scans (users, for challengeProgress) whose write was dropped after failed attempts, by write.",
+                 lambda: [((write,), scan_buffer.dropped[write] if scan_buffer else 0) for write in FLUSH_WRITES],
+                 ("write",), kind="counter")
+metrics.callback("terraquest_leaderboard_users", "Users in the in-memory leaderboard.",
+                 lambda: [((), len(leaderboard))])
+metrics.callback("terraquest_search_index_products", "Products in the search index.",
+                 lambda: [((), len(search_index))])
+metrics.callback("terraquest_search_index_tombstones", "Replaced or removed products still held by the search index.",
+                 lambda: [((), search_index.dead)])
+metrics.callback("terraquest_alternatives_products", "Products in the greener-alternatives index.",
+                 lambda: [((), len(alternatives_index))])
+metrics.callback("terraquest_startup_seconds", "How long this worker took to become ready.",
+                 lambda: [((), startup_seconds)] if startup_seconds is not None else [])
+metrics.callback("terraquest_event_loop_lag_last_seconds", "Most recent event-loop lag sample.",
+                 lambda: [((), loop_lag.last)])
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Probes: liveness only says the event loop answers; readiness also needs a
+# finished startup and a reachable database
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if startup_seconds is None:
+        return json_response({"status": "starting"}, status_code=503)
+    try:
+        await asyncio.wait_for(storage.ping(), READY_PING_TIMEOUT)
+    except Exception as error:
+        return json_response({"status": "unavailable", "detail": f"database: {error!r}"}, status_code=503)
+    return {"status": "ready", "startupSeconds": startup_seconds}
 
 app.include_router(api_router)
 
@@ -267,7 +1027,10 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+# Outermost, so the timings include CORS and error handling
+app.add_middleware(MetricsMiddleware, requests=request_count, latency=request_latency)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -275,11 +1038,64 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Long-running tasks started at startup and cancelled at shutdown
+background_tasks = []
+# Seconds from the start of startup to ready; None until then
+startup_seconds: Optional[float] = None
+
+async def load_challenges():
+    challenge_engine.load(await storage.challenges.all())
+
 @app.on_event("startup")
 async def startup_event():
-    await init_db()
-    logger.info("Database initialized with mock data")
+    global scan_buffer, startup_seconds
+    started = time.perf_counter()
+    # Indexes first: the unique ones are what make concurrent seeding safe
+    await storage.ensure_indexes()
+    indexed = time.perf_counter()
+    seeded = await init_db()
+    logger.info("Seeded missing reference data: %s", seeded)
+    seeded_at = time.perf_counter()
+    # Warm everything the first requests would otherwise pay for
+    await asyncio.gather(
+        load_challenges(), load_leaderboard(), load_search_index(), sync_alternatives(),
+        products_snapshot.warm(), challenges_snapshot.warm(), rewards_snapshot.warm(),
+    )
+    logger.info("Leaderboard loaded with %d users", len(leaderboard))
+    logger.info("Search index built: %s", search_index.stats())
+    logger.info("Alternatives computed: %s", alternatives_index.stats())
+    if SCAN_WRITE_BEHIND:
+        scan_buffer = ScanWriteBuffer(storage, SCAN_FLUSH_INTERVAL_MS / 1000, SCAN_FLUSH_MAX_BATCH, SCAN_BUFFER_MAX)
+        scan_buffer.start()
+        challenge_engine.buffer_progress(scan_buffer, progress_cache)
+        logger.info("Scan write-behind enabled (%g ms / %d scans)", SCAN_FLUSH_INTERVAL_MS, SCAN_FLUSH_MAX_BATCH)
+    if LOOP_LAG_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(loop_lag.run(LOOP_LAG_INTERVAL)))
+    if SEARCH_INDEX_REFRESH_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(refresh_search_index_forever(SEARCH_INDEX_REFRESH_SECONDS)))
+    if ALTERNATIVES_REFRESH_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(refresh_alternatives_forever(ALTERNATIVES_REFRESH_SECONDS)))
+    if LEADERBOARD_RESYNC_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(resync_leaderboard_forever(LEADERBOARD_RESYNC_SECONDS)))
+    for plan in await storage.explain_hot_queries():
+        if plan["collscan"]:
+            logger.warning("Query plan for %s uses COLLSCAN: %s", plan["query"], " <- ".join(plan["stages"]))
+        else:
+            logger.info("Query plan for %s: %s", plan["query"], " <- ".join(plan["stages"]))
+    finished = time.perf_counter()
+    startup_seconds = round(finished - started, 3)
+    logger.info("Ready in %.3fs (indexes %.3fs, seeding %.3fs, warm-up %.3fs)", startup_seconds,
+                indexed - started, seeded_at - indexed, finished - seeded_at)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    global startup_seconds
+    # Fail readiness while draining
+    startup_seconds = None
+    for task in background_tasks:
+        task.cancel()
+    if scan_buffer:
+        # Acknowledged scans must reach the database before the client closes
+        await scan_buffer.drain()
+    password_pool.shutdown()
+    storage.close()
\ No newline at end of file
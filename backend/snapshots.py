@@ -0,0 +1,109 @@
+import asyncio
+import gzip
+import hashlib
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from responses import dumps
+
+# A loader returns the (already validated) documents to serve and any extra
+# headers that belong with them.
+Loader = Callable[[], Awaitable[Tuple[List[dict], Dict[str, str]]]]
+
+# Loads per refresh; if invalidate() keeps landing mid-load, the last one is
+# served but left stale, so the next request loads again
+MAX_LOADS = 3
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip; q=0 refuses a coding."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+class ResponseSnapshot:
+    """Pre-encoded JSON response for reference data that rarely changes.
+
+    The body is encoded (and optionally gzipped) once per refresh and served
+    with a strong ETag, so repeat requests cost neither a query nor a
+    re-serialization and conditional requests get a bodiless 304. The snapshot
+    is rebuilt after `invalidate()` (in-process writes) or once `ttl` seconds
+    have passed (writes made elsewhere). A load that an `invalidate()` lands
+    in the middle of may predate the write, so it is redone, up to MAX_LOADS
+    times.
+    """
+
+    def __init__(self, loader: Loader, ttl: float, compress: bool = True):
+        self._loader = loader
+        self.ttl = ttl
+        self.compress = compress
+        self._lock = asyncio.Lock()
+        self._expires_at = 0.0
+        # Bumped by invalidate(); a load started under an older one is stale
+        self._generation = 0
+        self._body = b""
+        self._gzipped = None
+        self._etag = ""
+        self._headers = {}
+        self.refreshes = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._expires_at = 0.0
+
+    async def _refresh(self):
+        async with self._lock:
+            # Another request may have refreshed while we waited for the lock
+            if self._expires_at > time.monotonic():
+                return
+            for _ in range(MAX_LOADS):
+                generation = self._generation
+                documents, headers = await self._loader()
+                fresh = generation == self._generation
+                if fresh:
+                    break
+            body = dumps(documents)
+            self._body = body
+            self._gzipped = gzip.compress(body, compresslevel=6) if self.compress else None
+            self._etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+            self._headers = headers
+            self._expires_at = time.monotonic() + self.ttl if fresh else 0.0
+            self.refreshes += 1
+
+    async def warm(self):
+        """Build the snapshot now if it is stale, e.g. before taking traffic."""
+        if self._expires_at <= time.monotonic():
+            await self._refresh()
+
+    async def respond(self, request: Request) -> Response:
+        await self.warm()
+
+        use_gzip = self._gzipped is not None and accepts_gzip(request.headers.get("accept-encoding", ""))
+        # Each representation needs its own strong validator
+        etag = self._etag[:-1] + '-gzip"' if use_gzip else self._etag
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding", **self._headers}
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or etag in tags:
+                return Response(status_code=304, headers=headers)
+
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(self._gzipped, media_type="application/json", headers=headers)
+        return Response(self._body, media_type="application/json", headers=headers)
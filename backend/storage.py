@@ -0,0 +1,1349 @@
+"""Storage engines behind the API handlers.
+
+Handlers never touch a driver directly; they go through a `Storage`, which
+groups one repository per collection. Two engines implement the same
+repository methods:
+
+- "mongo": Motor against MongoDB, the production engine.
+- "memory": plain dicts plus sorted indexes for exactly the queries the app
+  runs, for unit tests, benchmarks and profiling without a database.
+
+`create_storage()` picks the engine from STORAGE_ENGINE. The mongo engine can
+store scans one document per scan ("documents") or bucketed per user and day
+("buckets"), chosen by SCAN_LAYOUT.
+"""
+import asyncio
+import copy
+import os
+import uuid
+from datetime import datetime, timezone
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bson import Binary
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from scoring import calculate_level, scan_stats_update
+
+# Keyset position in a user's scan history: (scannedAt, id)
+ScanKey = Tuple[str, str]
+# One daily rollup: (userId, day as YYYY-MM-DD)
+RollupKey = Tuple[str, str]
+ROLLUP_FIELDS = ("scans", "scoreTotal", "carbonFootprint")
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        """The full user document, password hash included."""
+
+    @abstractmethod
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        """The user document without its password hash."""
+
+    @abstractmethod
+    async def insert(self, user: dict):
+        """Insert a new user; raises DuplicateKeyError on a taken email or id."""
+
+    @abstractmethod
+    async def apply_scan_stats(self, user_id: str, score: int, scans: int = 1) -> Optional[dict]:
+        """Atomically add scans/score, re-derive the level, return the updated user."""
+
+    @abstractmethod
+    async def apply_scan_stats_many(self, deltas: Dict[str, Tuple[int, int]], flush_id: Optional[str] = None):
+        """apply_scan_stats for many users at once: userId -> (score, scans).
+
+        Users that already took an update under `flush_id` are skipped, so a
+        write-behind flush can be retried without counting anything twice.
+        """
+
+    @abstractmethod
+    async def award_challenge(self, user_id: str, challenge_id: str, points: int) -> Optional[dict]:
+        """Add a challenge's reward points unless already awarded.
+
+        Returns the updated user, or None if the challenge had already been
+        awarded (or the user doesn't exist).
+        """
+
+    @abstractmethod
+    async def spend_points(self, user_id: str, points: int, entry: dict) -> Optional[dict]:
+        """Take `points` from the user's ecoScore in one conditional update,
+        re-deriving the level, unless the score doesn't cover them or
+        entry["idempotencyKey"] was already spent.
+
+        The ledger `entry` is kept on the user, with the resulting balance,
+        among its RECENT_REDEMPTIONS, so a request interrupted before writing
+        it to the ledger can be completed by a retry. Returns the updated
+        user, or None if nothing was spent.
+        """
+
+    @abstractmethod
+    async def recent_redemption(self, user_id: str, key: str) -> Optional[dict]:
+        """The entry spend_points kept for idempotency `key`, if still recent."""
+
+    @abstractmethod
+    def iter_by_score(self, fields: Iterable[str]) -> AsyncIterator[dict]:
+        """Every user projected to `fields`, highest ecoScore first."""
+
+
+class ProductRepository(ABC):
+    @abstractmethod
+    async def get(self, barcode: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def get_many(self, barcodes: Iterable[str]) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def page(self, after: Optional[str], limit: int) -> List[dict]:
+        """Up to `limit` products ordered by barcode, starting past `after`."""
+
+    @abstractmethod
+    def iterate(self, after: Optional[str] = None, limit: int = 0) -> AsyncIterator[dict]:
+        """Like page(), but streamed; a limit of 0 means no limit."""
+
+    @abstractmethod
+    async def count(self) -> int:
+        ...
+
+    @abstractmethod
+    async def insert_many(self, products: List[dict]):
+        ...
+
+    @abstractmethod
+    async def upsert_many(self, products: List[dict]) -> List[Tuple[int, str]]:
+        """Insert or replace each product by barcode, in no particular order.
+
+        Returns (index, reason) for any product that could not be written.
+        """
+
+    @abstractmethod
+    async def seed(self, products: List[dict]) -> List[dict]:
+        """Insert the products whose barcode isn't stored yet, leaving the
+        others untouched; returns the ones inserted."""
+
+
+class ScanRepository(ABC):
+    """Scans may carry the client's "idempotencyKey", unique per user."""
+
+    @abstractmethod
+    async def insert(self, scan: dict) -> bool:
+        """Store a scan, unless one with the same id, or the same user and
+        idempotency key, is already stored; returns whether it was stored."""
+
+    @abstractmethod
+    async def insert_many(self, scans: List[dict]):
+        """Store scans, skipping any whose id is already stored, so a retry
+        after a partial failure doesn't duplicate the ones that got in."""
+
+    @abstractmethod
+    async def get(self, user_id: str, scan_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def get_by_idempotency_key(self, user_id: str, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def page_for_user(self, user_id: str, before: Optional[ScanKey], limit: int) -> List[dict]:
+        """Up to `limit` of the user's scans, newest first, older than `before`."""
+
+    @abstractmethod
+    def iterate_for_user(self, user_id: str, before: Optional[ScanKey] = None, limit: int = 0) -> AsyncIterator[dict]:
+        """Like page_for_user(), but streamed; a limit of 0 means no limit."""
+
+    @abstractmethod
+    def iterate_by_user(self) -> AsyncIterator[dict]:
+        """Every scan, grouped by user (maintenance jobs only)."""
+
+    @abstractmethod
+    def iterate_chunks(self, chunk_size: int, fields: Optional[Iterable[str]] = None) -> AsyncIterator[List[dict]]:
+        """Every scan in storage order, `chunk_size` at a time (exports only).
+
+        `fields` is a hint: layouts that can read less return only those.
+        """
+
+
+class DocumentListRepository(ABC):
+    """Small reference collections (challenges, rewards) read as a whole."""
+
+    @abstractmethod
+    async def all(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def insert_many(self, documents: List[dict]):
+        ...
+
+    @abstractmethod
+    async def get(self, document_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def seed(self, documents: List[dict]) -> List[dict]:
+        """Insert the documents whose id isn't stored yet, leaving the others
+        untouched; returns the ones inserted."""
+
+
+class ChallengeProgressRepository(ABC):
+    """Per-user challenge counters, advanced with atomic server-side updates."""
+
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[dict]:
+        """{"userId", "rules": {challengeId: state}} or None."""
+
+    @abstractmethod
+    async def advance(self, user_id: str, increments: Dict[str, int], maxima: Dict[str, str],
+                      unset: Iterable[str] = ()) -> dict:
+        """Add `increments` to, and raise to at least `maxima`, the counters
+        at these dotted paths under "rules", creating any that are missing,
+        and drop the stale counters at the `unset` paths.
+
+        Both operations commute, so concurrent scans never lose each other's
+        progress. Returns the updated progress document.
+        """
+
+    @abstractmethod
+    async def advance_many(self, updates: Dict[str, Tuple[Dict[str, int], Dict[str, str], Iterable[str]]],
+                           flush_id: Optional[str] = None):
+        """advance() for many users at once: userId -> (increments, maxima, unset).
+
+        Users whose progress already took an update under `flush_id` are
+        skipped, as in UserRepository.apply_scan_stats_many.
+        """
+
+
+def apply_progress(rules: dict, increments: Dict[str, int], maxima: Dict[str, str], unset: Iterable[str] = ()):
+    """ChallengeProgressRepository.advance() on a "rules" dict in memory."""
+    for path in unset:
+        *parents, field = path.split(".")
+        node = rules
+        for parent in parents:
+            node = node.get(parent, {})
+        node.pop(field, None)
+    for paths, combine in ((increments, lambda old, new: (old or 0) + new),
+                           (maxima, lambda old, new: new if old is None or new > old else old)):
+        for path, value in paths.items():
+            *parents, field = path.split(".")
+            node = rules
+            for parent in parents:
+                node = node.setdefault(parent, {})
+            node[field] = combine(node.get(field), value)
+
+
+class LedgerRepository(ABC):
+    """Append-only points ledger; at most one entry per (userId, idempotencyKey)."""
+
+    @abstractmethod
+    async def record(self, entry: dict) -> dict:
+        """Append `entry` unless its user already has one with the same
+        idempotency key; returns the stored entry either way."""
+
+    @abstractmethod
+    async def get_by_key(self, user_id: str, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def page_for_user(self, user_id: str, before: Optional[ScanKey], limit: int) -> List[dict]:
+        """Up to `limit` of the user's entries, newest first, older than
+        `before` (a (createdAt, id) key)."""
+
+
+class DailyStatsRepository(ABC):
+    """Per-user, per-day scan rollups ({userId, day, scans, scoreTotal, carbonFootprint})."""
+
+    @abstractmethod
+    async def add_many(self, deltas: Dict[RollupKey, dict], flush_id: Optional[str] = None):
+        """Add each delta's ROLLUP_FIELDS to its day, creating days as needed.
+
+        Days that already took an update under `flush_id` are skipped.
+        """
+
+    @abstractmethod
+    async def replace_many(self, rollups: List[dict]):
+        """Overwrite whole days with the given totals (backfill)."""
+
+    @abstractmethod
+    async def range(self, user_id: str, start: str, end: str) -> List[dict]:
+        """The user's rollups for days in [start, end], oldest first."""
+
+
+class Storage(ABC):
+    engine: str
+    users: UserRepository
+    products: ProductRepository
+    scans: ScanRepository
+    challenges: DocumentListRepository
+    rewards: DocumentListRepository
+    challenge_progress: ChallengeProgressRepository
+    daily_stats: DailyStatsRepository
+    ledger: LedgerRepository
+
+    async def ensure_indexes(self):
+        """Create whatever indexes the engine needs; idempotent."""
+
+    @abstractmethod
+    async def ping(self):
+        """Round-trip to the database; raises if it can't be reached."""
+
+    @abstractmethod
+    async def explain_hot_queries(self) -> List[dict]:
+        """The plan of each query the handlers run, flagging full scans."""
+
+    @abstractmethod
+    async def reset(self):
+        """Delete all data (tests and benchmarks only)."""
+
+    def close(self):
+        pass
+
+
+# MongoDB engine
+
+# Indexes backing every hot query; create_indexes is a no-op for indexes that
+# already exist with the same spec, so this is safe to run on every startup.
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("ecoScore", DESCENDING)], name="ecoScore_desc"),
+    ],
+    "products": [
+        IndexModel([("barcode", ASCENDING)], unique=True, name="barcode_unique"),
+    ],
+    # Also what makes concurrent seeding from several workers safe
+    "challenges": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "rewards": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "scans": [
+        IndexModel(
+            [("userId", ASCENDING), ("scannedAt", DESCENDING), ("id", DESCENDING)],
+            name="userId_scannedAt_id"
+        ),
+        # What makes inserting the same scan twice a no-op
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        # ...and recording a retried request twice
+        IndexModel([("userId", ASCENDING), ("idempotencyKey", ASCENDING)], unique=True,
+                   partialFilterExpression={"idempotencyKey": {"$type": "string"}},
+                   name="userId_idempotencyKey_unique"),
+    ],
+    "challenge_progress": [
+        IndexModel([("userId", ASCENDING)], unique=True, name="userId_unique"),
+    ],
+    "scan_buckets": [
+        IndexModel([("userId", ASCENDING), ("last", DESCENDING)], name="userId_last"),
+        # No scan id in two buckets: a re-pushed scan can't open a new one
+        IndexModel([("entries.i", ASCENDING)], unique=True, name="entries_i_unique"),
+        # No idempotency key twice per user. Kept apart from the entries, so
+        # buckets without keyed scans stay out of the index
+        IndexModel([("userId", ASCENDING), ("keys", ASCENDING)], unique=True,
+                   partialFilterExpression={"keys": {"$exists": True}}, name="userId_keys_unique"),
+    ],
+    "daily_stats": [
+        IndexModel([("userId", ASCENDING), ("day", ASCENDING)], unique=True, name="userId_day_unique"),
+    ],
+    "ledger": [
+        IndexModel([("userId", ASCENDING), ("idempotencyKey", ASCENDING)], unique=True,
+                   name="userId_idempotencyKey_unique"),
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING), ("id", DESCENDING)],
+                   name="userId_createdAt_id"),
+    ],
+}
+
+# (name, collection, filter, sort, limit) for each query the handlers run
+HOT_QUERIES = [
+    ("user by email", "users", {"email": ""}, None, 1),
+    ("user by id", "users", {"id": ""}, None, 1),
+    ("product by barcode", "products", {"barcode": ""}, None, 1),
+    ("scans by user", "scans", {"userId": ""}, [("scannedAt", DESCENDING), ("id", DESCENDING)], 100),
+    ("scan by id", "scans", {"id": "", "userId": ""}, None, 1),
+    ("scan by idempotency key", "scans", {"userId": "", "idempotencyKey": ""}, None, 1),
+    ("leaderboard", "users", {}, [("ecoScore", DESCENDING)], 10),
+    ("challenge progress by user", "challenge_progress", {"userId": ""}, None, 1),
+    ("daily stats by user", "daily_stats", {"userId": "", "day": {"$gte": "", "$lte": ""}}, [("day", ASCENDING)], 366),
+    ("ledger by user", "ledger", {"userId": ""}, [("createdAt", DESCENDING), ("id", DESCENDING)], 100),
+]
+
+# Replace the scans queries of the same name when scans are bucketed
+BUCKETED_SCANS_QUERIES = {
+    "scans by user": ("scan buckets by user", "scan_buckets", {"userId": ""}, [("last", DESCENDING)], 10),
+    "scan by id": ("scan bucket by scan id", "scan_buckets", {"entries.i": "", "userId": ""}, None, 1),
+    "scan by idempotency key": ("scan bucket by idempotency key", "scan_buckets", {"userId": "", "keys": ""}, None, 1),
+}
+
+# Bookkeeping kept on user documents that no response should carry
+PRIVATE_USER_FIELDS = ("password", "recentRedemptions", "recentFlushes")
+PUBLIC_USER = {"_id": 0, **{field: 0 for field in PRIVATE_USER_FIELDS}}
+
+# Redemptions kept on each user document for completing interrupted requests
+RECENT_REDEMPTIONS = 50
+# Write-behind flush ids kept on each document a flush updates; a retried
+# flush skips the documents that already list it
+RECENT_FLUSHES = 32
+
+SCAN_LAYOUTS = ("documents", "buckets")
+# Most scans a bucket holds; a user's busier days spill into more buckets
+SCAN_BUCKET_SIZE = int(os.environ.get("SCAN_BUCKET_SIZE", "200"))
+
+
+def plan_stages(plan: dict) -> List[str]:
+    stages = []
+    while plan:
+        stages.append(plan.get("stage", "?"))
+        children = plan.get("inputStages") or [plan.get("inputStage")]
+        for child in children[1:]:
+            stages.extend(plan_stages(child))
+        plan = children[0]
+    return stages
+
+
+def scans_before_query(user_id: str, before: Optional[ScanKey], time_field: str = "scannedAt") -> dict:
+    query = {"userId": user_id}
+    if before:
+        timestamp, document_id = before
+        query["$or"] = [
+            {time_field: {"$lt": timestamp}},
+            {time_field: timestamp, "id": {"$lt": document_id}},
+        ]
+    return query
+
+
+def flush_guard(flush_id: Optional[str]) -> Tuple[dict, dict]:
+    """Filter and update additions that make an update a no-op on a document
+    it was already applied to under `flush_id` (none without one)."""
+    if flush_id is None:
+        return {}, {}
+    return ({"recentFlushes": {"$ne": flush_id}},
+            {"$push": {"recentFlushes": {"$each": [flush_id], "$slice": -RECENT_FLUSHES}}})
+
+
+def flush_guard_stage(flush_id: str) -> dict:
+    """flush_guard's update as a pipeline stage."""
+    return {"$set": {"recentFlushes": {"$slice": [
+        {"$concatArrays": [{"$ifNull": ["$recentFlushes", []]}, [flush_id]]}, -RECENT_FLUSHES
+    ]}}}
+
+
+async def bulk_upsert(collection, writes: List[UpdateOne]):
+    """Run unordered upserts whose filters are an equality on a unique index
+    plus a flush_guard.
+
+    An upsert whose filter misses an existing document collides with the
+    unique index instead: either a concurrent upsert created the document
+    first, or the document already took this flush. Those writes are tried
+    once more, which updates the document in the first case and collides
+    again, leaving it alone, in the second.
+    """
+    for attempt in range(2):
+        try:
+            await collection.bulk_write(writes, ordered=False)
+            return
+        except BulkWriteError as error:
+            failures = error.details.get("writeErrors", [])
+            if any(failure["code"] != 11000 for failure in failures):
+                raise
+            if attempt:
+                return
+            writes = [writes[failure["index"]] for failure in failures]
+
+
+class MongoRepository:
+    def __init__(self, storage: "MongoStorage", name: str):
+        self._storage = storage
+        self._name = name
+
+    @property
+    def collection(self):
+        return self._storage.db[self._name]
+
+    async def _seed(self, documents: List[dict], key: str) -> List[dict]:
+        if not documents:
+            return []
+        writes = [UpdateOne({key: document[key]}, {"$setOnInsert": dict(document)}, upsert=True)
+                  for document in documents]
+        try:
+            result = await self.collection.bulk_write(writes, ordered=False)
+            inserted = result.upserted_ids
+        except BulkWriteError as error:
+            # Duplicate keys mean another worker inserted the same document
+            # first, which is exactly the outcome we wanted
+            if any(failure["code"] != 11000 for failure in error.details.get("writeErrors", [])):
+                raise
+            inserted = {upsert["index"]: upsert["_id"] for upsert in error.details.get("upserted", [])}
+        return [documents[index] for index in sorted(inserted)]
+
+
+class MongoUserRepository(MongoRepository, UserRepository):
+    async def get_by_email(self, email):
+        return await self.collection.find_one({"email": email}, {"_id": 0})
+
+    async def get_by_id(self, user_id):
+        return await self.collection.find_one({"id": user_id}, PUBLIC_USER)
+
+    async def insert(self, user):
+        await self.collection.insert_one(dict(user))
+
+    async def apply_scan_stats(self, user_id, score, scans=1):
+        return await self.collection.find_one_and_update(
+            {"id": user_id},
+            scan_stats_update(score, scans),
+            projection=PUBLIC_USER,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def apply_scan_stats_many(self, deltas, flush_id=None):
+        if not deltas:
+            return
+        guard, _ = flush_guard(flush_id)
+        stages = [flush_guard_stage(flush_id)] if flush_id else []
+        await self.collection.bulk_write(
+            [UpdateOne({"id": user_id, **guard}, scan_stats_update(score, scans) + stages)
+             for user_id, (score, scans) in deltas.items()],
+            ordered=False
+        )
+
+    async def award_challenge(self, user_id, challenge_id, points):
+        return await self.collection.find_one_and_update(
+            {"id": user_id, "awardedChallenges": {"$ne": challenge_id}},
+            [{"$set": {"awardedChallenges": {
+                "$concatArrays": [{"$ifNull": ["$awardedChallenges", []]}, [challenge_id]]
+            }}}] + scan_stats_update(points, 0),
+            projection=PUBLIC_USER,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def spend_points(self, user_id, points, entry):
+        # User-supplied strings must not be read as field paths or operators
+        kept = {field: {"$literal": value} for field, value in entry.items()}
+        return await self.collection.find_one_and_update(
+            {"id": user_id, "ecoScore": {"$gte": points},
+             "recentRedemptions.idempotencyKey": {"$ne": entry["idempotencyKey"]}},
+            scan_stats_update(-points, 0) + [{"$set": {"recentRedemptions": {"$slice": [{"$concatArrays": [
+                {"$ifNull": ["$recentRedemptions", []]}, [{**kept, "balance": "$ecoScore"}]
+            ]}, -RECENT_REDEMPTIONS]}}}],
+            projection=PUBLIC_USER,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def recent_redemption(self, user_id, key):
+        user = await self.collection.find_one(
+            {"id": user_id}, {"_id": 0, "recentRedemptions": {"$elemMatch": {"idempotencyKey": key}}}
+        )
+        return user["recentRedemptions"][0] if user and user.get("recentRedemptions") else None
+
+    async def iter_by_score(self, fields):
+        projection = {"_id": 0, **{field: 1 for field in fields}}
+        async for user in self.collection.find({}, projection).sort("ecoScore", DESCENDING):
+            yield user
+
+
+class MongoProductRepository(MongoRepository, ProductRepository):
+    async def get(self, barcode):
+        return await self.collection.find_one({"barcode": barcode}, {"_id": 0})
+
+    async def get_many(self, barcodes):
+        return await self.collection.find({"barcode": {"$in": list(barcodes)}}, {"_id": 0}).to_list(None)
+
+    def _find(self, after, limit):
+        query = {"barcode": {"$gt": after}} if after else {}
+        return self.collection.find(query, {"_id": 0}).sort("barcode", ASCENDING).limit(limit)
+
+    async def page(self, after, limit):
+        return await self._find(after, limit).to_list(limit)
+
+    async def iterate(self, after=None, limit=0):
+        async for product in self._find(after, limit):
+            yield product
+
+    async def count(self):
+        return await self.collection.count_documents({})
+
+    async def insert_many(self, products):
+        await self.collection.insert_many([dict(product) for product in products])
+
+    async def upsert_many(self, products):
+        if not products:
+            return []
+        try:
+            await self.collection.bulk_write(
+                [ReplaceOne({"barcode": product["barcode"]}, dict(product), upsert=True) for product in products],
+                ordered=False
+            )
+        except BulkWriteError as error:
+            return [(failure["index"], failure["errmsg"]) for failure in error.details.get("writeErrors", [])]
+        return []
+
+    async def seed(self, products):
+        return await self._seed(products, "barcode")
+
+
+class MongoScanRepository(MongoRepository, ScanRepository):
+    async def insert(self, scan):
+        try:
+            await self.collection.insert_one(dict(scan))
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def insert_many(self, scans):
+        try:
+            await self.collection.insert_many([dict(scan) for scan in scans], ordered=False)
+        except BulkWriteError as error:
+            # Unordered, so everything but the duplicates went in
+            if any(failure["code"] != 11000 for failure in error.details.get("writeErrors", [])):
+                raise
+
+    async def get(self, user_id, scan_id):
+        return await self.collection.find_one({"id": scan_id, "userId": user_id}, {"_id": 0})
+
+    async def get_by_idempotency_key(self, user_id, key):
+        return await self.collection.find_one({"userId": user_id, "idempotencyKey": key}, {"_id": 0})
+
+    def _find(self, user_id, before, limit):
+        return self.collection.find(scans_before_query(user_id, before), {"_id": 0}).sort(
+            [("scannedAt", DESCENDING), ("id", DESCENDING)]
+        ).limit(limit)
+
+    async def page_for_user(self, user_id, before, limit):
+        return await self._find(user_id, before, limit).to_list(limit)
+
+    async def iterate_for_user(self, user_id, before=None, limit=0):
+        async for scan in self._find(user_id, before, limit):
+            yield scan
+
+    async def iterate_by_user(self):
+        # Same order as userId_scannedAt_id, so this walks the index
+        cursor = self.collection.find({}, {"_id": 0}).sort(
+            [("userId", ASCENDING), ("scannedAt", DESCENDING), ("id", DESCENDING)]
+        )
+        async for scan in cursor:
+            yield scan
+
+    async def iterate_chunks(self, chunk_size, fields=None):
+        projection = {"_id": 0, **{field: 1 for field in fields or ()}}
+        cursor = self.collection.find({}, projection).batch_size(chunk_size)
+        while chunk := await cursor.to_list(chunk_size):
+            yield chunk
+
+
+def compact_scan_id(scan_id: str):
+    try:
+        return Binary.from_uuid(uuid.UUID(scan_id))
+    except ValueError:
+        return scan_id
+
+
+def bson_time(scanned_at: str) -> datetime:
+    return datetime.fromisoformat(scanned_at).astimezone(timezone.utc)
+
+
+def bucket_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def iso_time(value: datetime) -> str:
+    # Motor hands back naive UTC datetimes, truncated to milliseconds
+    return value.replace(tzinfo=timezone.utc).isoformat(timespec="milliseconds")
+
+
+class MongoBucketedScanRepository(MongoRepository, ScanRepository):
+    """Scans bucketed per user and UTC day.
+
+    A bucket is {userId, day, first, last, count, entries}; each entry keeps
+    only what can't be derived: {i: UUID as 16-byte binary, b: barcode,
+    s: score, c: carbonFootprint, t: BSON datetime, k: idempotency key if
+    any}; the bucket also lists its entries' keys in "keys", which is what
+    keeps them unique per user. The product name is
+    joined from the catalogue on read. BSON datetimes have millisecond
+    precision, so scannedAt comes back truncated to milliseconds.
+    """
+
+    def _entry(self, scan: dict) -> dict:
+        return {
+            "i": compact_scan_id(scan["id"]),
+            "b": scan["productBarcode"],
+            "s": scan["score"],
+            "c": scan.get("carbonFootprint", 0),
+            "t": bson_time(scan["scannedAt"]),
+            **({"k": scan["idempotencyKey"]} if scan.get("idempotencyKey") else {}),
+        }
+
+    async def _push(self, user_id: str, day: datetime, entries: List[dict]) -> bool:
+        # Only a bucket with room for every entry matches; otherwise the
+        # upsert opens a new one, so buckets never exceed SCAN_BUCKET_SIZE.
+        # A push is all or nothing, so if any of its entries (or keys) is
+        # already stored it was pushed before: the upsert then collides with
+        # entries_i_unique (or userId_keys_unique) and is skipped.
+        keys = [entry["k"] for entry in entries if "k" in entry]
+        query = {"userId": user_id, "day": day, "count": {"$lte": SCAN_BUCKET_SIZE - len(entries)},
+                 "entries.i": {"$nin": [entry["i"] for entry in entries]}}
+        push = {"entries": {"$each": entries}}
+        if keys:
+            query["keys"] = {"$nin": keys}
+            push["keys"] = {"$each": keys}
+        try:
+            await self.collection.update_one(query, {
+                "$push": push,
+                "$inc": {"count": len(entries)},
+                "$min": {"first": min(entry["t"] for entry in entries)},
+                "$max": {"last": max(entry["t"] for entry in entries)},
+            }, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def insert(self, scan):
+        entry = self._entry(scan)
+        return await self._push(scan["userId"], bucket_day(entry["t"]), [entry])
+
+    async def insert_many(self, scans):
+        groups = {}
+        for scan in scans:
+            entry = self._entry(scan)
+            groups.setdefault((scan["userId"], bucket_day(entry["t"])), []).append(entry)
+        await asyncio.gather(*(
+            self._push(user_id, day, entries[start:start + SCAN_BUCKET_SIZE])
+            for (user_id, day), entries in groups.items()
+            for start in range(0, len(entries), SCAN_BUCKET_SIZE)
+        ))
+
+    async def _expand(self, user_id: str, entries: List[dict], names: Dict[str, str]) -> List[dict]:
+        """Entries back to scan documents; `names` caches product names per read."""
+        missing = {entry["b"] for entry in entries} - names.keys()
+        if missing:
+            products = await self._storage.products.get_many(missing)
+            names.update(dict.fromkeys(missing, ""))
+            names.update({product["barcode"]: product["name"] for product in products})
+        return [{
+            "id": str(entry["i"].as_uuid()) if isinstance(entry["i"], Binary) else entry["i"],
+            "userId": user_id,
+            "productBarcode": entry["b"],
+            "productName": names[entry["b"]],
+            "score": entry["s"],
+            "carbonFootprint": entry["c"],
+            "scannedAt": iso_time(entry["t"]),
+            **({"idempotencyKey": entry["k"]} if "k" in entry else {}),
+        } for entry in entries]
+
+    async def get(self, user_id, scan_id):
+        scan_id = compact_scan_id(scan_id)
+        bucket = await self.collection.find_one(
+            {"entries.i": scan_id, "userId": user_id}, {"_id": 0, "entries": {"$elemMatch": {"i": scan_id}}}
+        )
+        if not bucket or not bucket.get("entries"):
+            return None
+        return (await self._expand(user_id, bucket["entries"], {}))[0]
+
+    async def get_by_idempotency_key(self, user_id, key):
+        bucket = await self.collection.find_one(
+            {"userId": user_id, "keys": key}, {"_id": 0, "entries": {"$elemMatch": {"k": key}}}
+        )
+        if not bucket or not bucket.get("entries"):
+            return None
+        return (await self._expand(user_id, bucket["entries"], {}))[0]
+
+    async def _newest(self, user_id, before, limit):
+        """Yield the user's scans newest first, one bucket's worth at a time."""
+        query = {"userId": user_id}
+        if before:
+            query["first"] = {"$lte": bson_time(before[0])}
+        names = {}
+        pending = []  # (key, scan) not yet yielded, newest first
+        emitted = 0
+        # Small batches: one page rarely needs more than a few buckets
+        cursor = self.collection.find(query, {"_id": 0}).sort("last", DESCENDING).batch_size(16)
+        async for bucket in cursor:
+            # Buckets can overlap in time, so only scans newer than everything
+            # the remaining buckets could hold are safe to hand out
+            scans = await self._expand(user_id, bucket["entries"], names)
+            keyed = [((scan["scannedAt"], scan["id"]), scan) for scan in scans]
+            if before:
+                keyed = [item for item in keyed if item[0] < tuple(before)]
+            pending = sorted(pending + keyed, key=lambda item: item[0], reverse=True)
+            horizon = iso_time(bucket["last"])
+            while pending and pending[0][0][0] > horizon:
+                yield pending.pop(0)[1]
+                emitted += 1
+                if limit and emitted >= limit:
+                    return
+        for _, scan in pending:
+            yield scan
+            emitted += 1
+            if limit and emitted >= limit:
+                return
+
+    async def page_for_user(self, user_id, before, limit):
+        return [scan async for scan in self._newest(user_id, before, limit)]
+
+    async def iterate_for_user(self, user_id, before=None, limit=0):
+        async for scan in self._newest(user_id, before, limit):
+            yield scan
+
+    async def iterate_by_user(self):
+        user_id = None
+        async for bucket in self.collection.find({}, {"_id": 0, "userId": 1}).sort("userId", ASCENDING):
+            if bucket["userId"] != user_id:
+                user_id = bucket["userId"]
+                async for scan in self._newest(user_id, None, 0):
+                    yield scan
+
+    async def iterate_chunks(self, chunk_size, fields=None):
+        names = {}
+        chunk = []
+        cursor = self.collection.find({}, {"_id": 0, "userId": 1, "entries": 1}).batch_size(
+            max(1, chunk_size // SCAN_BUCKET_SIZE)
+        )
+        async for bucket in cursor:
+            chunk.extend(await self._expand(bucket["userId"], bucket["entries"], names))
+            while len(chunk) >= chunk_size:
+                yield chunk[:chunk_size]
+                chunk = chunk[chunk_size:]
+        if chunk:
+            yield chunk
+
+
+class MongoDocumentListRepository(MongoRepository, DocumentListRepository):
+    async def all(self):
+        return await self.collection.find({}, {"_id": 0}).to_list(None)
+
+    async def insert_many(self, documents):
+        await self.collection.insert_many([dict(document) for document in documents])
+
+    async def get(self, document_id):
+        return await self.collection.find_one({"id": document_id}, {"_id": 0})
+
+    async def seed(self, documents):
+        return await self._seed(documents, "id")
+
+    async def drop_duplicates(self):
+        """Keep one document per id, so the unique index can be built over
+        data seeded twice before it existed."""
+        duplicates = self.collection.aggregate([
+            # Oldest copy first, so the one kept doesn't depend on the plan
+            {"$sort": {"_id": 1}},
+            {"$group": {"_id": "$id", "copies": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ])
+        extra = [copy async for group in duplicates for copy in group["copies"][1:]]
+        if extra:
+            await self.collection.delete_many({"_id": {"$in": extra}})
+
+
+PROGRESS_PROJECTION = {"_id": 0, "recentFlushes": 0}
+
+
+def progress_update(increments: Dict[str, int], maxima: Dict[str, str], unset: Iterable[str] = ()) -> dict:
+    update = {}
+    if increments:
+        update["$inc"] = {f"rules.{path}": value for path, value in increments.items()}
+    if maxima:
+        update["$max"] = {f"rules.{path}": value for path, value in maxima.items()}
+    # A path can't be both updated and removed; a late scan for a past week
+    # just keeps that week until the next update
+    unset = [path for path in unset if path not in increments and path not in maxima]
+    if unset:
+        update["$unset"] = {f"rules.{path}": "" for path in unset}
+    return update
+
+
+class MongoChallengeProgressRepository(MongoRepository, ChallengeProgressRepository):
+    async def get(self, user_id):
+        return await self.collection.find_one({"userId": user_id}, PROGRESS_PROJECTION)
+
+    async def advance(self, user_id, increments, maxima, unset=()):
+        update = progress_update(increments, maxima, unset)
+        if not update:
+            return await self.get(user_id) or {"userId": user_id, "rules": {}}
+        for attempt in range(2):
+            try:
+                return await self.collection.find_one_and_update(
+                    {"userId": user_id}, update, projection=PROGRESS_PROJECTION,
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Two first scans raced to create the document; the second
+                # attempt updates the one that won
+                if attempt:
+                    raise
+
+    async def advance_many(self, updates, flush_id=None):
+        guard, push = flush_guard(flush_id)
+        writes = []
+        for user_id, (increments, maxima, unset) in updates.items():
+            update = progress_update(increments, maxima, unset)
+            if update:
+                writes.append(UpdateOne({"userId": user_id, **guard}, {**update, **push}, upsert=True))
+        if writes:
+            await bulk_upsert(self.collection, writes)
+
+
+class MongoLedgerRepository(MongoRepository, LedgerRepository):
+    async def record(self, entry):
+        query = {"userId": entry["userId"], "idempotencyKey": entry["idempotencyKey"]}
+        try:
+            return await self.collection.find_one_and_update(
+                query, {"$setOnInsert": dict(entry)}, projection={"_id": 0},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert for the same key won the insert
+            return await self.collection.find_one(query, {"_id": 0})
+
+    async def get_by_key(self, user_id, key):
+        return await self.collection.find_one({"userId": user_id, "idempotencyKey": key}, {"_id": 0})
+
+    async def page_for_user(self, user_id, before, limit):
+        cursor = self.collection.find(scans_before_query(user_id, before, "createdAt"), {"_id": 0})
+        return await cursor.sort([("createdAt", DESCENDING), ("id", DESCENDING)]).limit(limit).to_list(limit)
+
+
+class MongoDailyStatsRepository(MongoRepository, DailyStatsRepository):
+    async def add_many(self, deltas, flush_id=None):
+        if not deltas:
+            return
+        guard, push = flush_guard(flush_id)
+        await bulk_upsert(self.collection, [
+            UpdateOne({"userId": user_id, "day": day, **guard}, {"$inc": dict(delta), **push}, upsert=True)
+            for (user_id, day), delta in deltas.items()
+        ])
+
+    async def replace_many(self, rollups):
+        if not rollups:
+            return
+        await self.collection.bulk_write(
+            [UpdateOne({"userId": rollup["userId"], "day": rollup["day"]},
+                       {"$set": {field: rollup[field] for field in ROLLUP_FIELDS}}, upsert=True)
+             for rollup in rollups],
+            ordered=False
+        )
+
+    async def range(self, user_id, start, end):
+        return await self.collection.find(
+            {"userId": user_id, "day": {"$gte": start, "$lte": end}}, {"_id": 0, "recentFlushes": 0}
+        ).sort("day", ASCENDING).to_list(None)
+
+
+class MongoStorage(Storage):
+    engine = "mongo"
+
+    def __init__(self, mongo_url: Optional[str], db_name: Optional[str], scan_layout: str = "documents",
+                 event_listeners: Sequence[object] = ()):
+        self._mongo_url = mongo_url
+        self._db_name = db_name
+        self._event_listeners = list(event_listeners)
+        self._client = None
+        self.scan_layout = scan_layout
+        self.users = MongoUserRepository(self, "users")
+        self.products = MongoProductRepository(self, "products")
+        self.scans = self.scan_repository(scan_layout)
+        self.challenges = MongoDocumentListRepository(self, "challenges")
+        self.rewards = MongoDocumentListRepository(self, "rewards")
+        self.challenge_progress = MongoChallengeProgressRepository(self, "challenge_progress")
+        self.daily_stats = MongoDailyStatsRepository(self, "daily_stats")
+        self.ledger = MongoLedgerRepository(self, "ledger")
+
+    def scan_repository(self, layout: str) -> ScanRepository:
+        if layout == "documents":
+            return MongoScanRepository(self, "scans")
+        if layout == "buckets":
+            return MongoBucketedScanRepository(self, "scan_buckets")
+        raise ValueError(f"Unknown SCAN_LAYOUT {layout!r}; expected one of {SCAN_LAYOUTS}")
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        # Created on first use so importing the app never needs Mongo settings
+        if self._client is None:
+            if not self._mongo_url or not self._db_name:
+                raise RuntimeError("MONGO_URL and DB_NAME must be set for the mongo storage engine")
+            self._client = AsyncIOMotorClient(self._mongo_url, event_listeners=self._event_listeners)
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self._db_name]
+
+    async def ensure_indexes(self):
+        await asyncio.gather(self.challenges.drop_duplicates(), self.rewards.drop_duplicates())
+        await asyncio.gather(*(
+            self.db[collection].create_indexes(models) for collection, models in INDEXES.items()
+        ))
+
+    async def ping(self):
+        await self.client.admin.command("ping")
+
+    async def explain_hot_queries(self):
+        plans = []
+        hot_queries = HOT_QUERIES
+        if self.scan_layout == "buckets":
+            hot_queries = [BUCKETED_SCANS_QUERIES.get(query[0], query) for query in HOT_QUERIES]
+        for name, collection, query, sort, limit in hot_queries:
+            cursor = self.db[collection].find(query).limit(limit)
+            if sort:
+                cursor = cursor.sort(sort)
+            explanation = await cursor.explain()
+            winning = explanation["queryPlanner"]["winningPlan"]
+            # Slot-based engine plans nest the classic plan under "queryPlan"
+            stages = plan_stages(winning.get("queryPlan", winning))
+            plans.append({
+                "query": name,
+                "collection": collection,
+                "stages": stages,
+                "collscan": "COLLSCAN" in stages,
+            })
+        return plans
+
+    async def reset(self):
+        await self.client.drop_database(self._db_name)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+
+# In-memory engine; every method returns copies so callers can't mutate the
+# stored documents.
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self._by_id = {}
+        self._id_by_email = {}
+        self._by_score = []  # sorted (-ecoScore, id)
+
+    async def get_by_email(self, email):
+        user_id = self._id_by_email.get(email)
+        return dict(self._by_id[user_id]) if user_id is not None else None
+
+    async def get_by_id(self, user_id):
+        user = self._by_id.get(user_id)
+        if user is None:
+            return None
+        return {key: value for key, value in user.items() if key not in PRIVATE_USER_FIELDS}
+
+    async def insert(self, user):
+        if user["email"] in self._id_by_email or user["id"] in self._by_id:
+            raise DuplicateKeyError("duplicate key: email or id already exists", code=11000)
+        user = dict(user)
+        user.setdefault("ecoScore", 0)
+        self._by_id[user["id"]] = user
+        self._id_by_email[user["email"]] = user["id"]
+        insort(self._by_score, (-user["ecoScore"], user["id"]))
+
+    async def apply_scan_stats(self, user_id, score, scans=1):
+        user = self._by_id.get(user_id)
+        if user is None:
+            return None
+        old_key = (-user["ecoScore"], user_id)
+        del self._by_score[bisect_left(self._by_score, old_key)]
+        user["ecoScore"] += score
+        user["totalScans"] = user.get("totalScans", 0) + scans
+        user["level"] = calculate_level(user["ecoScore"])
+        user["statsVersion"] = user.get("statsVersion", 0) + 1
+        insort(self._by_score, (-user["ecoScore"], user_id))
+        return await self.get_by_id(user_id)
+
+    async def apply_scan_stats_many(self, deltas, flush_id=None):
+        for user_id, (score, scans) in deltas.items():
+            user = self._by_id.get(user_id)
+            if flush_id is not None and user is not None:
+                if flush_id in user.get("recentFlushes", []):
+                    continue
+                user["recentFlushes"] = (user.get("recentFlushes", []) + [flush_id])[-RECENT_FLUSHES:]
+            await self.apply_scan_stats(user_id, score, scans)
+
+    async def award_challenge(self, user_id, challenge_id, points):
+        user = self._by_id.get(user_id)
+        if user is None or challenge_id in user.get("awardedChallenges", []):
+            return None
+        user["awardedChallenges"] = user.get("awardedChallenges", []) + [challenge_id]
+        return await self.apply_scan_stats(user_id, points, 0)
+
+    async def spend_points(self, user_id, points, entry):
+        user = self._by_id.get(user_id)
+        if (user is None or user.get("ecoScore", 0) < points
+                or await self.recent_redemption(user_id, entry["idempotencyKey"])):
+            return None
+        updated = await self.apply_scan_stats(user_id, -points, 0)
+        recent = user.get("recentRedemptions", []) + [{**entry, "balance": updated["ecoScore"]}]
+        user["recentRedemptions"] = recent[-RECENT_REDEMPTIONS:]
+        return updated
+
+    async def recent_redemption(self, user_id, key):
+        user = self._by_id.get(user_id) or {}
+        for entry in user.get("recentRedemptions", []):
+            if entry["idempotencyKey"] == key:
+                return dict(entry)
+        return None
+
+    async def iter_by_score(self, fields):
+        for _, user_id in list(self._by_score):
+            user = self._by_id[user_id]
+            yield {field: user.get(field) for field in fields}
+
+    def clear(self):
+        self.__init__()
+
+
+class MemoryProductRepository(ProductRepository):
+    def __init__(self):
+        self._by_barcode = {}
+        self._barcodes = []  # sorted
+
+    async def get(self, barcode):
+        product = self._by_barcode.get(barcode)
+        return dict(product) if product is not None else None
+
+    async def get_many(self, barcodes):
+        return [dict(self._by_barcode[barcode]) for barcode in set(barcodes) if barcode in self._by_barcode]
+
+    def _slice(self, after, limit):
+        start = bisect_right(self._barcodes, after) if after else 0
+        stop = start + limit if limit else len(self._barcodes)
+        return self._barcodes[start:stop]
+
+    async def page(self, after, limit):
+        return [dict(self._by_barcode[barcode]) for barcode in self._slice(after, limit)]
+
+    async def iterate(self, after=None, limit=0):
+        for barcode in self._slice(after, limit):
+            yield dict(self._by_barcode[barcode])
+
+    async def count(self):
+        return len(self._by_barcode)
+
+    async def insert_many(self, products):
+        for product in products:
+            if product["barcode"] in self._by_barcode:
+                raise DuplicateKeyError(f"duplicate key: barcode {product['barcode']}", code=11000)
+        for product in products:
+            self._by_barcode[product["barcode"]] = dict(product)
+            insort(self._barcodes, product["barcode"])
+
+    async def upsert_many(self, products):
+        for product in products:
+            if product["barcode"] not in self._by_barcode:
+                insort(self._barcodes, product["barcode"])
+            self._by_barcode[product["barcode"]] = dict(product)
+        return []
+
+    async def seed(self, products):
+        missing = [product for product in products if product["barcode"] not in self._by_barcode]
+        await self.upsert_many(missing)
+        return missing
+
+    def clear(self):
+        self.__init__()
+
+
+class MemoryScanRepository(ScanRepository):
+    def __init__(self):
+        self._by_user = {}  # userId -> sorted [(scannedAt, id)]
+        self._by_key = {}  # (scannedAt, id) -> scan
+        self._keys_by_id = {}  # id -> (scannedAt, id)
+        self._keys_by_idempotency_key = {}  # (userId, idempotencyKey) -> (scannedAt, id)
+
+    async def insert(self, scan):
+        idempotency_key = (scan["userId"], scan.get("idempotencyKey"))
+        if scan["id"] in self._keys_by_id or idempotency_key in self._keys_by_idempotency_key:
+            return False
+        key = (scan["scannedAt"], scan["id"])
+        self._keys_by_id[scan["id"]] = key
+        if scan.get("idempotencyKey"):
+            self._keys_by_idempotency_key[idempotency_key] = key
+        self._by_key[key] = dict(scan)
+        # New scans almost always sort last, so this is usually an append
+        insort(self._by_user.setdefault(scan["userId"], []), key)
+        return True
+
+    async def insert_many(self, scans):
+        for scan in scans:
+            await self.insert(scan)
+
+    def _keys(self, user_id, before, limit):
+        keys = self._by_user.get(user_id, [])
+        stop = bisect_left(keys, tuple(before)) if before else len(keys)
+        start = max(0, stop - limit) if limit else 0
+        return keys[start:stop][::-1]
+
+    async def get(self, user_id, scan_id):
+        scan = self._by_key.get(self._keys_by_id.get(scan_id))
+        return dict(scan) if scan and scan["userId"] == user_id else None
+
+    async def get_by_idempotency_key(self, user_id, key):
+        scan = self._by_key.get(self._keys_by_idempotency_key.get((user_id, key)))
+        return dict(scan) if scan else None
+
+    async def page_for_user(self, user_id, before, limit):
+        return [dict(self._by_key[key]) for key in self._keys(user_id, before, limit)]
+
+    async def iterate_for_user(self, user_id, before=None, limit=0):
+        for key in self._keys(user_id, before, limit):
+            yield dict(self._by_key[key])
+
+    async def iterate_by_user(self):
+        for user_id in sorted(self._by_user):
+            for key in reversed(self._by_user[user_id]):
+                yield dict(self._by_key[key])
+
+    async def iterate_chunks(self, chunk_size, fields=None):
+        scans = list(self._by_key.values())
+        for start in range(0, len(scans), chunk_size):
+            yield [dict(scan) for scan in scans[start:start + chunk_size]]
+
+    def clear(self):
+        self.__init__()
+
+
+class MemoryDocumentListRepository(DocumentListRepository):
+    def __init__(self):
+        self._documents = []
+
+    async def all(self):
+        return [dict(document) for document in self._documents]
+
+    async def insert_many(self, documents):
+        self._documents.extend(dict(document) for document in documents)
+
+    async def get(self, document_id):
+        for document in self._documents:
+            if document["id"] == document_id:
+                return dict(document)
+        return None
+
+    async def seed(self, documents):
+        stored = {document["id"] for document in self._documents}
+        missing = [document for document in documents if document["id"] not in stored]
+        await self.insert_many(missing)
+        return missing
+
+    def clear(self):
+        self.__init__()
+
+
+class MemoryChallengeProgressRepository(ChallengeProgressRepository):
+    def __init__(self):
+        self._by_user = {}
+        self._flushes = {}  # userId -> [flush id]
+
+    async def get(self, user_id):
+        progress = self._by_user.get(user_id)
+        return copy.deepcopy(progress) if progress else None
+
+    async def advance(self, user_id, increments, maxima, unset=()):
+        progress = self._by_user.setdefault(user_id, {"userId": user_id, "rules": {}})
+        apply_progress(progress["rules"], increments, maxima, unset)
+        return copy.deepcopy(progress)
+
+    async def advance_many(self, updates, flush_id=None):
+        for user_id, (increments, maxima, unset) in updates.items():
+            if flush_id is not None:
+                flushes = self._flushes.get(user_id, [])
+                if flush_id in flushes:
+                    continue
+                self._flushes[user_id] = (flushes + [flush_id])[-RECENT_FLUSHES:]
+            await self.advance(user_id, increments, maxima, unset)
+
+    def clear(self):
+        self.__init__()
+
+
+class MemoryLedgerRepository(LedgerRepository):
+    def __init__(self):
+        self._by_key = {}  # (userId, idempotencyKey) -> entry
+        self._by_user = {}  # userId -> sorted [(createdAt, id, idempotencyKey)]
+
+    async def record(self, entry):
+        key = (entry["userId"], entry["idempotencyKey"])
+        if key not in self._by_key:
+            self._by_key[key] = dict(entry)
+            insort(self._by_user.setdefault(entry["userId"], []),
+                   (entry["createdAt"], entry["id"], entry["idempotencyKey"]))
+        return dict(self._by_key[key])
+
+    async def get_by_key(self, user_id, key):
+        entry = self._by_key.get((user_id, key))
+        return dict(entry) if entry is not None else None
+
+    async def page_for_user(self, user_id, before, limit):
+        keys = self._by_user.get(user_id, [])
+        stop = bisect_left(keys, tuple(before)) if before else len(keys)
+        return [dict(self._by_key[(user_id, key)]) for _, _, key in keys[max(0, stop - limit):stop][::-1]]
+
+    def clear(self):
+        self.__init__()
+
+
+class MemoryDailyStatsRepository(DailyStatsRepository):
+    def __init__(self):
+        self._by_user = {}  # userId -> {day: rollup}
+        self._flushes = {}  # (userId, day) -> [flush id]
+
+    async def add_many(self, deltas, flush_id=None):
+        for (user_id, day), delta in deltas.items():
+            if flush_id is not None:
+                flushes = self._flushes.setdefault((user_id, day), [])
+                if flush_id in flushes:
+                    continue
+                self._flushes[(user_id, day)] = (flushes + [flush_id])[-RECENT_FLUSHES:]
+            rollup = self._by_user.setdefault(user_id, {}).setdefault(
+                day, {"userId": user_id, "day": day, **{field: 0 for field in ROLLUP_FIELDS}}
+            )
+            for field, value in delta.items():
+                rollup[field] = rollup.get(field, 0) + value
+
+    async def replace_many(self, rollups):
+        for rollup in rollups:
+            self._by_user.setdefault(rollup["userId"], {})[rollup["day"]] = dict(rollup)
+
+    async def range(self, user_id, start, end):
+        days = self._by_user.get(user_id, {})
+        return [dict(days[day]) for day in sorted(days) if start <= day <= end]
+
+    def clear(self):
+        self.__init__()
+
+
+class MemoryStorage(Storage):
+    engine = "memory"
+
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.products = MemoryProductRepository()
+        self.scans = MemoryScanRepository()
+        self.challenges = MemoryDocumentListRepository()
+        self.rewards = MemoryDocumentListRepository()
+        self.challenge_progress = MemoryChallengeProgressRepository()
+        self.daily_stats = MemoryDailyStatsRepository()
+        self.ledger = MemoryLedgerRepository()
+
+    async def ping(self):
+        pass
+
+    async def explain_hot_queries(self):
+        # Every hot query is answered from a dedicated dict or sorted index
+        return [
+            {"query": name, "collection": collection, "stages": ["MEMORY_INDEX"], "collscan": False}
+            for name, collection, _, _, _ in HOT_QUERIES
+        ]
+
+    async def reset(self):
+        for repository in (self.users, self.products, self.scans, self.challenges, self.rewards,
+                           self.challenge_progress, self.daily_stats, self.ledger):
+            repository.clear()
+
+
+def create_storage(engine: Optional[str] = None, event_listeners: Sequence[object] = ()) -> Storage:
+    """`event_listeners` are pymongo monitoring listeners (mongo engine only)."""
+    engine = engine or os.environ.get("STORAGE_ENGINE", "mongo")
+    if engine == "mongo":
+        return MongoStorage(os.environ.get("MONGO_URL"), os.environ.get("DB_NAME"),
+                            os.environ.get("SCAN_LAYOUT", "documents"), event_listeners)
+    if engine == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_ENGINE {engine!r}; expected 'mongo' or 'memory'")
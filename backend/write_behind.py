@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from rollups import rollup_deltas
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Attempts per write before it is dropped (and logged)
+FLUSH_ATTEMPTS = 3
+# The writes making up a flush, each retried on its own
+FLUSH_WRITES = ("scans", "userStats", "dailyStats", "challengeProgress")
+
+
+class ScanWriteBuffer:
+    """Write-behind buffer for scan ingestion.
+
+    Scans are queued in memory and a background task writes them with one
+    insert_many every `flush_interval` seconds or `max_batch` scans, whichever
+    comes first. Score increments for the same user within a flush are merged
+    into a single update, and so are the challenge counter updates handed to
+    submit_progress(). A full queue makes submitters wait, which bounds
+    memory and pushes back on clients.
+
+    A flush is four independent writes (the scans, the users' stats, the
+    daily rollups and the challenge counters), and a failed one is retried
+    without repeating the others. Retries are safe even when a write partly
+    went through: scan inserts skip ids already stored, and the increments
+    carry an id per flush that the documents they already reached remember
+    and skip.
+
+    Scans acknowledged but not yet flushed are lost if the process dies, so
+    this is opt-in per deployment. `drain()` flushes everything on shutdown.
+    """
+
+    def __init__(self, storage: Storage, flush_interval: float, max_batch: int, max_queue: int):
+        self._storage = storage
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # userId -> (increments, maxima, unset) awaiting the next flush
+        self._progress: Dict[str, tuple] = {}
+        # Scans acknowledged but not stored yet, by id
+        self._pending: Dict[str, dict] = {}
+        self.flushes = 0
+        self.flushed_scans = 0
+        self.failed_flushes = 0
+        # Scans (users, for challengeProgress) whose write was given up on,
+        # per entry in FLUSH_WRITES
+        self.dropped = dict.fromkeys(FLUSH_WRITES, 0)
+        self.coalesced_updates = 0
+        self.last_flush_size = 0
+        self.last_flush_lag_ms = 0.0
+        self.max_flush_lag_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def dropped_scans(self) -> int:
+        """Acknowledged scans that never made it to storage."""
+        return self.dropped["scans"]
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, scan: dict, stored: bool = False):
+        """Queue a scan's stats updates, and the scan itself unless it's
+        already `stored`."""
+        if not stored:
+            self._pending[scan["id"]] = scan
+        await self._queue.put((time.monotonic(), scan, stored))
+        self._wakeup.set()
+
+    def pending_scan(self, scan_id: str) -> Optional[dict]:
+        """A submitted scan that isn't in storage yet."""
+        return self._pending.get(scan_id)
+
+    async def submit_progress(self, user_id: str, increments: Dict[str, int], maxima: Dict[str, str],
+                              unset: Iterable[str] = ()):
+        """Queue a ChallengeProgressRepository.advance() for the next flush."""
+        if not increments and not maxima and not unset:
+            return
+        first = not self._progress
+        pending_increments, pending_maxima, pending_unset = self._progress.setdefault(user_id, ({}, {}, set()))
+        for path in unset:
+            pending_increments.pop(path, None)
+            pending_maxima.pop(path, None)
+            pending_unset.add(path)
+        for path, value in increments.items():
+            pending_increments[path] = pending_increments.get(path, 0) + value
+        for path, value in maxima.items():
+            pending_maxima[path] = max(pending_maxima.get(path, value), value)
+        if first:
+            # Makes sure a flush follows even if no scan is queued after this
+            await self._queue.put((time.monotonic(), None, False))
+            self._wakeup.set()
+
+    async def drain(self):
+        """Flush everything queued so far and stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = first[0] + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        if self._progress:
+            await self._flush([(time.monotonic(), None, False)])
+
+    async def _flush(self, batch: List[Tuple[float, Optional[dict], bool]]):
+        # Items without a scan only mark that challenge progress is pending
+        scans = [scan for _, scan, _ in batch if scan is not None]
+        unstored = [scan for _, scan, stored in batch if scan is not None and not stored]
+        progress, self._progress = self._progress, {}
+        deltas = {}  # userId -> [score, scans]
+        for scan in scans:
+            delta = deltas.setdefault(scan["userId"], [0, 0])
+            delta[0] += scan["score"]
+            delta[1] += 1
+
+        rollups = rollup_deltas(scans)
+        flush_id = uuid.uuid4().hex
+        writes = [
+            self._write("challengeProgress", len(progress),
+                        lambda: self._storage.challenge_progress.advance_many(progress, flush_id)),
+        ] if progress else []
+        if unstored:
+            writes.append(self._write("scans", len(unstored), lambda: self._storage.scans.insert_many(unstored)))
+        if scans:
+            writes += [
+                self._write("userStats", len(scans),
+                            lambda: self._storage.users.apply_scan_stats_many(deltas, flush_id)),
+                self._write("dailyStats", len(scans),
+                            lambda: self._storage.daily_stats.add_many(rollups, flush_id)),
+            ]
+        written = await asyncio.gather(*writes)
+        for scan in unstored:
+            self._pending.pop(scan["id"], None)
+        if not all(written):
+            return
+
+        lag_ms = (time.monotonic() - batch[0][0]) * 1000
+        self.flushes += 1
+        self.flushed_scans += len(scans)
+        self.coalesced_updates += len(scans) - len(deltas)
+        self.last_flush_size = len(scans)
+        self.last_flush_lag_ms = lag_ms
+        self.max_flush_lag_ms = max(self.max_flush_lag_ms, lag_ms)
+
+    async def _write(self, name: str, size: int, write) -> bool:
+        """Run `write()` until it succeeds or FLUSH_ATTEMPTS are used up."""
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                await write()
+                return True
+            except Exception:
+                self.failed_flushes += 1
+                if attempt == FLUSH_ATTEMPTS:
+                    self.dropped[name] += size
+                    logger.exception("Dropping the %s write of %d buffered updates after %d attempts", name, size, attempt)
+                    return False
+                await asyncio.sleep(0.1 * attempt)
+
+    def stats(self) -> dict:
+        return {
+            "queueDepth": self.depth,
+            "flushes": self.flushes,
+            "flushedScans": self.flushed_scans,
+            "failedFlushes": self.failed_flushes,
+            "droppedScans": self.dropped_scans,
+            "droppedWrites": dict(self.dropped),
+            "coalescedUserUpdates": self.coalesced_updates,
+            "lastFlushSize": self.last_flush_size,
+            "lastFlushLagMs": self.last_flush_lag_ms,
+            "maxFlushLagMs": self.max_flush_lag_ms,
+        }
@@ -0,0 +1,87 @@
+"""Cold-start time of API workers, and seeding when several start at once.
+
+Starts BENCH_WORKERS uvicorn processes at the same moment (one per port) and
+polls each one's /healthz and /readyz, reporting how long after spawning each
+became live and ready, plus the startup time the worker measured itself.
+With the mongo engine every worker shares one database, so afterwards the
+script also checks that the reference data was seeded exactly once.
+
+Uses the in-memory storage engine unless STORAGE_ENGINE says otherwise.
+
+    python benchmarks/cold_start.py
+    STORAGE_ENGINE=mongo MONGO_URL=mongodb://localhost:27017 BENCH_WORKERS=4 python benchmarks/cold_start.py
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+
+from common import BACKEND_DIR
+
+WORKERS = int(os.environ.get("BENCH_WORKERS", "4"))
+RUNS = int(os.environ.get("BENCH_RUNS", "3"))
+BASE_PORT = int(os.environ.get("BENCH_BASE_PORT", "8700"))
+TIMEOUT = float(os.environ.get("BENCH_START_TIMEOUT", "60"))
+
+
+async def wait_for(http, url, spawned):
+    deadline = spawned + TIMEOUT
+    while time.perf_counter() < deadline:
+        try:
+            response = await http.get(url)
+            if response.status_code == 200:
+                return time.perf_counter() - spawned, response.json()
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.01)
+    raise TimeoutError(f"{url} not ready after {TIMEOUT}s")
+
+
+async def start_workers(http):
+    processes = []
+    spawned = time.perf_counter()
+    for index in range(WORKERS):
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(BASE_PORT + index), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+        ))
+    try:
+        results = []
+        for index in range(WORKERS):
+            base = f"http://127.0.0.1:{BASE_PORT + index}"
+            live, _ = await wait_for(http, base + "/healthz", spawned)
+            ready, body = await wait_for(http, base + "/readyz", spawned)
+            results.append((live, ready, body["startupSeconds"]))
+        counts = None
+        if os.environ["STORAGE_ENGINE"] == "mongo":
+            base = f"http://127.0.0.1:{BASE_PORT}/api"
+            counts = [len((await http.get(base + path)).json()) for path in ("/challenges", "/rewards")]
+        return results, counts
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+async def main():
+    ok = True
+    async with httpx.AsyncClient(timeout=5) as http:
+        for run in range(RUNS):
+            results, counts = await start_workers(http)
+            print(f"run {run + 1}: {WORKERS} workers")
+            for index, (live, ready, startup) in enumerate(results):
+                print(f"  worker {index}: live {live:6.2f}s | ready {ready:6.2f}s | startup {startup:6.3f}s")
+            if counts is not None:
+                print(f"  challenges {counts[0]}, rewards {counts[1]} (seeded once: {counts == [3, 4]})")
+                ok = ok and counts == [3, 4]
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,22 @@
+"""Shared setup for the benchmark scripts.
+
+Importing this module puts `backend/` on sys.path and points the app at a
+throwaway database, so it must be imported before `server`. Scripts pick the
+storage engine by setting STORAGE_ENGINE before that import.
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "terraquest_bench")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
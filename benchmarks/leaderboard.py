@@ -0,0 +1,53 @@
+"""In-memory leaderboard at scale: load, score updates, top-N and rank lookups.
+
+Pure CPU benchmark over synthetic users; no database needed.
+
+    python benchmarks/leaderboard.py            # 1M users
+    BENCH_USERS=100000 python benchmarks/leaderboard.py
+"""
+import os
+import random
+import sys
+import time
+
+from common import percentile
+from leaderboard import Leaderboard
+from server import calculate_level
+
+USERS = int(os.environ.get("BENCH_USERS", "1000000"))
+OPERATIONS = int(os.environ.get("BENCH_OPERATIONS", "20000"))
+
+
+def timed(operation, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        operation()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def report(name, samples):
+    print(f"{name:>14}: p50 {percentile(samples, 50):8.1f} us | p99 {percentile(samples, 99):8.1f} us")
+
+
+def main():
+    rng = random.Random(42)
+    ids = [f"user-{i}" for i in range(USERS)]
+    users = ({"id": user_id, "name": user_id, "ecoScore": rng.randint(0, 5000), "level": "", "totalScans": 0}
+             for user_id in ids)
+
+    board = Leaderboard(calculate_level)
+    start = time.perf_counter()
+    board.load(users)
+    print(f"loaded {len(board)} users in {time.perf_counter() - start:.2f}s")
+
+    report("scan update", timed(lambda: board.increment(rng.choice(ids), rng.randint(10, 95), 1), OPERATIONS))
+    report("rank lookup", timed(lambda: board.rank(rng.choice(ids)), OPERATIONS))
+    report("top 10", timed(lambda: board.top(10), OPERATIONS))
+    report("top 100 @ 50k", timed(lambda: board.top(100, 50000), OPERATIONS // 10))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""In-process async load test for the TerraQuest API.
+
+Boots the FastAPI `app` (startup hooks included) against the in-memory storage
+engine, or a throwaway MongoDB database with STORAGE_ENGINE=mongo, and drives it through httpx's ASGI transport with a pool of concurrent
+virtual users. Each mix is a weighted set of operations modelled on real
+traffic; every response is checked against its expected status, and
+throughput plus p50/p95/p99 latency are reported per route.
+
+Results are written to benchmark_results.json at the repository root (next to
+backend_test_results.json) so runs can be compared between commits.
+
+    python benchmarks/load_test.py
+    STORAGE_ENGINE=mongo MONGO_URL=mongodb://localhost:27017 python benchmarks/load_test.py
+
+Tuning (environment):
+    BENCH_MIXES        comma-separated mixes to run (default: all)
+    BENCH_REQUESTS     requests per mix (default 2000)
+    BENCH_CONCURRENCY  concurrent virtual users (default 50)
+    BENCH_USERS        registered accounts shared by the virtual users (default 20)
+    BENCH_OUTPUT       results path (default <repo>/benchmark_results.json)
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+# Virtual users rescan the same few barcodes far faster than people do
+os.environ.setdefault("SCAN_DEDUPE_SECONDS", "0")
+
+from common import percentile
+import server
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", "2000"))
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "50"))
+USERS = int(os.environ.get("BENCH_USERS", "20"))
+OUTPUT = Path(os.environ.get("BENCH_OUTPUT", REPO_ROOT / "benchmark_results.json"))
+PASSWORD = "LoadTest123!"
+BARCODES = ["1001", "1002", "1003", "1004", "1005", "1006", "1007", "1008"]
+
+# One log line per request would dominate the measurement
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class Account:
+    def __init__(self, user_id, email, token):
+        self.id = user_id
+        self.email = email
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+
+# Operations: (route label, expected status, coroutine factory)
+def scan(http, account, rng):
+    return http.post("/api/scans", json={"productBarcode": rng.choice(BARCODES)}, headers=account.headers)
+
+
+def scan_batch(http, account, rng):
+    items = [{"productBarcode": rng.choice(BARCODES)} for _ in range(10)]
+    return http.post("/api/scans/batch", json={"scans": items}, headers=account.headers)
+
+
+def product(http, account, rng):
+    return http.get(f"/api/products/{rng.choice(BARCODES)}")
+
+
+def products(http, account, rng):
+    return http.get("/api/products")
+
+
+def user_scans(http, account, rng):
+    return http.get(f"/api/scans/user/{account.id}", headers=account.headers)
+
+
+def profile(http, account, rng):
+    return http.get(f"/api/users/{account.id}", headers=account.headers)
+
+
+def login(http, account, rng):
+    return http.post("/api/auth/login", json={"email": account.email, "password": PASSWORD})
+
+
+def leaderboard(http, account, rng):
+    return http.get("/api/users/leaderboard")
+
+
+def rank(http, account, rng):
+    return http.get(f"/api/users/{account.id}/rank")
+
+
+def challenges(http, account, rng):
+    return http.get("/api/challenges")
+
+
+def rewards(http, account, rng):
+    return http.get("/api/rewards")
+
+
+# mix -> [(weight, route label, expected status, operation)]
+MIXES = {
+    "scan-heavy": [
+        (60, "POST /api/scans", 200, scan),
+        (10, "POST /api/scans/batch", 200, scan_batch),
+        (15, "GET /api/products/{barcode}", 200, product),
+        (10, "GET /api/scans/user/{user_id}", 200, user_scans),
+        (5, "GET /api/users/{user_id}", 200, profile),
+    ],
+    "login-storm": [
+        (70, "POST /api/auth/login", 200, login),
+        (20, "GET /api/products/{barcode}", 200, product),
+        (10, "GET /api/products", 200, products),
+    ],
+    "leaderboard-polling": [
+        (50, "GET /api/users/leaderboard", 200, leaderboard),
+        (20, "GET /api/users/{user_id}/rank", 200, rank),
+        (15, "GET /api/challenges", 200, challenges),
+        (15, "GET /api/rewards", 200, rewards),
+    ],
+}
+
+
+async def register_accounts(http):
+    accounts = []
+    for i in range(USERS):
+        email = f"load{i}@terraquest.com"
+        response = await http.post("/api/auth/register", json={"name": f"Load {i}", "email": email, "password": PASSWORD})
+        response.raise_for_status()
+        body = response.json()
+        accounts.append(Account(body["user"]["id"], email, body["token"]))
+    return accounts
+
+
+async def run_mix(http, name, accounts):
+    operations = MIXES[name]
+    weights = [weight for weight, _, _, _ in operations]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    remaining = REQUESTS
+
+    async def virtual_user(seed):
+        nonlocal remaining
+        rng = random.Random(seed)
+        while remaining > 0:
+            remaining -= 1
+            _, label, expected, operation = rng.choices(operations, weights)[0]
+            start = time.perf_counter()
+            response = await operation(http, rng.choice(accounts), rng)
+            latencies[label].append((time.perf_counter() - start) * 1000)
+            if response.status_code != expected:
+                errors[label] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(seed) for seed in range(CONCURRENCY)))
+    duration = time.perf_counter() - started
+
+    routes = {}
+    for label, samples in sorted(latencies.items()):
+        routes[label] = {
+            "count": len(samples),
+            "errors": errors[label],
+            "throughput": len(samples) / duration,
+            "mean_ms": sum(samples) / len(samples),
+            "p50_ms": percentile(samples, 50),
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+        }
+    total = sum(route["count"] for route in routes.values())
+    return {
+        "requests": total,
+        "errors": sum(errors.values()),
+        "duration_s": duration,
+        "throughput": total / duration,
+        "routes": routes,
+    }
+
+
+def print_mix(name, result):
+    print(f"\n{name}: {result['requests']} requests in {result['duration_s']:.2f}s "
+          f"({result['throughput']:.1f} req/s, {result['errors']} errors)")
+    for label, route in result["routes"].items():
+        print(f"  {label:<32} n={route['count']:<6} {route['throughput']:8.1f} req/s | "
+              f"p50 {route['p50_ms']:7.2f} | p95 {route['p95_ms']:7.2f} | p99 {route['p99_ms']:7.2f} ms"
+              + (f" | {route['errors']} errors" if route["errors"] else ""))
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main():
+    mixes = [name.strip() for name in os.environ.get("BENCH_MIXES", ",".join(MIXES)).split(",") if name.strip()]
+    unknown = set(mixes) - set(MIXES)
+    if unknown:
+        print(f"unknown mixes: {', '.join(sorted(unknown))} (choose from {', '.join(MIXES)})")
+        return 2
+
+    await server.storage.reset()
+    await server.app.router.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as http:
+            accounts = await register_accounts(http)
+            for name in mixes:
+                results[name] = await run_mix(http, name, accounts)
+                print_mix(name, results[name])
+    finally:
+        await server.storage.reset()
+        await server.app.router.shutdown()
+
+    OUTPUT.write_text(json.dumps({
+        "commit": current_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "engine": server.storage.engine,
+            "requests": REQUESTS,
+            "concurrency": CONCURRENCY,
+            "users": USERS,
+        },
+        "mixes": results,
+    }, indent=2))
+    print(f"\nresults written to {OUTPUT}")
+    return 1 if any(result["errors"] for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
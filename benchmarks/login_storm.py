@@ -0,0 +1,81 @@
+"""Product lookup latency during a concurrent login storm.
+
+Runs the same storm twice: once with bcrypt inline on the event loop (the old
+behaviour) and once on the bounded password pool, while a poller measures
+`GET /api/products/{barcode}` latency. Rejected logins (503) are counted.
+
+Uses the in-memory storage engine unless STORAGE_ENGINE says otherwise.
+
+    python benchmarks/login_storm.py
+    STORAGE_ENGINE=mongo MONGO_URL=mongodb://localhost:27017 python benchmarks/login_storm.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+
+from common import percentile
+import server
+
+LOGINS = int(os.environ.get("BENCH_LOGINS", "200"))
+PASSWORD = "StormPass123!"
+
+
+async def storm(http, email):
+    statuses = []
+    lookups = []
+    done = asyncio.Event()
+
+    async def login():
+        response = await http.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+        statuses.append(response.status_code)
+
+    async def poll():
+        while not done.is_set():
+            start = time.perf_counter()
+            await http.get("/api/products/1001")
+            lookups.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.005)
+
+    poller = asyncio.create_task(poll())
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await poller
+    return elapsed, statuses, lookups
+
+
+async def run(http, name, pool, email):
+    server.password_pool = pool
+    elapsed, statuses, lookups = await storm(http, email)
+    pool.shutdown()
+    print(f"{name:>7}: {len(statuses)} logins in {elapsed:6.2f}s "
+          f"({statuses.count(200)} ok, {statuses.count(503)} rejected) | "
+          f"product lookups n={len(lookups)} p50 {percentile(lookups, 50):7.2f} ms "
+          f"p99 {percentile(lookups, 99):7.2f} ms")
+
+
+async def main():
+    await server.storage.reset()
+    await server.init_db()
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            email = "storm@terraquest.com"
+            await http.post("/api/auth/register", json={"name": "Storm", "email": email, "password": PASSWORD})
+            await run(http, "inline", server.BoundedExecutor(0, 0, "password-hash"), email)
+            await run(http, "pooled", server.BoundedExecutor(
+                server.PASSWORD_HASH_WORKERS, server.PASSWORD_HASH_QUEUE, "password-hash"), email)
+    finally:
+        await server.storage.reset()
+        server.storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,59 @@
+"""Greener-alternatives index: full build, incremental updates and lookups.
+
+Pure CPU benchmark over synthetic products; no database needed.
+
+    python benchmarks/product_alternatives.py          # 100k products
+    BENCH_PRODUCTS=1000000 python benchmarks/product_alternatives.py
+"""
+import os
+import random
+import sys
+import time
+
+from common import percentile
+from alternatives import AlternativesIndex
+
+PRODUCTS = int(os.environ.get("BENCH_PRODUCTS", "100000"))
+UPDATES = int(os.environ.get("BENCH_UPDATES", "50"))
+CATEGORIES = ("Beverages", "Grocery", "Food", "Personal Care", "Household", "Clothing", "Stationery", "Snacks")
+
+
+def synthetic_product(rng, index):
+    return {
+        "barcode": f"{800000000000 + index}",
+        "category": rng.choice(CATEGORIES),
+        "carbonFootprint": rng.randrange(101),
+        "recyclable": rng.random() < 0.5,
+        "ethicalScore": rng.randrange(101),
+        "sustainabilityScore": rng.randrange(101),
+    }
+
+
+def main():
+    rng = random.Random(42)
+    catalog = [synthetic_product(rng, index) for index in range(PRODUCTS)]
+    index = AlternativesIndex()
+    start = time.perf_counter()
+    index.update(catalog)
+    print(f"built {len(index)} products in {time.perf_counter() - start:.1f}s: {index.stats()}")
+
+    for batch_size in (1, 100):
+        samples = []
+        for _ in range(UPDATES):
+            batch = [synthetic_product(rng, rng.randrange(PRODUCTS)) for _ in range(batch_size)]
+            start = time.perf_counter()
+            index.update(batch)
+            samples.append((time.perf_counter() - start) * 1000)
+        print(f"update of {batch_size:>3} products: p50 {percentile(samples, 50):8.1f} ms | "
+              f"p99 {percentile(samples, 99):8.1f} ms")
+
+    barcodes = [product["barcode"] for product in rng.sample(catalog, 10000)]
+    start = time.perf_counter()
+    for barcode in barcodes:
+        index.get(barcode)
+    print(f"lookup: {(time.perf_counter() - start) * 1e6 / len(barcodes):.2f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""CPU cost of GET /api/products with and without the fast response path.
+
+Loads 10k and 100k synthetic products into the in-memory storage engine and
+requests the whole catalogue as one page through httpx's ASGI transport,
+measuring process CPU time per request for:
+
+- validated: the response_model path (Pydantic validation + jsonable_encoder)
+- fast: FAST_RESPONSES (trusted shaping + orjson)
+- fast+strict: FAST_RESPONSES with STRICT_RESPONSES, as tests run it
+
+It also checks that every mode returns the same JSON.
+
+    python benchmarks/product_responses.py
+    BENCH_CATALOG_SIZES=10000 BENCH_REQUESTS=20 python benchmarks/product_responses.py
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+os.environ["STORAGE_ENGINE"] = "memory"
+SIZES = [int(size) for size in os.environ.get("BENCH_CATALOG_SIZES", "10000,100000").split(",")]
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", "10"))
+# The whole catalogue must fit in one page
+os.environ["MAX_PAGE_SIZE"] = str(max(SIZES))
+
+import common  # noqa: F401
+import server
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+MODES = {
+    "validated": (False, True),
+    "fast": (True, False),
+    "fast+strict": (True, True),
+}
+
+
+def synthetic_products(count):
+    return [{
+        "barcode": f"{900000000 + index}",
+        "name": f"Product {index}",
+        "carbonFootprint": index % 100,
+        "recyclable": index % 3 == 0,
+        "ethicalScore": (index * 7) % 100,
+        "sustainabilityScore": (index * 13) % 100,
+        "brand": f"Brand {index % 500}",
+        "category": ("Beverages", "Grocery", "Personal Care", "Household")[index % 4],
+    } for index in range(count)]
+
+
+def set_mode(fast, strict):
+    server.FAST_RESPONSES = fast
+    server.product_shape.strict = strict
+
+
+async def measure(http, size):
+    cpu = []
+    body = None
+    for _ in range(REQUESTS):
+        started = time.process_time()
+        response = await http.get("/api/products", params={"limit": size})
+        cpu.append((time.process_time() - started) * 1000)
+        response.raise_for_status()
+        body = response.json()
+    return cpu, body
+
+
+async def main():
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            ok = True
+            for size in SIZES:
+                server.storage.products.clear()
+                await server.storage.products.insert_many(synthetic_products(size))
+                print(f"{size} products, {REQUESTS} full-catalogue requests per mode")
+                bodies = {}
+                baseline = None
+                for mode, (fast, strict) in MODES.items():
+                    set_mode(fast, strict)
+                    cpu, bodies[mode] = await measure(http, size)
+                    median = statistics.median(cpu)
+                    baseline = baseline or median
+                    print(f"  {mode:>11}: {median:8.1f} ms CPU/request (min {min(cpu):8.1f}) | "
+                          f"{baseline / median:5.2f}x vs validated")
+                same = all(body == bodies["validated"] for body in bodies.values())
+                print(f"  identical responses: {same}")
+                ok = ok and same
+    finally:
+        await server.app.router.shutdown()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,99 @@
+"""Product search index at scale: build time, memory and query latency.
+
+Pure CPU benchmark over synthetic products; no database needed.
+
+    python benchmarks/product_search.py            # 1M products
+    BENCH_PRODUCTS=100000 python benchmarks/product_search.py
+"""
+import os
+import random
+import resource
+import sys
+import time
+
+from common import percentile
+from search import ProductSearchIndex
+
+PRODUCTS = int(os.environ.get("BENCH_PRODUCTS", "1000000"))
+QUERIES = int(os.environ.get("BENCH_QUERIES", "300"))
+
+WORDS = ("organic", "bamboo", "cotton", "recycled", "natural", "herbal", "vegan", "fresh", "classic", "premium",
+         "honey", "soap", "shampoo", "bottle", "toothbrush", "noodles", "salt", "coffee", "tea", "juice",
+         "shirt", "towel", "detergent", "cleaner", "biscuits", "chocolate", "rice", "lentils", "oil", "butter",
+         "yogurt", "cereal", "granola", "sponge", "candle", "notebook", "pencil", "bag", "straw", "cup")
+CATEGORIES = ("Beverages", "Grocery", "Food", "Personal Care", "Household", "Clothing", "Stationery", "Snacks")
+BRANDS = [f"brand{index}" for index in range(2000)]
+
+
+def synthetic_product(rng, index):
+    return {
+        "barcode": f"{800000000000 + index}",
+        "name": " ".join(rng.sample(WORDS, 3)) + f" {rng.randrange(50, 1000)}g",
+        "brand": rng.choice(BRANDS),
+        "category": rng.choice(CATEGORIES),
+        "recyclable": rng.random() < 0.5,
+        "sustainabilityScore": rng.randrange(101),
+        "carbonFootprint": rng.randrange(101),
+    }
+
+
+def timed(index, make_query, count):
+    samples = []
+    totals = []
+    for _ in range(count):
+        kwargs = make_query()
+        start = time.perf_counter()
+        result = index.search(**kwargs)
+        samples.append((time.perf_counter() - start) * 1000)
+        totals.append(result["total"])
+    return samples, sum(totals) / len(totals)
+
+
+def report(name, samples, hits):
+    print(f"{name:>22}: p50 {percentile(samples, 50):8.2f} ms | p99 {percentile(samples, 99):8.2f} ms"
+          f" | avg hits {hits:10.0f}")
+
+
+def main():
+    rng = random.Random(42)
+    index = ProductSearchIndex()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    index.add_many(synthetic_product(rng, offset) for offset in range(PRODUCTS))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"indexed {len(index)} products in {elapsed:.1f}s "
+          f"({index.stats()['terms']} terms, ~{(rss_after - rss_before) / 1024:.0f} MB peak RSS growth)")
+
+    def word():
+        return rng.choice(WORDS)
+
+    def typo():
+        term = word()
+        position = rng.randrange(1, len(term) - 1)
+        return term[:position] + term[position + 1:]
+
+    cases = [
+        ("one word", lambda: {"query": word()}),
+        ("two words", lambda: {"query": f"{word()} {word()}"}),
+        ("prefix (3 chars)", lambda: {"query": word()[:3]}),
+        ("typo", lambda: {"query": typo()}),
+        ("word + facets filter", lambda: {"query": word(), "category": rng.choice(CATEGORIES), "recyclable": True}),
+        ("brand", lambda: {"query": rng.choice(BRANDS)}),
+        ("filter only", lambda: {"score_range": (80, None), "carbon_range": (None, 20)}),
+        ("match all + deep page", lambda: {"offset": 10000, "limit": 20}),
+    ]
+    for name, make_query in cases:
+        samples, hits = timed(index, make_query, QUERIES if "all" not in name and "only" not in name else QUERIES // 10)
+        report(name, samples, hits)
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        index.add(synthetic_product(rng, rng.randrange(PRODUCTS)))
+    print(f"{'update':>22}: {(time.perf_counter() - start) * 1000 / 1000:8.3f} ms per product "
+          f"({index.dead} tombstones)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Concurrent reward redemptions: no overspending, idempotent retries, throughput.
+
+Gives each of BENCH_USERS users enough points for BENCH_AFFORDABLE
+redemptions of one reward, then fires BENCH_REDEMPTIONS redemption requests
+for them all at once. Every BENCH_RETRY_EVERY-th request reuses an earlier
+Idempotency-Key, like a client retrying. Afterwards it checks, per user, that
+exactly the affordable number of redemptions went through, that the balance
+is what it should be and never went negative, that the ledger holds one entry
+per redemption, and that every retry got the original entry back.
+
+Uses the in-memory storage engine unless STORAGE_ENGINE says otherwise.
+
+    python benchmarks/redeem_storm.py
+    STORAGE_ENGINE=mongo MONGO_URL=mongodb://localhost:27017 python benchmarks/redeem_storm.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+
+from common import percentile
+import server
+
+USERS = int(os.environ.get("BENCH_USERS", "20"))
+REDEMPTIONS = int(os.environ.get("BENCH_REDEMPTIONS", "5000"))
+AFFORDABLE = int(os.environ.get("BENCH_AFFORDABLE", "50"))
+RETRY_EVERY = int(os.environ.get("BENCH_RETRY_EVERY", "10"))
+REWARD_ID = "r2"
+PASSWORD = "RedeemPass123!"
+
+
+async def register(http, index):
+    response = await http.post("/api/auth/register", json={
+        "name": f"Redeemer {index}", "email": f"redeemer{index}@terraquest.com", "password": PASSWORD,
+    })
+    body = response.json()
+    return body["user"]["id"], {"Authorization": f"Bearer {body['token']}"}
+
+
+async def read_ledger(http, user_id, headers):
+    entries, cursor = [], None
+    while True:
+        params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+        response = await http.get(f"/api/users/{user_id}/ledger", params=params, headers=headers)
+        entries.extend(response.json())
+        cursor = response.headers.get(server.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return entries
+
+
+async def main():
+    await server.storage.reset()
+    await server.init_db()
+    cost = (await server.storage.rewards.get(REWARD_ID))["pointsRequired"]
+    # Half a redemption's worth on top, so the last attempt is just short
+    balance = AFFORDABLE * cost + cost // 2
+    rng = random.Random(42)
+    transport = httpx.ASGITransport(app=server.app)
+    ok = True
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            users = [await register(http, index) for index in range(USERS)]
+            for user_id, _ in users:
+                server.leaderboard.update(await server.storage.users.apply_scan_stats(user_id, balance, 0))
+
+            requests = []
+            for index in range(REDEMPTIONS):
+                user_index = index % USERS
+                if index >= USERS and index % RETRY_EVERY == 0:
+                    # Retry one of this user's earlier requests
+                    key = requests[rng.randrange(user_index, index, USERS)][1]
+                else:
+                    key = f"redeem-{index}"
+                requests.append((user_index, key))
+
+            statuses = Counter()
+            latencies = []
+            outcomes = {}  # (user index, key) -> [entry ids returned]
+
+            async def redeem(user_index, key):
+                start = time.perf_counter()
+                response = await http.post(f"/api/rewards/{REWARD_ID}/redeem",
+                                           headers={**users[user_index][1], "Idempotency-Key": key})
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    outcomes.setdefault((user_index, key), []).append(response.json()["entry"]["id"])
+
+            started = time.perf_counter()
+            await asyncio.gather(*(redeem(user_index, key) for user_index, key in requests))
+            elapsed = time.perf_counter() - started
+
+            for user_index, (user_id, headers) in enumerate(users):
+                user = await server.storage.users.get_by_id(user_id)
+                ledger = await read_ledger(http, user_id, headers)
+                spent = [key for (index, key) in outcomes if index == user_index]
+                expected = min(AFFORDABLE, len({key for index, key in requests if index == user_index}))
+                checks = {
+                    "redemptions": len(spent) == expected,
+                    "balance": user["ecoScore"] == balance - expected * cost >= 0,
+                    "ledger": sorted(entry["idempotencyKey"] for entry in ledger) == sorted(spent),
+                    "retries": all(len(set(outcomes[(user_index, key)])) == 1 for key in spent),
+                }
+                if not all(checks.values()):
+                    ok = False
+                    failed = ", ".join(name for name, passed in checks.items() if not passed)
+                    print(f"user {user_index}: {len(spent)} redeemed, expected {expected}; failed: {failed}")
+
+            print(f"{REDEMPTIONS} redemptions for {USERS} users in {elapsed:.2f}s "
+                  f"({REDEMPTIONS / elapsed:.0f}/s) | "
+                  + ", ".join(f"{code}: {count}" for code, count in sorted(statuses.items())))
+            print(f"latency p50 {percentile(latencies, 50):7.2f} ms | p99 {percentile(latencies, 99):7.2f} ms")
+            print(f"no overspending, one ledger entry per redemption: {ok}")
+    finally:
+        await server.storage.reset()
+        server.storage.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,157 @@
+"""Analytics export over synthetic scans: throughput and bounded memory.
+
+Feeds BENCH_SCANS synthetic scans (10M by default) through `analyze`, chunk by
+chunk as the scans repository would hand them over, optionally writing them
+to BENCH_OUTPUT (.csv or .parquet). Peak RSS is reported after the first
+chunk and at the end, to show memory doesn't grow with the number of scans.
+For comparison it also times a row-by-row Python version of the same
+aggregation over BENCH_BASELINE_SCANS scans, and calculate_level against
+calculate_levels over a million scores.
+
+Pure CPU benchmark; no database needed.
+
+    python benchmarks/scan_analytics.py
+    BENCH_SCANS=1000000 BENCH_OUTPUT=/tmp/scans.parquet python benchmarks/scan_analytics.py
+"""
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+import common  # noqa: F401  (puts backend/ on sys.path)
+from analytics import analyze, open_writer
+from scoring import calculate_level, calculate_levels
+
+SCANS = int(os.environ.get("BENCH_SCANS", "10000000"))
+CHUNK_SIZE = int(os.environ.get("BENCH_CHUNK_SIZE", "50000"))
+PRODUCTS = int(os.environ.get("BENCH_PRODUCTS", "10000"))
+USERS = int(os.environ.get("BENCH_USERS", "100000"))
+BASELINE_SCANS = int(os.environ.get("BENCH_BASELINE_SCANS", "1000000"))
+OUTPUT = os.environ.get("BENCH_OUTPUT")
+# Distinct chunks generated up front and handed out in turn
+POOL = 4
+CATEGORIES = ("Beverages", "Grocery", "Food", "Personal Care", "Household", "Clothing", "Stationery", "")
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SyntheticProducts:
+    def __init__(self, rng):
+        self.catalog = [{
+            "barcode": str(800000000000 + index),
+            "name": f"Product {index}",
+            "category": rng.choice(CATEGORIES),
+            "brand": f"Brand {index % 500}",
+            "carbonFootprint": rng.randrange(101),
+        } for index in range(PRODUCTS)]
+
+    async def iterate(self):
+        for product in self.catalog:
+            yield product
+
+
+class SyntheticScans:
+    def __init__(self, rng, products):
+        self.pool = [[{
+            "id": f"scan-{chunk}-{index}",
+            "userId": f"user-{rng.randrange(USERS)}",
+            "productBarcode": product["barcode"],
+            "productName": product["name"],
+            "score": rng.randrange(101),
+            "carbonFootprint": product["carbonFootprint"],
+            "scannedAt": f"2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T12:00:00+00:00",
+        } for index, product in enumerate(rng.choices(products, k=CHUNK_SIZE))] for chunk in range(POOL)]
+        self.first_chunk_rss = None
+
+    async def iterate_chunks(self, chunk_size, fields=None):
+        for start in range(0, SCANS, chunk_size):
+            if start == chunk_size:
+                self.first_chunk_rss = peak_rss_mb()
+            yield self.pool[(start // chunk_size) % POOL][:min(chunk_size, SCANS - start)]
+
+
+class SyntheticUsers:
+    def __init__(self, rng):
+        self.scores = [rng.randrange(5000) for _ in range(USERS)]
+
+    async def iter_by_score(self, fields):
+        for score in self.scores:
+            yield {"ecoScore": score}
+
+
+class SyntheticStorage:
+    def __init__(self, seed=42):
+        rng = random.Random(seed)
+        self.products = SyntheticProducts(rng)
+        self.scans = SyntheticScans(rng, self.products.catalog)
+        self.users = SyntheticUsers(rng)
+
+
+def row_by_row(storage, limit):
+    """The same report totals, one scan and one user at a time."""
+    products = {product["barcode"]: product for product in storage.products.catalog}
+    per_category = {}
+    carbon = Counter()
+    done = 0
+    while done < limit:
+        for scan in storage.scans.pool[(done // CHUNK_SIZE) % POOL][:limit - done]:
+            product = products.get(scan["productBarcode"], {})
+            footprint = scan.get("carbonFootprint", product.get("carbonFootprint", 0))
+            totals = per_category.setdefault(product.get("category") or "Uncategorized", [0, 0, 0])
+            totals[0] += 1
+            totals[1] += scan["score"]
+            totals[2] += footprint
+            carbon[min(max(footprint, 0), 1000)] += 1
+        done += min(CHUNK_SIZE, limit - done)
+    levels = Counter(calculate_level(score) for score in storage.users.scores)
+    return per_category, carbon, levels
+
+
+async def main():
+    storage = SyntheticStorage()
+    print(f"{SCANS} scans in chunks of {CHUNK_SIZE}, {PRODUCTS} products, {USERS} users "
+          f"(generated: peak RSS {peak_rss_mb():.0f} MB)")
+
+    writer = open_writer(Path(OUTPUT)) if OUTPUT else None
+    start = time.perf_counter()
+    try:
+        report = await analyze(storage, CHUNK_SIZE, writer)
+    finally:
+        if writer:
+            writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"vectorized: {elapsed:6.1f}s ({SCANS / elapsed:,.0f} scans/s) | peak RSS after first chunk "
+          f"{storage.scans.first_chunk_rss or peak_rss_mb():.0f} MB, at the end {peak_rss_mb():.0f} MB"
+          + (f" | wrote {OUTPUT} ({os.path.getsize(OUTPUT) / 1e6:.0f} MB)" if OUTPUT else ""))
+
+    baseline = min(BASELINE_SCANS, SCANS)
+    start = time.perf_counter()
+    row_by_row(storage, baseline)
+    rate = baseline / (time.perf_counter() - start)
+    print(f"row-by-row: {rate:,.0f} scans/s over {baseline} scans (~{SCANS / rate:.1f}s for {SCANS}, without output)")
+
+    scores = np.random.default_rng(1).integers(0, 5000, 1_000_000)
+    start = time.perf_counter()
+    vectorized = calculate_levels(scores)
+    vectorized_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    looped = [calculate_level(score) for score in scores.tolist()]
+    looped_ms = (time.perf_counter() - start) * 1000
+    same = list(vectorized) == looped
+    print(f"levels of 1M scores: calculate_levels {vectorized_ms:.1f} ms | calculate_level loop {looped_ms:.1f} ms "
+          f"| identical: {same}")
+    print(f"categories: {[(entry['category'], entry['scans']) for entry in report['categories']]}")
+    print(f"carbon percentiles: {report['carbonFootprint']['percentiles']}")
+    return 0 if same and report["scans"] == SCANS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
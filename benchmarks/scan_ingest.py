@@ -0,0 +1,93 @@
+"""Concurrency check and latency comparison for scan ingestion.
+
+Fires concurrent scans for a single user through the current `create_scan`
+and through the old read-modify-write path, then verifies that every scan was
+counted and reports per-scan latency for both.
+
+Always uses the mongo storage engine, since lost updates are a database
+concern; needs a reachable MongoDB (MONGO_URL) and uses a throwaway database.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/scan_ingest.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+os.environ["STORAGE_ENGINE"] = "mongo"
+# Every scan repeats the same barcode on purpose
+os.environ["SCAN_DEDUPE_SECONDS"] = "0"
+
+from common import percentile
+import server
+from server import Scan, ScanCreate, User, calculate_level
+
+db = server.storage.db
+
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "200"))
+BARCODE = "1004"
+
+
+async def legacy_create_scan(scan_data: ScanCreate, user_id: str):
+    """The pre-atomic scan path: four sequential round trips, Python-side math."""
+    product = await db.products.find_one({"barcode": scan_data.productBarcode}, {"_id": 0})
+    scan = Scan(
+        userId=user_id,
+        productBarcode=scan_data.productBarcode,
+        productName=product['name'],
+        score=product['sustainabilityScore']
+    )
+    await db.scans.insert_one(scan.model_dump())
+    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    new_eco_score = user['ecoScore'] + product['sustainabilityScore']
+    await db.users.update_one(
+        {"id": user_id},
+        {"$set": {
+            "totalScans": user['totalScans'] + 1,
+            "ecoScore": new_eco_score,
+            "level": calculate_level(new_eco_score)
+        }}
+    )
+
+
+async def run(name, handler):
+    user = User(name=f"bench {name}", email=f"bench-{name}@terraquest.com")
+    await db.users.insert_one(user.model_dump())
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await handler(ScanCreate(productBarcode=BARCODE), user.id)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+
+    product = await db.products.find_one({"barcode": BARCODE})
+    stored = await db.users.find_one({"id": user.id})
+    expected_score = CONCURRENCY * product['sustainabilityScore']
+    lost = CONCURRENCY - stored['totalScans']
+    print(f"{name:>8}: {CONCURRENCY / elapsed:8.1f} scans/s | "
+          f"p50 {statistics.median(latencies):6.2f} ms | p99 {percentile(latencies, 99):6.2f} ms | "
+          f"totalScans {stored['totalScans']}/{CONCURRENCY} (lost {lost}) | "
+          f"ecoScore {stored['ecoScore']}/{expected_score} | level {stored['level']}")
+    return lost == 0 and stored['ecoScore'] == expected_score and stored['level'] == calculate_level(expected_score)
+
+
+async def main():
+    await server.storage.reset()
+    await server.init_db()
+    try:
+        atomic_ok = await run("atomic", server.create_scan)
+        await run("legacy", legacy_create_scan)
+    finally:
+        await server.storage.reset()
+        server.storage.close()
+    print("no lost updates on the atomic path" if atomic_ok else "atomic path LOST updates")
+    return 0 if atomic_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,132 @@
+"""Storage size and read latency of the two mongo scan layouts.
+
+Writes the same synthetic scan history in both layouts ("documents": one
+document per scan, "buckets": one document per user and day), then reports
+bytes per scan (BSON as sent, plus the server's collStats when available) and
+the latency of reading a user's newest page and paging through their whole
+history via GET /api/scans/user/{id}'s storage calls.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/scan_layouts.py
+
+BENCH_USERS, BENCH_SCANS_PER_USER and BENCH_DAYS size the history.
+"""
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+os.environ["STORAGE_ENGINE"] = "mongo"
+
+from common import percentile
+import bson
+from pymongo.errors import OperationFailure
+from storage import SCAN_LAYOUTS, create_storage
+
+USERS = int(os.environ.get("BENCH_USERS", "200"))
+SCANS_PER_USER = int(os.environ.get("BENCH_SCANS_PER_USER", "500"))
+DAYS = int(os.environ.get("BENCH_DAYS", "90"))
+PAGE_SIZE = int(os.environ.get("BENCH_PAGE_SIZE", "100"))
+READ_SAMPLES = int(os.environ.get("BENCH_READ_SAMPLES", "200"))
+BATCH = 5000
+
+
+def synthetic_scans():
+    rng = random.Random(42)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    barcodes = [str(1001 + offset) for offset in range(8)]
+    for _ in range(USERS):
+        user_id = str(uuid.uuid4())
+        for _ in range(SCANS_PER_USER):
+            scanned_at = now - timedelta(seconds=rng.randrange(DAYS * 86400), milliseconds=rng.randrange(1000))
+            yield {
+                "id": str(uuid.uuid4()),
+                "userId": user_id,
+                "productBarcode": rng.choice(barcodes),
+                "productName": "Synthetic product name",
+                "score": rng.randrange(100),
+                "carbonFootprint": rng.randrange(100),
+                "scannedAt": scanned_at.isoformat(timespec="milliseconds"),
+            }
+
+
+async def collection_stats(storage, collection) -> dict:
+    try:
+        stats = await storage.db.command({"collStats": collection})
+    except (OperationFailure, NotImplementedError):
+        return {}
+    return {"size": stats.get("size", 0), "storageSize": stats.get("storageSize", 0),
+            "totalIndexSize": stats.get("totalIndexSize", 0)}
+
+
+async def encoded_bytes(collection) -> int:
+    total = 0
+    async for document in collection.find({}, {"_id": 0}):
+        total += len(bson.encode(document))
+    return total
+
+
+async def timed(samples, call):
+    latencies = []
+    for sample in samples:
+        started = time.perf_counter()
+        await call(sample)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def read_all(scans, user_id):
+    before = None
+    while True:
+        page = await scans.page_for_user(user_id, before, PAGE_SIZE)
+        if len(page) < PAGE_SIZE:
+            return
+        before = (page[-1]["scannedAt"], page[-1]["id"])
+
+
+async def main():
+    storage = create_storage()
+    await storage.reset()
+    await storage.ensure_indexes()
+    await storage.products.insert_many([
+        {"barcode": str(1001 + offset), "name": f"Product {offset}", "carbonFootprint": 10} for offset in range(8)
+    ])
+    repositories = {layout: storage.scan_repository(layout) for layout in SCAN_LAYOUTS}
+    total = USERS * SCANS_PER_USER
+    print(f"{total} scans: {USERS} users x {SCANS_PER_USER} over {DAYS} days")
+
+    user_ids = set()
+    batch = []
+    for scan in synthetic_scans():
+        user_ids.add(scan["userId"])
+        batch.append(scan)
+        if len(batch) == BATCH:
+            await asyncio.gather(*(repository.insert_many(batch) for repository in repositories.values()))
+            batch = []
+    if batch:
+        await asyncio.gather(*(repository.insert_many(batch) for repository in repositories.values()))
+
+    rng = random.Random(7)
+    samples = [rng.choice(sorted(user_ids)) for _ in range(READ_SAMPLES)]
+    for layout, repository in repositories.items():
+        name = repository.collection.name
+        documents = await repository.collection.count_documents({})
+        encoded = await encoded_bytes(repository.collection)
+        stats = await collection_stats(storage, name)
+        first_page = await timed(samples, lambda user_id: repository.page_for_user(user_id, None, PAGE_SIZE))
+        full_history = await timed(samples[:READ_SAMPLES // 10 or 1], lambda user_id: read_all(repository, user_id))
+        print(f"{layout:>9}: {documents:8d} docs | {encoded / total:6.1f} B/scan BSON", end="")
+        if stats:
+            print(f" | data {stats['size'] / total:6.1f} B/scan, on disk {stats['storageSize'] / total:6.1f} B/scan, "
+                  f"indexes {stats['totalIndexSize'] / total:6.1f} B/scan", end="")
+        print(f" | newest page p50 {statistics.median(first_page):6.2f} ms p99 {percentile(first_page, 99):6.2f} ms"
+              f" | full history p50 {statistics.median(full_history):7.2f} ms")
+
+    await storage.reset()
+    storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
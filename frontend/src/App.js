@@ -15,6 +15,17 @@ export const API = `${BACKEND_URL}/api`;
 
 export const AuthContext = createContext();
 
+const setAuthHeader = (token) => {
+  if (token) {
+    axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
+  } else {
+    delete axios.defaults.headers.common['Authorization'];
+  }
+};
+
+// Set before the first render so pages' initial requests are authenticated
+setAuthHeader(localStorage.getItem('token'));
+
 function App() {
   const [user, setUser] = useState(null);
   const [token, setToken] = useState(localStorage.getItem('token'));
@@ -29,6 +40,7 @@ function App() {
   }, []);
 
   const login = (userData, userToken) => {
+    setAuthHeader(userToken);
     setUser(userData);
     setToken(userToken);
     localStorage.setItem('user', JSON.stringify(userData));
@@ -36,12 +48,27 @@ function App() {
   };
 
   const logout = () => {
+    setAuthHeader(null);
     setUser(null);
     setToken(null);
     localStorage.removeItem('user');
     localStorage.removeItem('token');
   };
 
+  useEffect(() => {
+    // Expired or revoked token: drop the session and send the user to login
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      (error) => {
+        if (error.response?.status === 401 && localStorage.getItem('token')) {
+          logout();
+        }
+        return Promise.reject(error);
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   const updateUser = (updatedUser) => {
     setUser(updatedUser);
     localStorage.setItem('user', JSON.stringify(updatedUser));
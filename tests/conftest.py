@@ -0,0 +1,12 @@
+"""Puts `backend/` on sys.path and runs the app on the in-memory storage
+engine, so it must be loaded before `server` is imported."""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ["STORAGE_ENGINE"] = "memory"
+# Tests repeat barcodes on purpose; each request is its own scan
+os.environ["SCAN_DEDUPE_SECONDS"] = "0"
+# Validate fast-path responses through their models, so drift fails tests
+os.environ["STRICT_RESPONSES"] = "true"
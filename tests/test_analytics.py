@@ -0,0 +1,131 @@
+"""Vectorized levels and the analytics report, checked against plain Python.
+
+calculate_levels must agree with calculate_level on both sides of every
+band edge, and the chunked report must come out the same as tallying the
+scans one by one, however they are split into chunks.
+"""
+import asyncio
+import csv
+import math
+import random
+
+import numpy as np
+import pytest
+
+from analytics import CARBON_HISTOGRAM_MAX, CARBON_MAX, UNCATEGORIZED, CsvWriter, analyze
+from scoring import LEVEL_THRESHOLDS, LEVELS, TOP_LEVEL, calculate_level, calculate_levels
+from storage import MemoryStorage
+
+PRODUCTS = [
+    {"barcode": "P1", "name": "Oat Milk", "category": "Beverages", "brand": "Oatly", "carbonFootprint": 12},
+    {"barcode": "P2", "name": "Sparkling Water", "category": "Beverages", "brand": "", "carbonFootprint": 3},
+    {"barcode": "P3", "name": "Granola", "category": "Snacks", "brand": "Crunch", "carbonFootprint": 140},
+    {"barcode": "P4", "name": "Soap", "category": "", "brand": "Clean", "carbonFootprint": 7},
+]
+CATEGORY = {"P1": "Beverages", "P2": "Beverages", "P3": "Snacks", "P4": UNCATEGORIZED, "GONE": UNCATEGORIZED}
+CARBON = {product["barcode"]: product["carbonFootprint"] for product in PRODUCTS}
+
+
+def test_levels_match_at_the_band_edges():
+    edges = [limit for limit, _ in LEVEL_THRESHOLDS]
+    scores = sorted({0, 1, *(edge + step for edge in edges for step in (-1, 0, 1)), 10 ** 6})
+    expected = [calculate_level(score) for score in scores]
+
+    assert list(calculate_levels(np.array(scores))) == expected
+    assert calculate_level(499) == calculate_level(0) == LEVELS[0]
+    assert calculate_level(500) == calculate_level(999) == LEVELS[1]
+    assert calculate_level(1000) == LEVELS[2]
+    assert calculate_level(edges[-1]) == calculate_level(10 ** 6) == TOP_LEVEL
+    # Lists and empty arrays go through as well
+    assert list(calculate_levels(scores)) == expected
+    assert len(calculate_levels(np.array([], dtype=np.int64))) == 0
+
+
+def make_scans(count):
+    rng = random.Random(24)
+    scans = []
+    for index in range(count):
+        barcode = rng.choice(list(CATEGORY))
+        scan = {"id": f"s{index:04d}", "userId": f"u{index % 9}", "productBarcode": barcode,
+                "productName": barcode, "score": rng.randrange(-5, 120),
+                "scannedAt": f"2026-03-01T10:{index // 60 % 60:02d}:{index % 60:02d}+00:00"}
+        # Older scans carry no footprint and get the product's
+        if index % 4:
+            scan["carbonFootprint"] = rng.choice([0, 5, 9, 10, 99, 100, 250, CARBON_MAX + 50])
+        scans.append(scan)
+    return scans
+
+
+def expected_report(scans, eco_scores):
+    carbon = [scan.get("carbonFootprint", CARBON.get(scan["productBarcode"], 0)) for scan in scans]
+    categories = {}
+    for scan, footprint in zip(scans, carbon):
+        totals = categories.setdefault(CATEGORY[scan["productBarcode"]], [0, 0, 0])
+        totals[0] += 1
+        totals[1] += scan["score"]
+        totals[2] += footprint
+    ranked = sorted(carbon)
+    levels = [calculate_level(score) for score in eco_scores]
+    return {
+        "categories": [
+            {"category": category, "scans": count, "share": round(count / len(scans), 4),
+             "averageScore": round(score / count, 2), "carbonFootprint": footprint}
+            for category, (count, score, footprint) in sorted(categories.items(),
+                                                               key=lambda item: (-item[1][0], item[0]))
+        ],
+        "total": sum(carbon),
+        "percentiles": {f"p{pct}": min(ranked[max(1, math.ceil(pct / 100 * len(ranked))) - 1], CARBON_MAX)
+                        for pct in (50, 90, 99)},
+        "overflow": sum(footprint >= CARBON_HISTOGRAM_MAX for footprint in carbon),
+        "levels": {level: levels.count(level) for level in LEVELS},
+    }
+
+
+async def load(storage, scans, eco_scores):
+    await storage.products.upsert_many(PRODUCTS)
+    await storage.scans.insert_many(scans)
+    for index, score in enumerate(eco_scores):
+        await storage.users.insert({"id": f"u{index}", "email": f"u{index}@terraquest.com", "ecoScore": score})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_report_matches_a_recount(chunk_size, tmp_path):
+    scans = make_scans(300)
+    eco_scores = [0, 499, 500, 999, 1000, 1999, 2000, 3499, 3500, 12000]
+    storage = MemoryStorage()
+    writer = CsvWriter(tmp_path / "scans.csv")
+
+    async def run():
+        await load(storage, scans, eco_scores)
+        try:
+            return await analyze(storage, chunk_size, writer)
+        finally:
+            writer.close()
+
+    report = asyncio.run(run())
+    expected = expected_report(scans, eco_scores)
+
+    assert report["scans"] == len(scans)
+    assert report["categories"] == expected["categories"]
+    assert report["carbonFootprint"]["total"] == expected["total"]
+    assert report["carbonFootprint"]["percentiles"] == expected["percentiles"]
+    histogram = report["carbonFootprint"]["histogram"]
+    assert sum(bucket["scans"] for bucket in histogram) == len(scans)
+    assert histogram[-1] == {"from": CARBON_HISTOGRAM_MAX, "to": None, "scans": expected["overflow"]}
+    assert report["users"] == len(eco_scores)
+    assert {entry["level"]: entry["users"] for entry in report["levels"]} == expected["levels"]
+
+    with open(tmp_path / "scans.csv", newline="", encoding="utf-8") as handle:
+        rows = {row["id"]: row for row in csv.DictReader(handle)}
+    assert len(rows) == len(scans)
+    for scan in scans:
+        row = rows[scan["id"]]
+        assert row["category"] == CATEGORY[scan["productBarcode"]]
+        assert int(row["carbonFootprint"]) == scan.get("carbonFootprint", CARBON.get(scan["productBarcode"], 0))
+
+
+def test_empty_report():
+    report = asyncio.run(analyze(MemoryStorage(), 10))
+    assert (report["scans"], report["users"], report["categories"]) == (0, 0, [])
+    assert report["carbonFootprint"]["average"] is None
+    assert all(entry["users"] == 0 and entry["share"] == 0.0 for entry in report["levels"])
@@ -0,0 +1,78 @@
+"""Access tokens expire, and the verified-claims cache never outlives them."""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import jwt
+import pytest
+
+import server
+
+
+def token(user_id, expires_in):
+    exp = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    return jwt.encode({"user_id": user_id, "exp": exp}, server.SECRET_KEY, algorithm=server.ALGORITHM)
+
+
+async def with_user(run):
+    await server.storage.reset()
+    await server.init_db()
+    server.token_cache.clear()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        response = await http.post("/api/auth/register", json={
+            "name": "Holder", "email": "holder@terraquest.com", "password": "HolderPass123!",
+        })
+        body = response.json()
+        return await run(http, body["user"]["id"], body["token"])
+
+
+async def get_user(http, user_id, access_token):
+    return await http.get(f"/api/users/{user_id}", headers={"Authorization": f"Bearer {access_token}"})
+
+
+def test_issued_tokens_expire():
+    async def run(http, user_id, access_token):
+        return jwt.decode(access_token, options={"verify_signature": False})
+
+    claims = asyncio.run(with_user(run))
+    expected = time.time() + server.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    assert abs(claims["exp"] - expected) < 60
+
+
+def test_expired_and_exp_less_tokens_are_rejected():
+    async def run(http, user_id, access_token):
+        forever = jwt.encode({"user_id": user_id}, server.SECRET_KEY, algorithm=server.ALGORITHM)
+        return [
+            (await get_user(http, user_id, access_token)).status_code,
+            (await get_user(http, user_id, token(user_id, -10))).status_code,
+            (await get_user(http, user_id, forever)).status_code,
+            (await get_user(http, user_id, access_token + "x")).status_code,
+        ]
+
+    assert asyncio.run(with_user(run)) == [200, 401, 401, 401]
+
+
+def test_claims_are_cached_until_the_token_expires(monkeypatch):
+    async def run(http, user_id, access_token):
+        short = token(user_id, 30)
+        assert (await get_user(http, user_id, short)).status_code == 200
+        hits = server.token_cache.hits
+        assert (await get_user(http, user_id, short)).status_code == 200
+        assert server.token_cache.hits == hits + 1
+        # Past its exp, the cached claims no longer authenticate
+        now = time.time()
+        monkeypatch.setattr(server.time, "time", lambda: now + 60)
+        response = await get_user(http, user_id, short)
+        assert server.token_cache.get(short) is server.MISSING
+        return response
+
+    response = asyncio.run(with_user(run))
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid or expired token"
+
+
+def test_decode_rejects_tampered_tokens():
+    with pytest.raises(jwt.InvalidTokenError):
+        server.decode_access_token(token("someone", 60)[:-2] + "xx")
@@ -0,0 +1,131 @@
+"""Catalogue import: the rejects report, and resuming from a checkpoint.
+
+An interrupted import resumed from its checkpoint must end up with every row
+imported or rejected exactly once in its totals, whatever batch failed.
+"""
+import asyncio
+import csv
+import json
+
+import pytest
+
+from catalog_import import import_catalog
+from server import Product
+from storage import MemoryStorage
+
+HEADER = ["barcode", "name", "carbonFootprint", "recyclable", "ethicalScore", "sustainabilityScore", "category"]
+ROWS = 23
+# Row number -> why it is rejected
+BAD_ROWS = {4: "carbonFootprint", 9: "expected 7 columns", 17: "ethicalScore"}
+
+
+def write_csv(path):
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(HEADER)
+        for row in range(1, ROWS + 1):
+            values = [f"B{row:03d}", f"Product {row}", str(row), "true", "50", "60", "Snacks"]
+            if row == 4:
+                values[2] = "heavy"
+            elif row == 9:
+                values = values[:3]
+            elif row == 17:
+                values[4] = ""
+            elif row % 5 == 0:
+                # Quoted fields spanning lines
+                values[1] = f"Product {row}\nfamily pack, \"new\""
+            writer.writerow(values)
+
+
+def rejects_of(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def check_imported(storage, result):
+    assert result["rows"] == ROWS
+    assert result["imported"] == ROWS - len(BAD_ROWS)
+    assert result["rejected"] == len(BAD_ROWS)
+    stored = asyncio.run(storage.products.get_many([f"B{row:03d}" for row in range(1, ROWS + 1)]))
+    assert sorted(product["barcode"] for product in stored) == [
+        f"B{row:03d}" for row in range(1, ROWS + 1) if row not in BAD_ROWS
+    ]
+    assert {product["barcode"]: product["name"] for product in stored}["B010"] == 'Product 10\nfamily pack, "new"'
+
+
+def test_import_reports_rejected_rows(tmp_path):
+    feed, checkpoint, rejects = tmp_path / "products.csv", tmp_path / "products.ckpt", tmp_path / "rejects.jsonl"
+    write_csv(feed)
+    storage = MemoryStorage()
+
+    result = asyncio.run(import_catalog(storage, feed, Product, batch_size=4, concurrency=3,
+                                       checkpoint_path=checkpoint, rejects_path=rejects))
+
+    check_imported(storage, result)
+    assert not result["resumed"]
+    report = rejects_of(rejects)
+    assert sorted(entry["row"] for entry in report) == sorted(BAD_ROWS)
+    for entry in report:
+        assert BAD_ROWS[entry["row"]] in entry["reason"]
+        assert entry["data"] is None or entry["data"]["barcode"] == f"B{entry['row']:03d}"
+    saved = json.loads(checkpoint.read_text())
+    assert saved["offset"] == feed.stat().st_size
+    assert (saved["rows"], saved["rejected"]) == (ROWS, len(BAD_ROWS))
+
+
+@pytest.mark.parametrize("failing_batch", [0, 2, 4])
+def test_interrupted_import_resumes_from_its_checkpoint(tmp_path, failing_batch):
+    feed, checkpoint, rejects = tmp_path / "products.csv", tmp_path / "products.ckpt", tmp_path / "rejects.jsonl"
+    write_csv(feed)
+    storage = MemoryStorage()
+    upsert_many = storage.products.upsert_many
+    calls = []
+
+    async def failing_upsert_many(products):
+        calls.append(len(products))
+        if len(calls) == failing_batch + 1:
+            raise ConnectionError("connection reset")
+        return await upsert_many(products)
+
+    storage.products.upsert_many = failing_upsert_many
+    with pytest.raises(ConnectionError):
+        asyncio.run(import_catalog(storage, feed, Product, batch_size=3, concurrency=2,
+                                   checkpoint_path=checkpoint, rejects_path=rejects))
+    if checkpoint.exists():
+        assert json.loads(checkpoint.read_text())["offset"] < feed.stat().st_size
+
+    storage.products.upsert_many = upsert_many
+    result = asyncio.run(import_catalog(storage, feed, Product, batch_size=3, concurrency=2,
+                                       checkpoint_path=checkpoint, rejects_path=rejects))
+
+    check_imported(storage, result)
+    assert result["resumed"] == (failing_batch > 0)
+    # Batches re-applied on resume may report their rejects again
+    assert {entry["row"] for entry in rejects_of(rejects)} == set(BAD_ROWS)
+
+
+def test_checkpoint_of_a_changed_feed_is_refused(tmp_path):
+    feed, checkpoint = tmp_path / "products.csv", tmp_path / "products.ckpt"
+    write_csv(feed)
+    storage = MemoryStorage()
+    asyncio.run(import_catalog(storage, feed, Product, checkpoint_path=checkpoint))
+    with open(feed, "a", encoding="utf-8") as handle:
+        handle.write("B999,Late,1,true,50,60,Snacks\n")
+
+    with pytest.raises(ValueError, match="different or changed feed"):
+        asyncio.run(import_catalog(storage, feed, Product, checkpoint_path=checkpoint))
+
+
+def test_jsonl_rows_that_are_not_objects_are_rejected(tmp_path):
+    feed, rejects = tmp_path / "products.jsonl", tmp_path / "rejects.jsonl"
+    good = {"barcode": "J1", "name": "Oat Milk", "carbonFootprint": 3, "recyclable": True,
+            "ethicalScore": 70, "sustainabilityScore": 80}
+    feed.write_text("\n".join([json.dumps(good), "{not json", "[1, 2]", "", json.dumps({"barcode": "J2"})]) + "\n")
+    storage = MemoryStorage()
+
+    result = asyncio.run(import_catalog(storage, feed, Product, rejects_path=rejects))
+
+    assert (result["rows"], result["imported"], result["rejected"]) == (4, 1, 3)
+    reasons = {entry["row"]: entry["reason"] for entry in rejects_of(rejects)}
+    assert reasons[2].startswith("invalid JSON") and reasons[3] == "expected a JSON object"
+    assert "name: Field required" in reasons[4]
+    assert asyncio.run(storage.products.get_many(["J1"]))[0]["name"] == "Oat Milk"
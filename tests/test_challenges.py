@@ -0,0 +1,55 @@
+"""Challenge counters: weekly counts are kept for the current week only."""
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+
+import server
+from cache import TTLCache
+from challenges import week_key
+from write_behind import ScanWriteBuffer
+
+PAST_WEEK = "2020-W01"
+
+
+async def scan_after_a_past_week(buffered):
+    await server.storage.reset()
+    await server.init_db()
+    await server.load_challenges()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        response = await http.post("/api/auth/register", json={
+            "name": "Weekly", "email": "weekly@terraquest.com", "password": "WeeklyPass123!",
+        })
+        body = response.json()
+        user_id, headers = body["user"]["id"], {"Authorization": f"Bearer {body['token']}"}
+        await server.storage.challenge_progress.advance(user_id, {f"c1.counts.{PAST_WEEK}": 4}, {})
+        if buffered:
+            server.scan_buffer = ScanWriteBuffer(server.storage, 0.01, 500, 10000)
+            server.scan_buffer.start()
+            server.challenge_engine.buffer_progress(server.scan_buffer, TTLCache(100, 600))
+        try:
+            # Above HIGH_SCORE
+            response = await http.post("/api/scans", json={"productBarcode": "1004"}, headers=headers)
+            assert response.status_code == 200
+            challenges = (await http.get(f"/api/users/{user_id}/challenges", headers=headers)).json()
+            if buffered:
+                await server.scan_buffer.drain()
+        finally:
+            server.scan_buffer = None
+            server.challenge_engine.buffer_progress(None, None)
+    progress = await server.storage.challenge_progress.get(user_id)
+    return progress["rules"]["c1"]["counts"], {challenge["id"]: challenge for challenge in challenges}
+
+
+def check_past_week_dropped(counts, challenges):
+    assert counts == {week_key(datetime.now(timezone.utc).date()): 1}
+    assert challenges["c1"]["progress"] == 1
+
+
+def test_past_weeks_are_dropped():
+    check_past_week_dropped(*asyncio.run(scan_after_a_past_week(buffered=False)))
+
+
+def test_past_weeks_are_dropped_with_write_behind():
+    check_past_week_dropped(*asyncio.run(scan_after_a_past_week(buffered=True)))
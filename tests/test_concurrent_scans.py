@@ -0,0 +1,122 @@
+"""Concurrent scans for one user must not lose updates.
+
+Fires many scans for the same user at once through the API and checks that
+the stored totals, the leaderboard and challenge progress account for every
+one of them, and that each challenge is awarded exactly once.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+
+import server
+from cache import TTLCache
+from challenges import week_key
+from scoring import calculate_level
+from write_behind import ScanWriteBuffer
+
+# Barcode -> sustainabilityScore of seeded products, above and below HIGH_SCORE
+SCORES = {"1004": 92, "1006": 95, "1001": 45}
+SCANS = 60
+BATCHES = 10
+BATCH_SIZE = 5
+
+
+def barcodes(count):
+    cycle = list(SCORES)
+    return [cycle[index % len(cycle)] for index in range(count)]
+
+
+async def scan_concurrently(send):
+    await server.storage.reset()
+    await server.init_db()
+    await server.load_challenges()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        response = await http.post("/api/auth/register", json={
+            "name": "Racer", "email": "racer@terraquest.com", "password": "RacerPass123!",
+        })
+        body = response.json()
+        user_id, headers = body["user"]["id"], {"Authorization": f"Bearer {body['token']}"}
+        scanned = await send(http, headers)
+        user = (await http.get(f"/api/users/{user_id}", headers=headers)).json()
+        challenges = (await http.get(f"/api/users/{user_id}/challenges", headers=headers)).json()
+    return user, {challenge["id"]: challenge for challenge in challenges}, scanned
+
+
+def check_totals(user, challenges, scanned):
+    high_scores = sum(1 for barcode in scanned if SCORES[barcode] > 70)
+    rewards = sum(challenge["reward"] for challenge in challenges.values() if challenge["completed"])
+
+    assert user["totalScans"] == len(scanned)
+    assert user["ecoScore"] == sum(SCORES[barcode] for barcode in scanned) + rewards
+    assert user["level"] == calculate_level(user["ecoScore"])
+    assert sorted(user["awardedChallenges"]) == sorted(
+        challenge_id for challenge_id, challenge in challenges.items() if challenge["completed"])
+
+    # "5 scans with score > 70" this week: met, and awarded exactly once
+    assert challenges["c1"]["completed"] and challenges["c1"]["progress"] == 5
+    # "Total EcoScore >= 1000"
+    assert challenges["c3"]["completed"]
+
+    ranked = server.leaderboard.rank(user["id"])
+    assert (ranked["ecoScore"], ranked["totalScans"]) == (user["ecoScore"], user["totalScans"])
+
+    progress = asyncio.run(server.storage.challenge_progress.get(user["id"]))
+    week = week_key(datetime.now(timezone.utc).date())
+    assert progress["rules"]["c1"]["counts"][week] == high_scores
+
+
+def test_concurrent_single_scans_lose_no_updates():
+    async def send(http, headers):
+        scanned = barcodes(SCANS)
+        responses = await asyncio.gather(*(
+            http.post("/api/scans", json={"productBarcode": barcode}, headers=headers) for barcode in scanned
+        ))
+        assert [response.status_code for response in responses] == [200] * SCANS
+        assert not any(response.json()["duplicate"] for response in responses)
+        # Each challenge is reported as completed by exactly one request
+        completed = [challenge for response in responses for challenge in response.json()["completedChallenges"]]
+        assert sorted(completed) == sorted(set(completed))
+        return scanned
+
+    check_totals(*asyncio.run(scan_concurrently(send)))
+
+
+def test_concurrent_batches_lose_no_updates():
+    async def send(http, headers):
+        batches = [barcodes(BATCH_SIZE) for _ in range(BATCHES)]
+        responses = await asyncio.gather(*(
+            http.post("/api/scans/batch", json={"scans": [{"productBarcode": barcode} for barcode in batch]},
+                      headers=headers)
+            for batch in batches
+        ))
+        assert [response.status_code for response in responses] == [200] * BATCHES
+        return [barcode for batch in batches for barcode in batch]
+
+    check_totals(*asyncio.run(scan_concurrently(send)))
+
+
+def test_concurrent_buffered_scans_lose_no_updates():
+    async def send(http, headers):
+        server.scan_buffer = ScanWriteBuffer(server.storage, 0.01, 500, 10000)
+        server.scan_buffer.start()
+        server.challenge_engine.buffer_progress(server.scan_buffer, TTLCache(100, 600))
+        try:
+            scanned = barcodes(SCANS)
+            responses = await asyncio.gather(*(
+                http.post("/api/scans", json={"productBarcode": barcode}, headers=headers) for barcode in scanned
+            ))
+            assert [response.status_code for response in responses] == [200] * SCANS
+            completed = [challenge for response in responses for challenge in response.json()["completedChallenges"]]
+            assert sorted(completed) == sorted(set(completed))
+            await server.scan_buffer.drain()
+        finally:
+            server.scan_buffer = None
+            server.challenge_engine.buffer_progress(None, None)
+        return scanned
+
+    user, challenges, scanned = asyncio.run(scan_concurrently(send))
+    check_totals(user, challenges, scanned)
+    stored = asyncio.run(server.storage.users.get_by_id(user["id"]))
+    assert (stored["ecoScore"], stored["totalScans"]) == (user["ecoScore"], user["totalScans"])
@@ -0,0 +1,98 @@
+"""Keyset pagination of products and user scans, and its cursor checks."""
+import asyncio
+import base64
+import json
+
+import httpx
+
+import server
+
+SCANS = 25
+# Scans sharing a timestamp must still page in (scannedAt, id) order
+SCANNED_AT = ["2026-01-01T10:00:00+00:00", "2026-01-01T10:00:00+00:00", "2026-01-02T09:30:00+00:00"]
+
+
+async def with_scans(run):
+    await server.storage.reset()
+    await server.init_db()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        response = await http.post("/api/auth/register", json={
+            "name": "Pager", "email": "pager@terraquest.com", "password": "PagerPass123!",
+        })
+        body = response.json()
+        user_id, headers = body["user"]["id"], {"Authorization": f"Bearer {body['token']}"}
+        await server.storage.scans.insert_many([{
+            "id": f"scan-{index:02d}", "userId": user_id, "productBarcode": "1001", "productName": "Coca-Cola",
+            "score": 45, "carbonFootprint": 65, "scannedAt": SCANNED_AT[index % len(SCANNED_AT)],
+        } for index in range(SCANS)])
+        return await run(http, user_id, headers)
+
+
+async def read_pages(http, path, limit, headers=None):
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = await http.get(path, params=params, headers=headers)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get(server.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return pages
+
+
+def cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def test_products_page_by_barcode():
+    async def run(http, user_id, headers):
+        everything = (await http.get("/api/products")).json()
+        return everything, await read_pages(http, "/api/products", 4)
+
+    everything, pages = asyncio.run(with_scans(run))
+    barcodes = [product["barcode"] for page in pages for product in page]
+    assert barcodes == sorted(product["barcode"] for product in everything)
+    assert all(len(page) == 4 for page in pages[:-1])
+
+
+def test_scans_page_newest_first_without_gaps_or_repeats():
+    async def run(http, user_id, headers):
+        pages = await read_pages(http, f"/api/scans/user/{user_id}", 4, headers)
+        streamed = await http.get(f"/api/scans/user/{user_id}", params={"format": "ndjson"}, headers=headers)
+        return pages, [json.loads(line) for line in streamed.text.splitlines()]
+
+    pages, streamed = asyncio.run(with_scans(run))
+    scans = [scan for page in pages for scan in page]
+    keys = [(scan["scannedAt"], scan["id"]) for scan in scans]
+    assert len(keys) == SCANS
+    assert keys == sorted(set(keys), reverse=True)
+    assert [scan["id"] for scan in streamed] == [scan["id"] for scan in scans]
+
+
+def test_last_full_page_ends_with_an_empty_one():
+    async def run(http, user_id, headers):
+        return await read_pages(http, f"/api/scans/user/{user_id}", 5, headers)
+
+    pages = asyncio.run(with_scans(run))
+    assert [len(page) for page in pages] == [5] * 5 + [0]
+
+
+def test_bad_cursors_and_limits_are_rejected():
+    async def run(http, user_id, headers):
+        scans = f"/api/scans/user/{user_id}"
+        return [
+            (await http.get(scans, params=params, headers=headers)).status_code
+            for params in (
+                {"cursor": "not base64!"},
+                {"cursor": cursor("2026-01-01T10:00:00+00:00")},  # one value, scans need two
+                {"cursor": cursor("2026-01-01T10:00:00+00:00", 7)},  # not a string
+                {"limit": 0},
+                {"limit": server.MAX_PAGE_SIZE + 1},
+            )
+        ] + [
+            (await http.get("/api/products", params={"cursor": cursor("1001", "1002")})).status_code,
+            (await http.get("/api/products", params={"cursor": "e30="})).status_code,  # {}
+        ]
+
+    assert asyncio.run(with_scans(run)) == [400] * 7
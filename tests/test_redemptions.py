@@ -0,0 +1,83 @@
+"""Reward redemptions: no overspending, and Idempotency-Key retries.
+
+Concurrent redemptions may only spend what the balance covers, a retried
+request gets its original redemption back, and a key can't be reused to
+redeem a different reward.
+"""
+import asyncio
+
+import httpx
+
+import server
+
+REWARD_ID = "r2"
+OTHER_REWARD_ID = "r1"
+AFFORDABLE = 3
+ATTEMPTS = 10
+
+
+async def with_user(run):
+    await server.storage.reset()
+    await server.init_db()
+    cost = (await server.storage.rewards.get(REWARD_ID))["pointsRequired"]
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        response = await http.post("/api/auth/register", json={
+            "name": "Redeemer", "email": "redeemer@terraquest.com", "password": "RedeemPass123!",
+        })
+        body = response.json()
+        user_id, headers = body["user"]["id"], {"Authorization": f"Bearer {body['token']}"}
+        # Half a redemption's worth on top, so the last attempt is just short
+        balance = AFFORDABLE * cost + cost // 2
+        server.leaderboard.update(await server.storage.users.apply_scan_stats(user_id, balance, 0))
+        return await run(http, user_id, headers, balance, cost)
+
+
+async def redeem(http, headers, key, reward_id=REWARD_ID):
+    return await http.post(f"/api/rewards/{reward_id}/redeem", headers={**headers, "Idempotency-Key": key})
+
+
+async def balance_of(user_id):
+    return (await server.storage.users.get_by_id(user_id))["ecoScore"]
+
+
+def test_concurrent_redemptions_do_not_overspend():
+    async def run(http, user_id, headers, balance, cost):
+        responses = await asyncio.gather(*(redeem(http, headers, f"key-{index}") for index in range(ATTEMPTS)))
+        statuses = sorted(response.status_code for response in responses)
+        assert statuses == [200] * AFFORDABLE + [409] * (ATTEMPTS - AFFORDABLE)
+        assert await balance_of(user_id) == balance - AFFORDABLE * cost
+        ledger = (await http.get(f"/api/users/{user_id}/ledger", headers=headers)).json()
+        assert len(ledger) == AFFORDABLE
+
+    asyncio.run(with_user(run))
+
+
+def test_retried_redemption_is_replayed():
+    async def run(http, user_id, headers, balance, cost):
+        responses = await asyncio.gather(*(redeem(http, headers, "retried") for _ in range(5)))
+        assert [response.status_code for response in responses] == [200] * 5
+        assert len({response.json()["entry"]["id"] for response in responses}) == 1
+        assert sorted(response.json()["replayed"] for response in responses) == [False] + [True] * 4
+        assert await balance_of(user_id) == balance - cost
+
+    asyncio.run(with_user(run))
+
+
+def test_key_reused_for_another_reward_is_rejected():
+    async def run(http, user_id, headers, balance, cost):
+        assert (await redeem(http, headers, "reused")).status_code == 200
+        response = await redeem(http, headers, "reused", OTHER_REWARD_ID)
+        assert response.status_code == 422
+        assert await balance_of(user_id) == balance - cost
+
+        # Spent by a request that didn't get to write the ledger
+        await server.storage.users.spend_points(user_id, cost, {
+            "id": "interrupted", "userId": user_id, "type": "redeem", "rewardId": REWARD_ID,
+            "rewardName": "", "points": -cost, "idempotencyKey": "interrupted", "createdAt": "",
+        })
+        response = await redeem(http, headers, "interrupted", OTHER_REWARD_ID)
+        assert response.status_code == 422
+        assert (await redeem(http, headers, "interrupted")).json()["replayed"]
+
+    asyncio.run(with_user(run))
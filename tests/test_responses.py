@@ -0,0 +1,77 @@
+"""The fast response path (FAST_RESPONSES) against the validated one.
+
+conftest.py turns STRICT_RESPONSES on, so the fast path still validates
+every document through its model here, and stored data that drifted from
+the models fails the request instead of being served.
+"""
+import asyncio
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+import server
+
+ENDPOINTS = [
+    "/api/products",
+    "/api/products?limit=5",
+    "/api/challenges",
+    "/api/rewards",
+    "/api/products/search?q=organic",
+    "/api/products/search?category=Grocery&limit=3",
+]
+
+
+async def fetch(http, fast):
+    server.FAST_RESPONSES = fast
+    for snapshot in (server.products_snapshot, server.challenges_snapshot, server.rewards_snapshot):
+        snapshot.invalidate()
+    bodies = {}
+    for endpoint in ENDPOINTS:
+        response = await http.get(endpoint)
+        assert response.status_code == 200, endpoint
+        bodies[endpoint] = response.json()
+    return bodies
+
+
+async def with_catalog(run):
+    await server.storage.reset()
+    await server.init_db()
+    await server.load_search_index()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        return await run(http)
+
+
+@pytest.fixture(autouse=True)
+def restore_fast_responses(monkeypatch):
+    monkeypatch.setattr(server, "FAST_RESPONSES", server.FAST_RESPONSES)
+
+
+def test_shapes_are_strict():
+    assert server.STRICT_RESPONSES
+    assert all(shape.strict for shape in (server.product_shape, server.challenge_shape, server.reward_shape))
+
+
+def test_fast_responses_match_validated():
+    async def run(http):
+        return await fetch(http, fast=False), await fetch(http, fast=True)
+
+    validated, fast = asyncio.run(with_catalog(run))
+    assert fast == validated
+    assert fast["/api/products/search?q=organic"]["total"] >= 1
+
+
+def test_strict_fast_responses_reject_malformed_documents():
+    async def run(http):
+        server.FAST_RESPONSES = True
+        # No name, and a score that isn't a number
+        await server.storage.products.insert_many([{
+            "barcode": "0000", "carbonFootprint": 1, "recyclable": True, "ethicalScore": 1,
+            "sustainabilityScore": "high",
+        }])
+        server.invalidate_products()
+        with pytest.raises(ValidationError):
+            await http.get("/api/products", params={"limit": 50})
+
+    asyncio.run(with_catalog(run))
@@ -0,0 +1,123 @@
+"""The bucketed scan layout reads and pages scans back like the plain one.
+
+Runs MongoBucketedScanRepository against mongomock and compares it with the
+in-memory repository, which keeps scan documents as they are.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import storage as storage_module
+from storage import MemoryStorage, MongoStorage
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+USERS = ("u1", "u2")
+PRODUCTS = [{"barcode": barcode, "name": f"Product {barcode}", "carbonFootprint": 10, "recyclable": True,
+             "ethicalScore": 50, "sustainabilityScore": 60} for barcode in ("1001", "1002", "1003")]
+
+
+def scans():
+    start = datetime(2026, 3, 1, 22, 0, tzinfo=timezone.utc)
+    made = []
+    for index in range(40):
+        # Several days, and pairs of scans sharing a timestamp
+        at = start + timedelta(minutes=45 * (index // 2))
+        made.append({
+            "id": f"00000000-0000-4000-8000-{index:012d}",
+            "userId": "u2" if index % 3 == 0 else "u1",
+            "productBarcode": PRODUCTS[index % len(PRODUCTS)]["barcode"],
+            "productName": PRODUCTS[index % len(PRODUCTS)]["name"],
+            "score": index,
+            "carbonFootprint": index % 7,
+            # Bucket entries keep milliseconds
+            "scannedAt": at.isoformat(timespec="milliseconds"),
+            # mongomock ignores the partial filter on userId_keys_unique when
+            # upserting, so every bucket needs keys for buckets not to collide
+            "idempotencyKey": f"key-{index}",
+        })
+    return made
+
+
+@pytest.fixture
+def stores(monkeypatch):
+    monkeypatch.setattr(storage_module, "AsyncIOMotorClient", mongomock_motor.AsyncMongoMockClient)
+    # Small buckets, so a day spills into several
+    monkeypatch.setattr(storage_module, "SCAN_BUCKET_SIZE", 4)
+    bucketed = MongoStorage("mongodb://test", "buckets_test", "buckets")
+    plain = MemoryStorage()
+
+    async def load():
+        await bucketed.ensure_indexes()
+        for store in (bucketed, plain):
+            await store.products.upsert_many(PRODUCTS)
+            made = scans()
+            await store.scans.insert_many(made[:30])
+            for scan in made[30:]:
+                assert await store.scans.insert(scan)
+
+    asyncio.run(load())
+    return bucketed.scans, plain.scans
+
+
+async def pages(repository, user_id, limit):
+    pages, before = [], None
+    while True:
+        page = await repository.page_for_user(user_id, before, limit)
+        if not page:
+            return pages
+        pages.append(page)
+        before = (page[-1]["scannedAt"], page[-1]["id"])
+
+
+def test_pages_match_the_plain_layout(stores):
+    bucketed, plain = stores
+
+    async def run():
+        return [(await pages(bucketed, user_id, 3), await pages(plain, user_id, 3)) for user_id in USERS]
+
+    for bucketed_pages, plain_pages in asyncio.run(run()):
+        assert bucketed_pages == plain_pages
+        assert all(len(page) == 3 for page in bucketed_pages[:-1])
+
+
+def test_iteration_and_lookup_match_the_plain_layout(stores):
+    bucketed, plain = stores
+
+    async def run():
+        results = []
+        for repository in (bucketed, plain):
+            results.append((
+                [scan async for scan in repository.iterate_for_user("u2")],
+                [scan async for scan in repository.iterate_for_user("u2", limit=5)],
+                sorted([scan async for scan in repository.iterate_by_user()], key=lambda scan: scan["id"]),
+                sorted([scan["id"] async for chunk in repository.iterate_chunks(7) for scan in chunk]),
+                await repository.get("u1", "00000000-0000-4000-8000-000000000001"),
+                await repository.get("u2", "00000000-0000-4000-8000-000000000001"),
+            ))
+        return results
+
+    bucketed_results, plain_results = asyncio.run(run())
+    assert bucketed_results == plain_results
+    iterated, limited, everything, chunked, found, other_user = bucketed_results
+    assert limited == iterated[:5]
+    assert len(everything) == len(chunked) == 40
+    assert found["productName"] == "Product 1002" and other_user is None
+
+
+def test_idempotency_keys_are_read_back(stores):
+    bucketed, _ = stores
+    scan = {**scans()[0], "id": "00000000-0000-4000-8000-999999999999", "idempotencyKey": "retry-1"}
+
+    async def run():
+        stored = await bucketed.insert(scan)
+        return (stored, await bucketed.get_by_idempotency_key(scan["userId"], "retry-1"),
+                await bucketed.get_by_idempotency_key("u1", "key-5"),
+                await bucketed.get_by_idempotency_key("u1", "retry-1"))
+
+    stored, found, earlier, other_user = asyncio.run(run())
+    assert stored
+    assert found == scan
+    assert earlier == scans()[5]
+    assert other_user is None
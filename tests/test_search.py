@@ -0,0 +1,131 @@
+"""Product search: token matching, typo tolerance, ranking and facet counts."""
+import asyncio
+import random
+
+import httpx
+
+import server
+from search import ProductSearchIndex, tokenize, within_one_edit
+
+CATEGORIES = ("Beverages", "Snacks", "Household")
+WORDS = ("organic", "oat", "milk", "chocolate", "bamboo", "toothbrush", "sparkling", "water", "granola", "bar")
+
+
+def product(barcode, name, category="Snacks", recyclable=True, score=50, carbon=10, brand=""):
+    return {"barcode": barcode, "name": name, "brand": brand, "category": category, "recyclable": recyclable,
+            "sustainabilityScore": score, "carbonFootprint": carbon}
+
+
+def index_of(*products):
+    index = ProductSearchIndex()
+    index.add_many(products)
+    return index
+
+
+def test_every_token_must_match_exactly_or_by_prefix():
+    index = index_of(
+        product("1", "Organic Oat Milk", "Beverages", brand="Oatly"),
+        product("2", "Oat Granola Bar"),
+        product("3", "Chocolate Milk", "Beverages"),
+        product("4", "Oatcakes", score=99),
+    )
+    assert index.search("oat milk")["barcodes"] == ["1"]
+    # Brand and category are searched too
+    assert index.search("oatly")["barcodes"] == ["1"]
+    assert sorted(index.search("beverages")["barcodes"]) == ["1", "3"]
+    # Search as you type; exact matches outrank prefix ones, then ties go
+    # to the older product
+    assert index.search("gran")["barcodes"] == ["2"]
+    assert index.search("oat")["barcodes"] == ["1", "2", "4"]
+    assert index.search("oat toothbrush")["total"] == 0
+
+
+def test_typos_within_one_edit_match_below_exact_matches():
+    index = index_of(
+        product("1", "Chocolate Bar", score=10),
+        product("2", "Bamboo Toothbrush", "Household"),
+        product("3", "Chocolate Spread", score=90),
+    )
+    for typo in ("chocolte", "chocloate", "chocolatte", "chocolaze"):
+        assert sorted(index.search(typo)["barcodes"]) == ["1", "3"], typo
+    assert index.search("bamboo tothbrush")["barcodes"] == ["2"]
+    # Two edits away, and short tokens, don't match
+    assert index.search("chcolte")["total"] == 0
+    assert index.search("bsr")["total"] == 0
+    assert within_one_edit("bar", "bra") and not within_one_edit("bar", "rab")
+
+    index.add(product("4", "Chocolte", score=0))
+    # The exact match ranks first despite the lowest score
+    assert index.search("chocolte")["barcodes"] == ["4", "3", "1"]
+
+
+def test_replaced_and_removed_products_drop_out():
+    index = index_of(product("1", "Sparkling Water"), product("2", "Still Water"))
+    index.add(product("1", "Oat Milk"))
+    index.remove("2")
+    assert index.search("water")["total"] == 0
+    assert index.search("milk")["barcodes"] == ["1"]
+    assert index.stats()["tombstones"] == 2
+
+
+def test_facets_count_with_every_other_filter_applied():
+    rng = random.Random(7)
+    products = [
+        product(str(barcode), " ".join(rng.sample(WORDS, 3)), rng.choice(CATEGORIES), rng.random() < 0.5,
+                rng.randrange(101), rng.randrange(50))
+        for barcode in range(500)
+    ]
+    index = index_of(*products)
+
+    def matching(query, category=None, recyclable=None, min_score=None):
+        return [
+            item for item in products
+            if all(token in tokenize(item["name"] + " " + item["category"]) for token in tokenize(query))
+            and (category is None or item["category"] == category)
+            and (recyclable is None or item["recyclable"] == recyclable)
+            and (min_score is None or item["sustainabilityScore"] >= min_score)
+        ]
+
+    for query, category, recyclable, min_score in [
+        ("", None, None, None), ("bar", None, None, None), ("water", "Snacks", None, 40),
+        ("organic milk", None, True, None), ("", "Household", False, 60),
+    ]:
+        result = index.search(query, category, recyclable, (min_score, None), limit=500)
+        hits = matching(query, category, recyclable, min_score)
+        assert result["total"] == len(hits)
+        assert sorted(result["barcodes"]) == sorted(item["barcode"] for item in hits)
+        by_category = {}
+        for item in matching(query, None, recyclable, min_score):
+            by_category[item["category"]] = by_category.get(item["category"], 0) + 1
+        assert result["facets"]["category"] == by_category
+        by_recyclable = [item["recyclable"] for item in matching(query, category, None, min_score)]
+        assert result["facets"]["recyclable"] == {
+            "true": by_recyclable.count(True), "false": by_recyclable.count(False),
+        }
+
+
+def test_pages_cover_every_match_once():
+    index = index_of(*(product(str(barcode), "Oat Bar", score=barcode % 5) for barcode in range(45)))
+    pages = [index.search("oat", limit=10, offset=offset)["barcodes"] for offset in range(0, 50, 10)]
+    flat = [barcode for page in pages for barcode in page]
+    assert sorted(flat, key=int) == [str(barcode) for barcode in range(45)]
+    assert flat == index.search("oat", limit=45)["barcodes"]
+
+
+def test_search_route_returns_products_and_facets():
+    async def run():
+        await server.storage.reset()
+        await server.init_db()
+        await server.load_search_index()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            products = (await http.get("/api/products")).json()
+            name = products[0]["name"]
+            found = (await http.get("/api/products/search", params={"q": name})).json()
+            bad = await http.get("/api/products/search", params={"limit": 0})
+        return products[0], found, bad
+
+    first, found, bad = asyncio.run(run())
+    assert first["barcode"] in [item["barcode"] for item in found["results"]]
+    assert found["total"] >= 1 and sum(found["facets"]["category"].values()) == found["total"]
+    assert bad.status_code == 400
@@ -0,0 +1,62 @@
+"""Pre-encoded reference-data responses: content coding and reloads."""
+import asyncio
+
+from starlette.requests import Request
+
+from snapshots import MAX_LOADS, ResponseSnapshot, accepts_gzip
+
+
+def request(accept_encoding):
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [
+        (b"accept-encoding", accept_encoding.encode()),
+    ]})
+
+
+def test_accepts_gzip_honours_q_values():
+    assert accepts_gzip("gzip")
+    assert accepts_gzip("br, gzip;q=0.5")
+    assert accepts_gzip("*")
+    assert not accepts_gzip("")
+    assert not accepts_gzip("identity")
+    assert not accepts_gzip("gzip;q=0")
+    assert not accepts_gzip("gzip; q=0.0, br")
+    assert not accepts_gzip("*;q=1, gzip;q=0")
+
+
+def test_gzip_is_skipped_when_refused():
+    async def run():
+        async def load():
+            return [{"id": "r1"}], {}
+
+        snapshot = ResponseSnapshot(load, ttl=60)
+        gzipped = await snapshot.respond(request("gzip, deflate"))
+        refused = await snapshot.respond(request("gzip;q=0, identity"))
+        return gzipped, refused
+
+    gzipped, refused = asyncio.run(run())
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in refused.headers
+    assert refused.body == b'[{"id":"r1"}]'
+
+
+def test_reloads_are_capped_under_constant_invalidation():
+    async def run():
+        loads = []
+
+        async def load():
+            loads.append(len(loads))
+            # A write lands during every load
+            snapshot.invalidate()
+            return [{"load": len(loads)}], {}
+
+        snapshot = ResponseSnapshot(load, ttl=60)
+        first = await snapshot.respond(request(""))
+        loads_after_first = len(loads)
+        # Served, but stale, so the next request loads again
+        await snapshot.respond(request(""))
+        return first, loads_after_first, len(loads)
+
+    first, loads_after_first, loads = asyncio.run(run())
+    assert loads_after_first == MAX_LOADS
+    assert first.body == b'[{"load":%d}]' % MAX_LOADS
+    assert loads == 2 * MAX_LOADS
@@ -0,0 +1,99 @@
+"""Rollup-backed /stats must agree with a recount of the user's scans."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+import server
+from rollups import backfill
+
+# Barcode -> (sustainabilityScore, carbonFootprint) of seeded products
+PRODUCTS = {"1001": (45, 65), "1002": (80, 20), "1004": (92, 15)}
+
+
+def recount(scans, days):
+    """What /stats should say, straight from the raw scans."""
+    today = datetime.now(timezone.utc).date()
+    start = today - timedelta(days=days - 1)
+    by_day = {}
+    for scan in scans:
+        day = datetime.fromisoformat(scan["scannedAt"]).astimezone(timezone.utc).date()
+        if start <= day <= today:
+            by_day.setdefault(day.isoformat(), []).append(scan)
+    total = [scan for day_scans in by_day.values() for scan in day_scans]
+
+    def average(day_scans):
+        return round(sum(scan["score"] for scan in day_scans) / len(day_scans), 2) if day_scans else None
+
+    return {
+        "scans": len(total),
+        "averageScore": average(total),
+        "carbonFootprint": sum(PRODUCTS[scan["productBarcode"]][1] for scan in total),
+        "days": {day: (len(day_scans), average(day_scans)) for day, day_scans in by_day.items()},
+    }
+
+
+def check(stats, expected):
+    assert stats["scans"] == expected["scans"]
+    assert stats["averageScore"] == expected["averageScore"]
+    assert stats["carbonFootprint"] == expected["carbonFootprint"]
+    days = {day["day"]: (day["scans"], day["averageScore"]) for day in stats["days"] if day["scans"]}
+    assert days == expected["days"]
+
+
+async def with_user(run):
+    await server.storage.reset()
+    await server.init_db()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+        response = await http.post("/api/auth/register", json={
+            "name": "Counter", "email": "counter@terraquest.com", "password": "CounterPass123!",
+        })
+        body = response.json()
+        return await run(http, body["user"]["id"], {"Authorization": f"Bearer {body['token']}"})
+
+
+async def stats_and_scans(http, user_id, headers, ranges):
+    stats = {}
+    for range_ in ranges:
+        response = await http.get(f"/api/users/{user_id}/stats", params={"range": range_}, headers=headers)
+        assert response.status_code == 200
+        stats[range_] = response.json()
+    scans = (await http.get(f"/api/scans/user/{user_id}", params={"limit": 1000}, headers=headers)).json()
+    return stats, scans
+
+
+def test_stats_from_live_scans_match_a_recount():
+    async def run(http, user_id, headers):
+        barcodes = list(PRODUCTS) * 4
+        await http.post("/api/scans/batch", json={"scans": [{"productBarcode": b} for b in barcodes]},
+                        headers=headers)
+        for barcode in barcodes[:3]:
+            await http.post("/api/scans", json={"productBarcode": barcode}, headers=headers)
+        return await stats_and_scans(http, user_id, headers, ["7d"])
+
+    stats, scans = asyncio.run(with_user(run))
+    assert len(scans) == 15
+    check(stats["7d"], recount(scans, 7))
+
+
+def test_backfilled_stats_match_a_recount():
+    async def run(http, user_id, headers):
+        now = datetime.now(timezone.utc)
+        # Written before rollups existed: raw scans only, some without a
+        # carbonFootprint, spread over the past year
+        await server.storage.scans.insert_many([{
+            "id": f"old-{index}", "userId": user_id, "productBarcode": barcode, "productName": "",
+            "score": PRODUCTS[barcode][0], "scannedAt": (now - timedelta(days=offset, hours=index)).isoformat(),
+            **({"carbonFootprint": PRODUCTS[barcode][1]} if index % 2 else {}),
+        } for index, (barcode, offset) in enumerate(
+            (barcode, offset) for offset in (0, 1, 6, 7, 29, 45, 89, 200, 364, 400) for barcode in PRODUCTS
+        )])
+        await backfill(server.storage, batch_size=4)
+        # Rerunning replaces rather than adds
+        await backfill(server.storage, batch_size=7)
+        return await stats_and_scans(http, user_id, headers, ["7d", "30d", "90d", "365d"])
+
+    stats, scans = asyncio.run(with_user(run))
+    for range_, days in server.RANGES.items():
+        check(stats[range_], recount(scans, days))